@@ -4,7 +4,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
-from app.routes import user, device, device_data
+from app.routes import user, device, device_data, metrics, stream
 from app.lifespan import lifespan
 
 # Create the FastAPI app instance
@@ -34,6 +34,8 @@ api = APIRouter(prefix="/api")
 api.include_router(user.router, prefix="/users", tags=["users"])
 api.include_router(device.router, prefix="/devices", tags=["devices"])
 api.include_router(device_data.router, prefix="/device-data", tags=["device-data"])
+api.include_router(stream.router, prefix="/device-data", tags=["device-data"])
+api.include_router(metrics.router, tags=["metrics"])
 app.include_router(api)
 
 
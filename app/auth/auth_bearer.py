@@ -4,8 +4,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 
 from app.models.user import TokenData, UserInDB
-from app.auth.auth_handler import SECRET_KEY, ALGORITHM
-from app.services.user_service import UserService
+from app.auth.auth_handler import SECRET_KEY, ALGORITHM, user_token_cache
+from app.services.user_cache import user_cache
 from app.db.session import get_db_session
 
 
@@ -14,13 +14,21 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db_session)) -> UserInDB:
-    """Validates the JWT token and retrieves the current user from the database."""
+    """
+    Validates the JWT token and retrieves the current user.
+
+    Decoded claims are cached until the token expires and users for a short TTL
+    (see UserCache), so repeated requests skip both the signature check and the database.
+    """
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                           detail="Could not validate credentials",
                                           headers={"WWW-Authenticate": "Bearer"})
     try:
         # Decode the JWT token using the secret key and algorithm
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = user_token_cache.get(token)
+        if payload is None:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            user_token_cache.put(token, payload)
         username = payload.get("sub")
 
         # If no subject (username) in token, raise unauthorized
@@ -32,17 +40,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
         # Token is invalid or tampered with
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
-    try:
-        # Retrieve the user from the database
-        user = await UserService.get_user_internal(db, username)
-    except HTTPException as e:
-        # Convert 404 user not found to 401
-        if e.status_code == 404:
-            raise HTTPException(status_code=401, detail="User no longer exists")
-        raise
-
-    # Convert ORM model to Pydantic schema
-    return UserInDB.model_validate(user, from_attributes=True)
+    # Retrieve the user from the cache or the database
+    user = await user_cache.get(db, username)
+    if user is None:
+        raise HTTPException(status_code=401, detail="User no longer exists")
+    return user
 
 
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
@@ -6,12 +6,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db_session
 from app.auth.auth_device_handler import SECRET_KEY, ALGORITHM
-from app.services.device_service import DeviceService
-from app.models.device import DeviceRead
+from app.services.device_registry import device_registry
+from app.models.device import DeviceInfo
 
 
 async def get_current_device(request: Request,
-                             db: AsyncSession = Depends(get_db_session)) -> DeviceRead:
+                             db: AsyncSession = Depends(get_db_session)) -> DeviceInfo:
     """Validates the JWT token and returns the current device."""
 
     credentials_exception = HTTPException(
@@ -50,10 +50,9 @@ async def get_current_device(request: Request,
     except JWTError:
         raise credentials_exception
 
-    # Fetch device from DB
-    device = await DeviceService.get_device(db, device_id)
+    # Fetch device metadata from the registry (database only on a cache miss)
+    device = await device_registry.get(db, device_id)
     if device is None or not device.is_active:
         raise credentials_exception
 
-    # Return validated Pydantic model
-    return DeviceRead.model_validate(device, from_attributes=True)
+    return device
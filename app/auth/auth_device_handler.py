@@ -4,9 +4,13 @@ from datetime import datetime, timedelta
 
 from fastapi import HTTPException, status
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+import hashlib
+import hmac
 import secrets
 
+from app import metrics
+from app.auth.hashing import hash_secret, verify_secret
+from app.auth.token_cache import TokenCache
 from app.utils import now_utc
 
 
@@ -17,10 +21,19 @@ load_dotenv()
 SECRET_KEY = os.getenv("API_SECRET_KEY")
 ALGORITHM = os.getenv("API_ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("API_ACCESS_TOKEN_EXPIRE_MINUTES", 15))
+DEVICE_TOKEN_CACHE_SIZE = int(os.getenv("DEVICE_TOKEN_CACHE_SIZE", 10000))
 
+# Device keys are random 256-bit values, so a keyed hash is as safe as bcrypt for them
+# and orders of magnitude cheaper. "hmac-sha256" (default) or "bcrypt".
+DEVICE_KEY_SCHEME = os.getenv("DEVICE_KEY_SCHEME", "hmac-sha256")
+# Dedicated secret of the HMAC, so that rotating API_SECRET_KEY does not invalidate device keys
+DEVICE_KEY_PEPPER = os.getenv("DEVICE_KEY_PEPPER")
+HMAC_PREFIX = "hmac-sha256$"
 
-# Password hashing configuration using bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Verified device token claims, reused until the token expires
+device_token_cache = TokenCache(max_size=DEVICE_TOKEN_CACHE_SIZE)
+metrics.register("device_token_cache", device_token_cache.stats)
 
 
 def generate_device_key():
@@ -28,14 +41,40 @@ def generate_device_key():
     return secrets.token_urlsafe(32)
 
 
-def verify_device_key(plain_key: str, hashed_key: str) -> bool:
-    """Compares plain key to hashed key."""
-    return pwd_context.verify(plain_key, hashed_key)
+def check_device_key_pepper() -> None:
+    """Called at startup: the HMAC scheme cannot hash or verify device keys without a pepper."""
+    if DEVICE_KEY_SCHEME == "hmac-sha256" and not DEVICE_KEY_PEPPER:
+        raise RuntimeError(
+            "DEVICE_KEY_PEPPER must be set to a dedicated secret to hash device keys. Device keys "
+            "registered while it fell back to API_SECRET_KEY stay valid only if it is set to that value."
+        )
+
+
+def _hmac_device_key(key: str) -> str:
+    """Keyed SHA-256 hash of a device key using the server-side pepper."""
+    if not DEVICE_KEY_PEPPER:
+        raise RuntimeError("DEVICE_KEY_PEPPER must be set to hash device keys.")
+    digest = hmac.new(DEVICE_KEY_PEPPER.encode(), key.encode(), hashlib.sha256).hexdigest()
+    return f"{HMAC_PREFIX}{digest}"
+
 
+async def verify_device_key(plain_key: str, hashed_key: str) -> bool:
+    """Compares plain key to hashed key. Accepts both HMAC and legacy bcrypt hashes."""
+    if hashed_key.startswith(HMAC_PREFIX):
+        return hmac.compare_digest(_hmac_device_key(plain_key), hashed_key)
+    return await verify_secret(plain_key, hashed_key)
 
-def hash_device_key(key: str) -> str:
-    """Hashes a device key."""
-    return pwd_context.hash(key)
+
+async def hash_device_key(key: str) -> str:
+    """Hashes a device key with the configured scheme."""
+    if DEVICE_KEY_SCHEME == "hmac-sha256":
+        return _hmac_device_key(key)
+    return await hash_secret(key)
+
+
+def device_key_needs_rehash(hashed_key: str) -> bool:
+    """True if a stored hash was made with a different scheme than the configured one."""
+    return hashed_key.startswith(HMAC_PREFIX) != (DEVICE_KEY_SCHEME == "hmac-sha256")
 
 
 async def authenticate_device(db, device_id: int, device_key: str):
@@ -48,7 +87,7 @@ async def authenticate_device(db, device_id: int, device_key: str):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Device not found")
 
-    if not verify_device_key(device_key, device.hashed_device_key):
+    if not await verify_device_key(device_key, device.hashed_device_key):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid device key")
@@ -56,6 +95,10 @@ async def authenticate_device(db, device_id: int, device_key: str):
     if not device.is_active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Device is inactive")
 
+    # Transparently migrate the stored hash to the configured scheme after a successful login
+    if device_key_needs_rehash(device.hashed_device_key):
+        await DeviceService.update_device_key_hash(db, device.id, await hash_device_key(device_key))
+
     return device
 
 
@@ -74,4 +117,25 @@ def verify_device_token(token: str) -> dict | None:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
     except JWTError:
-        return None
\ No newline at end of file
+        return None
+
+
+def verify_device_token_for_device(token: str, device_id: int) -> dict | None:
+    """
+    Verifies a device JWT and checks that it was issued to the given device.
+    Decoded claims are cached until the token expires, so repeated messages
+    with the same token skip the signature check.
+    """
+    if not isinstance(token, str) or not token:
+        return None
+
+    payload = device_token_cache.get(token)
+    if payload is None:
+        payload = verify_device_token(token)
+        if payload is None:
+            return None
+        device_token_cache.put(token, payload)
+
+    if payload.get("sub") != str(device_id):
+        return None
+    return payload
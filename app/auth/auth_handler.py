@@ -4,8 +4,10 @@ from datetime import datetime, timedelta
 
 from fastapi import HTTPException
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 
+from app import metrics
+from app.auth.hashing import hash_secret, verify_secret
+from app.auth.token_cache import TokenCache
 from app.services.user_service import UserService
 from app.utils import now_utc
 
@@ -16,20 +18,22 @@ load_dotenv()
 SECRET_KEY = os.getenv("API_SECRET_KEY")
 ALGORITHM = os.getenv("API_ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("API_ACCESS_TOKEN_EXPIRE_MINUTES", 15))
+USER_TOKEN_CACHE_SIZE = int(os.getenv("USER_TOKEN_CACHE_SIZE", 10000))
 
 
-# Password hashing configuration using bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Verified user token claims, reused until the token expires
+user_token_cache = TokenCache(max_size=USER_TOKEN_CACHE_SIZE)
+metrics.register("user_token_cache", user_token_cache.stats)
 
 
-# 1. Hash and Verify device key
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+# 1. Hash and Verify password (bcrypt runs in the dedicated hashing pool)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a plain password against a hashed password using bcrypt."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return await verify_secret(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
+async def get_password_hash(password: str) -> str:
     """Hashes a password using bcrypt."""
-    return pwd_context.hash(password)
+    return await hash_secret(password)
 
 
 # 2. Authenticate device
@@ -42,7 +46,7 @@ async def authenticate_user(db, username: str, password: str):
             return None # User not found
         raise  # re-raise any other unexpected exception
 
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return None # Password does not match
 
     return user
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app import metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Number of threads that may run bcrypt at the same time
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", 2))
+# Hash/verify calls allowed to wait for a thread before new ones are rejected with 503
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", 64))
+
+
+# Password hashing configuration using bcrypt
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt releases the GIL, so a small dedicated pool keeps it off the event loop
+# without letting a login surge take every CPU core away from ingestion.
+_executor = ThreadPoolExecutor(max_workers=HASH_POOL_SIZE, thread_name_prefix="bcrypt")
+_pending = 0
+_pending_lock = threading.Lock()
+_rejected = 0
+
+
+def _release(_: Future) -> None:
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+async def _run_in_pool(fn, *args):
+    """Run a blocking hashing function in the bcrypt pool, shedding load when it is saturated."""
+    global _pending, _rejected
+    if _pending >= HASH_MAX_PENDING:
+        _rejected += 1
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Too many authentication requests, please retry",
+                            headers={"Retry-After": "1"})
+    with _pending_lock:
+        _pending += 1
+    # Released when the pool is done with the call, not when the caller stops waiting:
+    # a cancelled request leaves bcrypt running in its thread
+    future = _executor.submit(fn, *args)
+    future.add_done_callback(_release)
+    return await asyncio.wrap_future(future)
+
+
+async def hash_secret(secret: str) -> str:
+    """Hashes a password or device key with bcrypt without blocking the event loop."""
+    return await _run_in_pool(pwd_context.hash, secret)
+
+
+async def verify_secret(secret: str, hashed_secret: str) -> bool:
+    """Verifies a password or device key against a bcrypt hash without blocking the event loop."""
+    return await _run_in_pool(pwd_context.verify, secret, hashed_secret)
+
+
+def stats() -> dict:
+    return {
+        "pool_size": HASH_POOL_SIZE,
+        "pending": _pending,
+        "max_pending": HASH_MAX_PENDING,
+        "rejected": _rejected,
+    }
+
+
+metrics.register("hashing", stats)
@@ -0,0 +1,59 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified JWT claims.
+
+    Entries are keyed by a SHA-256 digest of the token, so raw tokens are not
+    kept in memory, and expire at the token's own `exp` claim. Tokens without
+    an `exp` claim are never cached.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: OrderedDict[bytes, dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        """Return the cached claims for a token, or None if absent or expired."""
+        key = self._key(token)
+        claims = self._entries.get(key)
+        if claims is None:
+            self.misses += 1
+            return None
+        if claims["exp"] <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return claims
+
+    def put(self, token: str, claims: dict) -> None:
+        """Cache the verified claims of a token until it expires."""
+        if not isinstance(claims.get("exp"), (int, float)):
+            return
+        key = self._key(token)
+        self._entries[key] = claims
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Integer, cast, extract, func
+
+
+def bucket_epoch(dialect_name: str, column, bucket_seconds: int):
+    """SQL expression for the start of the column's time bucket, in seconds since the epoch."""
+    if dialect_name == "postgresql":
+        return func.floor(extract("epoch", column) / bucket_seconds) * bucket_seconds
+    # SQLite stores timestamps as UTC text; integer division floors them to the bucket
+    return cast(func.strftime("%s", column), Integer) // bucket_seconds * bucket_seconds
+
+
+def epoch_to_timestamp(dialect_name: str, epoch):
+    """SQL expression converting seconds since the epoch back into a timestamp column value."""
+    if dialect_name == "postgresql":
+        return func.to_timestamp(epoch)
+    # Same text layout SQLAlchemy writes for DateTime columns, so equal times compare equal
+    return func.datetime(epoch, "unixepoch").concat(".000000")
+
+
+def floor_time(dt: datetime, bucket_seconds: int) -> datetime:
+    """Start of the bucket containing dt. Naive values are taken as UTC."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return datetime.fromtimestamp(dt.timestamp() // bucket_seconds * bucket_seconds, timezone.utc)
+
+
+def ceil_time(dt: datetime, bucket_seconds: int) -> datetime:
+    """End of the bucket containing dt (dt itself if it is on a boundary). Naive values are taken as UTC."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    start = floor_time(dt, bucket_seconds)
+    return start if start == dt else start + timedelta(seconds=bucket_seconds)
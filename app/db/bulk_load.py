@@ -0,0 +1,54 @@
+"""
+Bulk-load historical telemetry from a CSV or NDJSON file into devicedata.
+
+Every line holds device_id, reading_type, value and timestamp (CSV files start
+with a header row naming these columns). Readings are written in chunks with
+COPY on PostgreSQL and the rollups are updated as they are loaded; see
+BulkImportService. Same as POST /devices/data/import, without the HTTP hop.
+
+A running server does not see these writes in its in-memory /data/last cache
+until the loaded devices expire after LATEST_CACHE_TTL_SECONDS (or it restarts).
+
+Usage:
+    DATABASE_URL=postgresql+asyncpg://user:pw@localhost/iot \\
+        python -m app.db.bulk_load readings.csv --user-id 42
+    gunzip -c backfill.ndjson.gz | python -m app.db.bulk_load - --format ndjson
+"""
+import argparse
+import asyncio
+import sys
+from typing import AsyncIterator, Optional, TextIO
+
+from app.db.session import create_db_and_tables, engine
+from app.services.bulk_import import BulkImportService
+
+
+async def _lines(file: TextIO) -> AsyncIterator[str]:
+    for line in file:
+        yield line
+
+
+async def main(path: str, format: str, user_id: Optional[int]) -> None:
+    await create_db_and_tables()
+    file = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+    try:
+        report = await BulkImportService.load(_lines(file), format, user_id)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+        await engine.dispose()
+
+    for error in report.errors:
+        print(f"line {error.index}: {'; '.join(e['msg'] for e in error.errors)}", file=sys.stderr)
+    print(f"ℹ️ Imported {report.accepted} readings, rejected {report.rejected}, in {report.duration_seconds}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV or NDJSON file, or - for standard input")
+    parser.add_argument("--format", choices=["csv", "ndjson"],
+                        help="Input format (default: from the file extension, ndjson for standard input)")
+    parser.add_argument("--user-id", type=int, help="Only accept readings of this user's devices")
+    args = parser.parse_args()
+    input_format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    asyncio.run(main(args.path, input_format, args.user_id))
@@ -0,0 +1,83 @@
+"""
+Schema migrations that rewrite large tables and therefore do not run at startup.
+
+The server refuses to start until a pending migration has been applied. Stop
+all workers, run the migration, then start them again.
+
+    reading-types   Convert devicedata.reading_type (one name string per row)
+                    into reading_type_id, a key of the readingtype lookup table.
+                    Rows are converted in ID-range batches, one transaction
+                    each, so an interrupted run resumes where it stopped.
+
+Usage:
+    DATABASE_URL=postgresql+asyncpg://user:pw@localhost/iot \\
+        python -m app.db.migrate reading-types --batch-size 50000
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import inspect, text
+from sqlmodel import SQLModel
+
+from app.db.session import engine
+
+
+def _columns(conn) -> set[str]:
+    return {column["name"] for column in inspect(conn).get_columns("devicedata")}
+
+
+async def migrate_reading_types(batch_size: int) -> None:
+    async with engine.begin() as conn:
+        if "reading_type" not in await conn.run_sync(_columns):
+            print("ℹ️ devicedata already stores reading_type_id, nothing to migrate")
+            return
+        postgres = conn.dialect.name == "postgresql"
+        # Creates readingtype; devicedata exists and is left alone
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.execute(text("INSERT INTO readingtype (name) SELECT DISTINCT reading_type FROM devicedata "
+                                "WHERE reading_type NOT IN (SELECT name FROM readingtype)"))
+        if "reading_type_id" not in await conn.run_sync(_columns):
+            # On PostgreSQL the foreign key is added NOT VALID at the end instead of checking every row here
+            reference = "" if postgres else " REFERENCES readingtype (id)"
+            await conn.execute(text(f"ALTER TABLE devicedata ADD COLUMN reading_type_id INTEGER{reference}"))
+        low, high = (await conn.execute(text("SELECT min(id), max(id) FROM devicedata"))).one()
+
+    converted = 0
+    if low is not None:
+        for batch_start in range(low, high + 1, batch_size):
+            async with engine.begin() as conn:
+                result = await conn.execute(text(
+                    "UPDATE devicedata SET reading_type_id = "
+                    "(SELECT id FROM readingtype WHERE readingtype.name = devicedata.reading_type) "
+                    "WHERE id >= :low AND id < :high AND reading_type_id IS NULL"
+                ), {"low": batch_start, "high": batch_start + batch_size})
+            converted += result.rowcount
+            print(f"ℹ️ Converted {converted} rows (up to ID {min(batch_start + batch_size, high + 1) - 1} of {high})")
+
+    async with engine.begin() as conn:
+        if postgres:
+            exists = (await conn.execute(text(
+                "SELECT 1 FROM pg_constraint WHERE conname = 'devicedata_reading_type_id_fkey'"))).scalar()
+            if exists is None:
+                await conn.execute(text("ALTER TABLE devicedata ADD CONSTRAINT devicedata_reading_type_id_fkey "
+                                        "FOREIGN KEY (reading_type_id) REFERENCES readingtype (id) NOT VALID"))
+            await conn.execute(text("ALTER TABLE devicedata VALIDATE CONSTRAINT devicedata_reading_type_id_fkey"))
+            await conn.execute(text("ALTER TABLE devicedata ALTER COLUMN reading_type_id SET NOT NULL"))
+        await conn.execute(text("ALTER TABLE devicedata DROP COLUMN reading_type"))
+    print(f"ℹ️ Migrated devicedata to reading_type_id ({converted} rows converted)")
+
+
+async def main(migration: str, batch_size: int) -> None:
+    try:
+        if migration == "reading-types":
+            await migrate_reading_types(batch_size)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("migration", choices=["reading-types"])
+    parser.add_argument("--batch-size", type=int, default=50000, help="Rows converted per transaction")
+    args = parser.parse_args()
+    asyncio.run(main(args.migration, args.batch_size))
@@ -0,0 +1,173 @@
+import asyncio
+import os
+from datetime import date, datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import MetaData, PrimaryKeyConstraint, Table, text
+from sqlalchemy.engine import Connection, Dialect
+from sqlmodel import SQLModel
+
+load_dotenv()
+
+# "monthly" or "daily" range partitioning of devicedata on PostgreSQL; empty disables it
+DEVICE_DATA_PARTITIONING = os.getenv("DEVICE_DATA_PARTITIONING", "").lower()
+# Number of future partitions kept ready ahead of the current one
+DEVICE_DATA_PARTITIONS_AHEAD = int(os.getenv("DEVICE_DATA_PARTITIONS_AHEAD", 2))
+# How often the background task checks that upcoming partitions exist
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", 3600))
+
+PARTITIONED_TABLE = "devicedata"
+
+
+def partitioning_enabled(dialect: Dialect) -> bool:
+    """True if devicedata should be range-partitioned on a database of this dialect."""
+    return DEVICE_DATA_PARTITIONING in ("monthly", "daily") and dialect.name == "postgresql"
+
+
+def _partitioned_device_data_table() -> Table:
+    """
+    Copy of the devicedata table definition declared as PARTITION BY RANGE (timestamp).
+
+    PostgreSQL requires the partition key in the primary key, so the copy uses
+    (id, timestamp) as primary key. The model itself is left untouched so other
+    databases keep the plain integer key.
+    """
+    metadata = MetaData()
+    for table in SQLModel.metadata.sorted_tables:
+        table.to_metadata(metadata)
+    table = metadata.tables[PARTITIONED_TABLE]
+    table.c.timestamp.primary_key = True
+    table.append_constraint(PrimaryKeyConstraint(table.c.id, table.c.timestamp))
+    table.c.id.autoincrement = True
+    table.dialect_kwargs["postgresql_partition_by"] = 'RANGE ("timestamp")'
+    return table
+
+
+def _check_existing_table(conn: Connection) -> None:
+    """Refuse to start on a devicedata table that was created without partitioning."""
+    regclass = conn.execute(text("SELECT to_regclass(:name)"), {"name": PARTITIONED_TABLE}).scalar()
+    if regclass is None:
+        return
+    partitioned = conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = CAST(:name AS regclass)"
+    ), {"name": PARTITIONED_TABLE}).scalar()
+    if partitioned is None:
+        raise RuntimeError(
+            f"DEVICE_DATA_PARTITIONING is set, but table {PARTITIONED_TABLE} already exists without "
+            f"partitioning. Migrate it first: rename it (ALTER TABLE {PARTITIONED_TABLE} RENAME TO "
+            f"{PARTITIONED_TABLE}_old), start the server once to create the partitioned table, then copy "
+            f"the rows over (INSERT INTO {PARTITIONED_TABLE} SELECT * FROM {PARTITIONED_TABLE}_old) and "
+            f"reset the id sequence. Or unset DEVICE_DATA_PARTITIONING."
+        )
+
+
+def create_partitioned_tables(conn: Connection) -> None:
+    """
+    Create devicedata as a partitioned table, plus its default partition.
+    Must run before SQLModel.metadata.create_all, which then skips the existing table.
+    Raises RuntimeError if devicedata already exists as a plain table.
+    """
+    _check_existing_table(conn)
+    others = [t for t in SQLModel.metadata.sorted_tables if t.name != PARTITIONED_TABLE]
+    SQLModel.metadata.create_all(conn, tables=others)
+    _partitioned_device_data_table().create(conn, checkfirst=True)
+    # Catches rows outside every explicit partition (very late or far-future timestamps)
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {PARTITIONED_TABLE}_default "
+                      f"PARTITION OF {PARTITIONED_TABLE} DEFAULT"))
+
+
+def _partition_bounds(day: date) -> tuple[datetime, datetime, str]:
+    """Start, end and table name of the partition containing the given day."""
+    if DEVICE_DATA_PARTITIONING == "daily":
+        start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        return start, start + timedelta(days=1), f"{PARTITIONED_TABLE}_p{start:%Y_%m_%d}"
+    start = datetime(day.year, day.month, 1, tzinfo=timezone.utc)
+    end = datetime(day.year + (day.month == 12), day.month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start, end, f"{PARTITIONED_TABLE}_p{start:%Y_%m}"
+
+
+def _create_partition(conn: Connection, name: str, start: datetime, end: datetime) -> None:
+    """
+    Create one partition. PostgreSQL refuses while the default partition holds rows of its
+    range (e.g. future-dated readings), so those are moved into the new partition: the
+    default partition is detached, emptied of the range and attached again.
+    """
+    default = f"{PARTITIONED_TABLE}_default"
+    create = text(f"CREATE TABLE {name} PARTITION OF {PARTITIONED_TABLE} "
+                  f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+    in_range = f"\"timestamp\" >= '{start.isoformat()}' AND \"timestamp\" < '{end.isoformat()}'"
+    stray = conn.execute(text(f"SELECT 1 FROM {default} WHERE {in_range} LIMIT 1")).scalar()
+    if stray is None:
+        conn.execute(create)
+        return
+    conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {default}"))
+    conn.execute(create)
+    moved = conn.execute(text(f"INSERT INTO {name} SELECT * FROM {default} WHERE {in_range}")).rowcount
+    conn.execute(text(f"DELETE FROM {default} WHERE {in_range}"))
+    conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} ATTACH PARTITION {default} DEFAULT"))
+    print(f"ℹ️ Moved {moved} rows from {default} into the new partition {name}")
+
+
+def ensure_partitions(conn: Connection, today: date | None = None) -> list[str]:
+    """Create the partition for today and the next DEVICE_DATA_PARTITIONS_AHEAD ones if missing."""
+    day = today or datetime.now(timezone.utc).date()
+    created = []
+    for _ in range(DEVICE_DATA_PARTITIONS_AHEAD + 1):
+        start, end, name = _partition_bounds(day)
+        exists = conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+        if exists is None:
+            _create_partition(conn, name, start, end)
+            created.append(name)
+        day = end.date()
+    return created
+
+
+async def run_partition_maintenance(engine) -> None:
+    """Background task that keeps upcoming devicedata partitions created."""
+    while True:
+        try:
+            async with engine.begin() as conn:
+                created = await conn.run_sync(ensure_partitions)
+            if created:
+                print(f"ℹ️ Created devicedata partitions: {', '.join(created)}")
+        except Exception as e:
+            print(f"[ERROR] devicedata partition maintenance failed: {e}")
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL_SECONDS)
+
+
+def _partition_end_from_name(name: str) -> datetime | None:
+    """Upper bound of a partition created by ensure_partitions, parsed from its name."""
+    prefix = f"{PARTITIONED_TABLE}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        parts = [int(part) for part in name[len(prefix):].split("_")]
+    except ValueError:
+        return None
+    if len(parts) == 3:
+        return datetime(*parts, tzinfo=timezone.utc) + timedelta(days=1)
+    if len(parts) == 2:
+        year, month = parts
+        return datetime(year + (month == 12), month % 12 + 1, 1, tzinfo=timezone.utc)
+    return None
+
+
+def expired_partitions(conn: Connection, cutoff: datetime) -> list[tuple[str, int]]:
+    """Partitions whose whole range lies before cutoff, with their estimated row counts."""
+    rows = conn.execute(text(
+        "SELECT c.relname, c.reltuples FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": PARTITIONED_TABLE}).all()
+    expired = []
+    for name, reltuples in rows:
+        end = _partition_end_from_name(name)
+        if end is not None and end <= cutoff:
+            # reltuples is -1 for tables that were never analyzed
+            expired.append((name, max(int(reltuples), 0)))
+    return sorted(expired)
+
+
+def drop_partition(conn: Connection, name: str) -> None:
+    """Detach and drop one partition. Much cheaper than deleting its rows."""
+    conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
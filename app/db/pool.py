@@ -0,0 +1,67 @@
+"""
+Connection pool of the async engine, with checkout metrics.
+
+SQLAlchemy's pool does not report how long requests wait for a connection or
+how often they give up. InstrumentedPool times every checkout, counts pool
+timeouts and exposes the current checked-out and overflow counts.
+"""
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app import metrics
+
+# Checkout waits are short unless the pool is exhausted, so the buckets start below a millisecond
+WAIT_MS_BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000, 30000)
+
+
+class PoolMetrics:
+    """Checkout counters of one engine's pool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_ms = metrics.Histogram(WAIT_MS_BUCKETS)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that records checkout waits and timeouts in `pool_metrics`.
+    Pass `InstrumentedPool.with_metrics()` as an engine's poolclass.
+    """
+
+    pool_metrics = PoolMetrics()
+
+    @classmethod
+    def with_metrics(cls) -> type["InstrumentedPool"]:
+        """
+        A subclass with its own counters. The counters live on the class so that they
+        survive engine.dispose(), which replaces the pool with a new instance.
+        """
+        return type(cls.__name__, (cls,), {"pool_metrics": PoolMetrics()})
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.pool_metrics.timeouts += 1
+            raise
+        finally:
+            self.pool_metrics.wait_ms.observe((time.perf_counter() - started) * 1000)
+        self.pool_metrics.checkouts += 1
+        return connection
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "timeout_seconds": self._timeout,
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": self.pool_metrics.checkouts,
+            "timeouts": self.pool_metrics.timeouts,
+            "wait_ms": self.pool_metrics.wait_ms.snapshot(),
+        }
@@ -0,0 +1,73 @@
+"""
+Rebuild the devicedata rollups from raw and archived readings.
+
+Rollups are maintained on ingestion only, so readings stored before rollups were
+enabled (or while ROLLUPS_ENABLED=0, or written directly to the table) are
+missing from them. Until they are rebuilt, /data/aggregate scans raw data for
+ranges the rollups do not cover. Run this once after enabling rollups on an
+existing database. One UTC day is rebuilt and committed at a time.
+
+Usage:
+    DATABASE_URL=postgresql+asyncpg://user:pw@localhost/iot \\
+        python -m app.db.rebuild_rollups --start 2024-01-01 --end 2025-01-01
+    python -m app.db.rebuild_rollups --device-id 42
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from app.db.buckets import floor_time
+from app.db.session import create_db_and_tables, db_session_context, engine
+from app.models.device_data import DeviceData, DeviceDataArchive
+from app.services.rollup_service import RollupService, ROLLUP_RESOLUTIONS
+from app.utils import as_utc
+
+DAY_SECONDS = ROLLUP_RESOLUTIONS[-1]
+
+
+async def _stored_range(device_id: Optional[int]) -> tuple[Optional[datetime], Optional[datetime]]:
+    """Oldest and newest reading timestamps, raw or archived."""
+    raw = select(func.min(DeviceData.timestamp), func.max(DeviceData.timestamp))
+    archived = select(func.min(DeviceDataArchive.start), func.max(DeviceDataArchive.end))
+    if device_id is not None:
+        raw = raw.where(DeviceData.device_id == device_id)
+        archived = archived.where(DeviceDataArchive.device_id == device_id)
+    async with db_session_context() as db:
+        bounds = [*(await db.execute(raw)).one(), *(await db.execute(archived)).one()]
+    starts = [as_utc(bound) for bound in bounds[0::2] if bound is not None]
+    ends = [as_utc(bound) for bound in bounds[1::2] if bound is not None]
+    return (min(starts), max(ends)) if starts else (None, None)
+
+
+async def main(start: Optional[datetime], end: Optional[datetime], device_id: Optional[int]) -> None:
+    await create_db_and_tables()
+    try:
+        oldest, newest = await _stored_range(device_id)
+        if oldest is None:
+            print("ℹ️ No readings to roll up")
+            return
+        day = floor_time(as_utc(start) if start else oldest, DAY_SECONDS)
+        end = as_utc(end) if end else newest + timedelta(seconds=1)
+        days = 0
+        while day < end:
+            async with db_session_context() as db:
+                await RollupService.rebuild(db, day, day + timedelta(seconds=DAY_SECONDS), device_id)
+            day += timedelta(seconds=DAY_SECONDS)
+            days += 1
+            if days % 30 == 0:
+                print(f"ℹ️ Rebuilt rollups up to {day:%Y-%m-%d}")
+        print(f"ℹ️ Rebuilt the rollups of {days} days")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", type=datetime.fromisoformat, help="First day (default: the oldest reading)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="End of the range (default: the newest reading)")
+    parser.add_argument("--device-id", type=int, help="Only rebuild this device's rollups")
+    args = parser.parse_args()
+    asyncio.run(main(args.start, args.end, args.device_id))
@@ -0,0 +1,104 @@
+"""
+Health and replication lag of the optional read replica (DATABASE_READ_URL).
+
+ReplicaMonitor polls the replica and decides whether read sessions may use it:
+only while it answers and lags the primary by at most the configured tolerance.
+Otherwise get_read_session falls back to the primary.
+"""
+import asyncio
+import time
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Seconds the replica is behind the primary: 0 once it has replayed all received WAL,
+# otherwise the age of the last replayed transaction
+PG_LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class ReplicaMonitor:
+    """
+    Measures the read replica's lag every `interval` seconds. The replica is usable while the
+    last check succeeded with a lag of at most `max_lag_seconds`, and no read on it has
+    failed since.
+    """
+
+    def __init__(self, engine: AsyncEngine, max_lag_seconds: float, interval: float):
+        self.engine = engine
+        self.max_lag = max_lag_seconds
+        self.interval = interval
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self._task: asyncio.Task | None = None
+
+        # Metrics
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+        self.failures = 0
+
+    @property
+    def usable(self) -> bool:
+        return self.healthy and self.lag_seconds is not None and self.lag_seconds <= self.max_lag
+
+    async def check(self) -> bool:
+        """Measure the lag now and return whether the replica is usable."""
+        was_usable = self.usable
+        try:
+            async with self.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    lag = float((await conn.execute(PG_LAG_QUERY)).scalar() or 0)
+                else:
+                    await conn.execute(text("SELECT 1"))
+                    lag = 0.0
+            self.healthy, self.lag_seconds = True, lag
+        except Exception as e:
+            if self.checked_at is None:
+                print(f"[ERROR] Read replica unreachable, reading from the primary: {e}")
+            self.mark_failed(e)
+        self.checked_at = time.time()
+        if self.usable != was_usable:
+            print(f"ℹ️ Read replica {'in use' if self.usable else 'bypassed'} (lag: {self.lag_seconds}s)")
+        return self.usable
+
+    def mark_failed(self, error: Exception) -> None:
+        """Stop routing reads to the replica until the next successful check."""
+        if self.healthy:
+            print(f"[ERROR] Read replica failed, reading from the primary: {error}")
+        self.healthy = False
+        self.failures += 1
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    async def start(self) -> None:
+        await self.check()
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "usable": self.usable,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": self.max_lag,
+            "checked_at": self.checked_at,
+            "replica_reads": self.replica_reads,
+            "primary_fallbacks": self.primary_fallbacks,
+            "failures": self.failures,
+        }
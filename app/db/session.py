@@ -3,15 +3,23 @@ from dotenv import load_dotenv
 
 from contextlib import asynccontextmanager
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy import text
+from sqlalchemy import inspect, make_url, text
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.exc import InterfaceError, OperationalError
 from typing import AsyncGenerator
 from sqlmodel import SQLModel
 
 
 # Import models so Alembic can detect them during autogeneration
 from app.models.user import User
-from app.models.device_data import DeviceData
+from app.models.device_data import DeviceData, ReadingType
 from app.models.device import Device
+from app.models.retention import RetentionPolicy
+
+from app import metrics
+from app.db.partitioning import PARTITIONED_TABLE, partitioning_enabled, create_partitioned_tables, ensure_partitions
+from app.db.pool import InstrumentedPool
+from app.db.replica import ReplicaMonitor
 
 # Load environment variables from a .env file into the process
 load_dotenv()
@@ -22,15 +30,112 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise Exception("DATABASE_URL environment variable is not set.")
 
+# Connection pool settings: persistent connections, extra connections under load,
+# seconds to wait for a free connection, liveness check on checkout, and maximum
+# connection age in seconds (-1 keeps connections forever)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+
+# Optional read replica for read-heavy routes; they use the primary while the replica
+# is unreachable or lags more than REPLICA_MAX_LAG_SECONDS behind it
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_CHECK_INTERVAL_SECONDS = float(os.getenv("REPLICA_CHECK_INTERVAL_SECONDS", 5))
+
+
+def pool_options(url: str) -> dict:
+    """Pool arguments for create_async_engine; in-memory SQLite keeps its single static connection."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": InstrumentedPool.with_metrics(),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
 # Create an async SQLAlchemy engine instance
 engine = create_async_engine(DATABASE_URL,
                              echo=False, # Set to True for verbose SQL output during development
-                             future = True
+                             future = True,
+                             **pool_options(DATABASE_URL)
                              )
+if isinstance(engine.pool, InstrumentedPool):
+    # Read engine.pool on every call: engine.dispose() replaces it
+    metrics.register("db_pool", lambda: engine.pool.stats())
+
+
+class QueryScopedSession(AsyncSession):
+    """
+    AsyncSession that returns its connection to the pool after every read.
+
+    A plain session keeps the connection of its first query checked out until it
+    is closed, which for a request dependency means while passwords are hashed and
+    the response is serialized. This session ends the transaction a SELECT started
+    right away (results are already buffered). Writes keep the usual unit of work:
+    once a statement runs in an open transaction or objects are pending, the
+    session commits only when told to.
+    """
+
+    def _idle(self) -> bool:
+        return not self.in_transaction() and not (self.new or self.dirty or self.deleted)
+
+    async def _release(self) -> None:
+        # Commit rather than roll back: with expire_on_commit=False loaded objects stay usable
+        if self.in_transaction():
+            await self.commit()
+
+    async def execute(self, statement, *args, **kwargs):
+        idle = self._idle()
+        result = await super().execute(statement, *args, **kwargs)
+        if idle and getattr(statement, "is_select", False):
+            await self._release()
+        return result
+
+    async def scalar(self, statement, *args, **kwargs):
+        idle = self._idle()
+        result = await super().scalar(statement, *args, **kwargs)
+        if idle and getattr(statement, "is_select", False):
+            await self._release()
+        return result
+
+    async def get(self, *args, **kwargs):
+        idle = self._idle()
+        result = await super().get(*args, **kwargs)
+        if idle:
+            await self._release()
+        return result
+
 
 # Create a session factory bound to the async engine
 # expire_on_commit=False means objects remain usable after committing
 async_session = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+# Sessions of request handlers hold a pooled connection only while a query runs
+request_session = async_sessionmaker(bind=engine, expire_on_commit=False, class_=QueryScopedSession)
+
+read_engine = None
+read_session = None
+replica_monitor = None
+if DATABASE_READ_URL:
+    read_engine = create_async_engine(DATABASE_READ_URL, echo=False, future=True, **pool_options(DATABASE_READ_URL))
+    read_session = async_sessionmaker(bind=read_engine, expire_on_commit=False, class_=QueryScopedSession,
+                                      info={"replica": True})
+    replica_monitor = ReplicaMonitor(read_engine, REPLICA_MAX_LAG_SECONDS, REPLICA_CHECK_INTERVAL_SECONDS)
+    metrics.register("read_replica", replica_monitor.stats)
+    if isinstance(read_engine.pool, InstrumentedPool):
+        metrics.register("db_read_pool", lambda: read_engine.pool.stats())
+
+
+def is_replica(db: AsyncSession) -> bool:
+    """Whether the session reads from the replica, whose data may lag behind the primary."""
+    return db.info.get("replica", False)
 
 
 async def create_db_and_tables():
@@ -39,7 +144,61 @@ async def create_db_and_tables():
     Use this during application startup or initial setup.
     """
     async with engine.begin() as conn:
+        if partitioning_enabled(conn.dialect):
+            await conn.run_sync(create_partitioned_tables)
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_check_reading_type_names)
+        await conn.execute(text(
+            # Duplicates from before ux_retentionpolicy_device_id_all_types existed would block its creation
+            "DELETE FROM retentionpolicy WHERE reading_type IS NULL AND id NOT IN "
+            "(SELECT max(id) FROM retentionpolicy WHERE reading_type IS NULL GROUP BY device_id)"
+        ))
+        if conn.dialect.name != "postgresql":
+            await conn.run_sync(_create_missing_indexes)
+        if partitioning_enabled(conn.dialect):
+            await conn.run_sync(ensure_partitions)
+    if engine.dialect.name == "postgresql":
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.run_sync(_create_missing_indexes)
+
+
+def _check_reading_type_names(conn) -> None:
+    """Refuse to start on a devicedata table created before the readingtype lookup table."""
+    if "reading_type" in {column["name"] for column in inspect(conn).get_columns("devicedata")}:
+        raise RuntimeError(
+            "devicedata still stores reading type names in its reading_type column. Stop all workers "
+            "and run `python -m app.db.migrate reading-types` to convert it to reading_type_id first."
+        )
+
+
+def _create_missing_indexes(conn) -> None:
+    """
+    Create model indexes that an existing table lacks, since create_all skips existing tables.
+
+    On PostgreSQL (on an AUTOCOMMIT connection) they are built with CREATE INDEX CONCURRENTLY,
+    so a large table keeps taking writes meanwhile, and the invalid leftover of an interrupted
+    build is dropped and rebuilt. Partitioned tables do not support CONCURRENTLY.
+    """
+    if conn.dialect.name != "postgresql":
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        return
+
+    for table in SQLModel.metadata.sorted_tables:
+        concurrently = "" if table.name == PARTITIONED_TABLE and partitioning_enabled(conn.dialect) else " CONCURRENTLY"
+        for index in table.indexes:
+            valid = conn.execute(text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+                                 {"name": index.name}).scalar()
+            if valid:
+                continue
+            if valid is not None:
+                conn.exec_driver_sql(f'DROP INDEX{concurrently} "{index.name}"')
+            print(f"ℹ️ Creating index {index.name} on {table.name}")
+            ddl = str(CreateIndex(index).compile(dialect=conn.dialect))
+            conn.exec_driver_sql(ddl.replace("INDEX", f"INDEX{concurrently}", 1))
 
 
 async def reset_db():
@@ -53,7 +212,11 @@ async def reset_db():
         await conn.execute(text("DROP SCHEMA public CASCADE"))
         await conn.execute(text("CREATE SCHEMA public"))
         # Now recreate all tables
+        if partitioning_enabled(conn.dialect):
+            await conn.run_sync(create_partitioned_tables)
         await conn.run_sync(SQLModel.metadata.create_all)
+        if partitioning_enabled(conn.dialect):
+            await conn.run_sync(ensure_partitions)
 
 
 async def _get_session() -> AsyncGenerator[AsyncSession, None]:
@@ -69,11 +232,45 @@ async def _get_session() -> AsyncGenerator[AsyncSession, None]:
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
     """
     FastAPI-compatible dependency for providing a database session.
-    Automatically manages session lifecycle per request.
-        """
-    async for session in _get_session():
+    Automatically manages session lifecycle per request; the session only holds
+    a connection while a query or write transaction runs (see QueryScopedSession).
+    """
+    async with request_session() as session:
         yield session
 
+def _read_session_factory() -> async_sessionmaker:
+    """The replica's session factory while it is usable, else the primary's."""
+    if replica_monitor is None:
+        return request_session
+    if replica_monitor.usable:
+        replica_monitor.replica_reads += 1
+        return read_session
+    replica_monitor.primary_fallbacks += 1
+    return request_session
+
+
+@asynccontextmanager
+async def read_session_context():
+    """
+    A session on the read replica when one is configured and within REPLICA_MAX_LAG_SECONDS,
+    otherwise on the primary. Results may be that much behind recent writes.
+    A connection error on the replica makes later reads use the primary until it recovers.
+    """
+    async with _read_session_factory()() as session:
+        try:
+            yield session
+        except (OperationalError, InterfaceError) as e:
+            if is_replica(session):
+                replica_monitor.mark_failed(e)
+            raise
+
+
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency for read-only routes, see read_session_context."""
+    async with read_session_context() as session:
+        yield session
+
+
 @asynccontextmanager
 async def db_session_context():
     """
@@ -1,7 +1,13 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.db.session import create_db_and_tables
+from app.auth.auth_device_handler import check_device_key_pepper
+from app.db.session import create_db_and_tables, engine, replica_monitor
+from app.db.partitioning import partitioning_enabled, run_partition_maintenance
 from app.mqtt.mqtt_service import initialize_all_mqtt_subscriptions, disconnect_all_mqtt_subscriptions
+from app.services.ingest_buffer import ingest_buffer
+from app.services.heartbeat import heartbeat_tracker
+from app.services.retention_service import retention_job
+from app.services.archive_service import archive_job
 import asyncio
 import os
 
@@ -13,11 +19,31 @@ async def lifespan(app: FastAPI):
     global mqtt_loop
     mqtt_loop = asyncio.get_running_loop()  # ✅ Set this once in main thread
 
+    check_device_key_pepper()
     await create_db_and_tables()
+    partition_task = None
+    if partitioning_enabled(engine.dialect):
+        partition_task = asyncio.create_task(run_partition_maintenance(engine))
+    await ingest_buffer.start()
+    await heartbeat_tracker.start()
+    await retention_job.start()
+    await archive_job.start()
+    if replica_monitor is not None:
+        await replica_monitor.start()
 
     if not DISABLE_MQTT:
         await initialize_all_mqtt_subscriptions(mqtt_loop)
     yield
     if not DISABLE_MQTT:
         await disconnect_all_mqtt_subscriptions()
+    await retention_job.stop()
+    await archive_job.stop()
+    if replica_monitor is not None:
+        await replica_monitor.stop()
+
+    # Flush buffered telemetry after MQTT has stopped producing it
+    await ingest_buffer.stop()
+    await heartbeat_tracker.stop()
+    if partition_task is not None:
+        partition_task.cancel()
 
@@ -0,0 +1,58 @@
+from typing import Callable
+
+# Default latency buckets in milliseconds
+DEFAULT_MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Registered metric providers, keyed by section name in the /metrics output
+_providers: dict[str, Callable[[], dict]] = {}
+
+
+class Histogram:
+    """
+    Minimal cumulative histogram for latency-style measurements.
+
+    Not thread-safe; observe() is expected to be called from the event loop.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_MS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record a single measurement."""
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def snapshot(self) -> dict:
+        """Return the histogram as a JSON-serializable dict with cumulative bucket counts."""
+        cumulative, buckets = 0, {}
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            buckets[f"le_{bound}"] = cumulative
+        buckets["le_inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "max": round(self.max, 3),
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "buckets": buckets,
+        }
+
+
+def register(name: str, provider: Callable[[], dict]) -> None:
+    """Register a callable that returns the current metrics for one subsystem."""
+    _providers[name] = provider
+
+
+def collect() -> dict:
+    """Collect the current metrics from every registered provider."""
+    return {name: provider() for name, provider in _providers.items()}
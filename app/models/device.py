@@ -73,6 +73,25 @@ class DeviceUpdate(DeviceBase):
     is_active: Optional[bool] = None
     last_seen: Optional[datetime] = None
 
+class DeviceInfo(SQLModel):
+    """
+    Device metadata needed for authentication and ownership checks.
+    Kept in the in-process device registry.
+    """
+    id: int
+    user_id: int
+    is_active: bool
+    mqtt_enabled: bool
+    last_seen: Optional[datetime] = None
+
+
+class DevicePresence(SQLModel):
+    """Schema for a device's online/offline state."""
+    device_id: int
+    online: bool
+    last_seen: Optional[datetime] = None
+
+
 class DeviceDelete(SQLModel):
     """Schema for deleting an existing IoT device."""
     id: int | None
@@ -2,8 +2,8 @@ from sqlmodel import SQLModel, Field, Relationship
 from typing import Optional
 from datetime import datetime
 from app.utils import now_utc
-from sqlalchemy import Column
-from sqlalchemy.types import DateTime
+from sqlalchemy import Column, Index
+from sqlalchemy.types import DateTime, LargeBinary
 
 
 class DeviceDataIn(SQLModel):
@@ -22,18 +22,131 @@ class DeviceDataOut(DeviceDataIn):
     pass
 
 
+class ReadingType(SQLModel, table=True):
+    """
+    Interned reading type name such as "temperature".
+
+    DeviceData rows reference it by its integer ID instead of repeating the
+    string; see ReadingTypeCache for the in-process name <-> ID mapping.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+
+
 class DeviceData(SQLModel, table=True):
     """
     Represents a single telemetry data point reported by a device.
 
     Contains sensor type, value, and timestamp. Each record is associated
-    with a specific IoT device.
+    with a specific IoT device. The sensor type is stored as a ReadingType ID.
     """
+    __table_args__ = (
+        # Serves per-device "latest" and time-range queries without scanning the whole table
+        Index("ix_devicedata_device_id_timestamp", "device_id", "timestamp"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     device_id: int = Field(foreign_key="device.id")
-    reading_type: str
+    reading_type_id: int = Field(foreign_key="readingtype.id")
     value: float
     timestamp: datetime = Field(default_factory=now_utc,
                                  sa_column=Column(DateTime(timezone=True), nullable=False))
 
     device: Optional["Device"] = Relationship(back_populates="data_points")
+
+
+class DeviceDataRollup(SQLModel, table=True):
+    """
+    Pre-aggregated telemetry of one device and reading type over one time bucket.
+
+    Maintained by the ingestion path at 1-minute, 1-hour and 1-day resolution
+    (see RollupService), so charts over long ranges do not rescan raw data.
+    """
+    device_id: int = Field(foreign_key="device.id", primary_key=True)
+    reading_type: str = Field(primary_key=True)
+    resolution: int = Field(primary_key=True, description="Bucket width in seconds")
+    bucket_start: datetime = Field(sa_column=Column(DateTime(timezone=True), primary_key=True))
+    count: int
+    sum: float
+    min: float
+    max: float
+    last_value: float
+    last_timestamp: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+
+
+class DeviceDataArchive(SQLModel, table=True):
+    """
+    Compressed block of archived readings of one device and reading type.
+
+    Closed days of raw telemetry are moved here by the archive job (see
+    ArchiveService) in the columnar format of app.db.columnar. Readings that
+    arrive late for an archived day end up in an additional block.
+    """
+    __table_args__ = (
+        Index("ix_devicedataarchive_device_id_start", "device_id", "start"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    device_id: int = Field(foreign_key="device.id")
+    reading_type_id: int = Field(foreign_key="readingtype.id")
+    start: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False),
+                            description="Timestamp of the first reading")
+    end: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False),
+                          description="Timestamp of the last reading")
+    count: int
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+class DeviceDataBatchError(SQLModel):
+    """Validation errors for a single reading rejected from a batch upload."""
+    index: int
+    errors: list[dict]
+
+
+class DeviceDataBatchOut(SQLModel):
+    """Summary returned after ingesting a batch of telemetry readings."""
+    accepted: int
+    rejected: list[DeviceDataBatchError] = []
+
+
+class DeviceDataImportIn(DeviceDataIn):
+    """One reading of a bulk import: names its device and requires a timestamp."""
+    device_id: int
+    timestamp: datetime
+
+
+class DeviceDataImportOut(SQLModel):
+    """Summary returned after a bulk import. Errors are reported by line number, up to a limit."""
+    accepted: int
+    rejected: int
+    errors: list[DeviceDataBatchError] = []
+    duration_seconds: float
+
+
+class DeviceDataBucket(SQLModel):
+    """Aggregated telemetry of one reading type over one time bucket."""
+    reading_type: str
+    bucket_start: datetime
+    count: int
+    min: float
+    max: float
+    mean: float
+    last: float
+
+
+class DeviceDataLatest(SQLModel):
+    """Latest readings of one device, newest first."""
+    device_id: int
+    readings: list[DeviceDataOut]
+
+
+class DeviceDataSummary(SQLModel):
+    """Aggregated telemetry of one device and reading type over a time range."""
+    device_id: int
+    reading_type: str
+    count: int
+    min: float
+    max: float
+    mean: float
+    last: float
+    last_timestamp: datetime
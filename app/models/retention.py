@@ -0,0 +1,33 @@
+from typing import Optional
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Index, UniqueConstraint, text
+
+
+class RetentionPolicyBase(SQLModel):
+    """
+    How long telemetry is kept, in days, per storage level.
+    A level left empty is kept forever.
+    """
+    reading_type: Optional[str] = Field(default=None, description="Reading type the policy applies to. All types if omitted.")
+    raw_days: Optional[int] = Field(default=None, gt=0, description="Days to keep raw readings")
+    rollup_1m_days: Optional[int] = Field(default=None, gt=0, description="Days to keep 1-minute rollups")
+    rollup_1h_days: Optional[int] = Field(default=None, gt=0, description="Days to keep 1-hour rollups")
+    rollup_1d_days: Optional[int] = Field(default=None, gt=0, description="Days to keep 1-day rollups")
+
+
+class RetentionPolicy(RetentionPolicyBase, table=True):
+    """Retention policy of one device, optionally limited to one reading type."""
+    __table_args__ = (
+        UniqueConstraint("device_id", "reading_type"),
+        # NULLs are distinct in the constraint above, so device-wide policies need their own index
+        Index("ux_retentionpolicy_device_id_all_types", "device_id", unique=True,
+              sqlite_where=text("reading_type IS NULL"), postgresql_where=text("reading_type IS NULL")),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    device_id: int = Field(foreign_key="device.id", index=True)
+
+
+class RetentionPolicyRead(RetentionPolicyBase):
+    """Schema for a retention policy returned from the API. Global policies have no device_id."""
+    device_id: Optional[int] = None
@@ -1,121 +1,306 @@
 # mqtt_client.py
 import paho.mqtt.client as mqtt
 import json
-from app.models.device_data import DeviceData
-from app.models.device import Device  # assuming this exists
-from app.auth.auth_device_handler import verify_device_token
-from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime
+import os
+import time
 import asyncio
-from app.utils import now_utc
-from app.db.session import db_session_context
-from sqlalchemy.exc import SQLAlchemyError
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+from app.auth.auth_device_handler import verify_device_token_for_device
+from app.models.device_data import DeviceDataIn
+from app.services.device_data_service import DeviceDataService
+from app.services.ingest_buffer import ingest_buffer
+
+load_dotenv()
+
+# Consumer settings loaded from environment
+MQTT_QUEUE_SIZE = int(os.getenv("MQTT_QUEUE_SIZE", 10000))
+MQTT_WORKERS = int(os.getenv("MQTT_WORKERS", 4))
+MQTT_MAX_MESSAGES_PER_SECOND = float(os.getenv("MQTT_MAX_MESSAGES_PER_SECOND", 0))  # 0 = no cap
+
+# Maximum number of topic filters sent in one SUBSCRIBE packet
+SUBSCRIBE_BATCH_SIZE = 500
 
 
 class MQTTClient:
-    def __init__(self, client_id, broker="localhost", port=1883, keepalive=60, loop=None):
+    """
+    MQTT consumer driven by the asyncio event loop.
+
+    paho's socket is registered with the event loop (add_reader / add_writer)
+    instead of running paho's network loop in a background thread. Received
+    messages go into a bounded asyncio.Queue that worker tasks drain. When the
+    queue is full the client stops reading from the socket until the workers
+    catch up, so TCP flow control pushes back on the broker instead of
+    pending work piling up in memory.
+    """
+
+    def __init__(self, client_id, broker="localhost", port=1883, keepalive=60, loop=None,
+                 queue_size=MQTT_QUEUE_SIZE, workers=MQTT_WORKERS,
+                 max_messages_per_second=MQTT_MAX_MESSAGES_PER_SECOND):
         """Initializes the MQTT client."""
         self.loop = loop or asyncio.get_event_loop()
         self.client = mqtt.Client(client_id=client_id, callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
         self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
         self.client.on_message = self.on_message
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
 
         self.broker = broker
         self.port = port
         self.keepalive = keepalive
-        self.subscriptions = []
+        self.subscriptions: dict[str, None] = {}  # insertion-ordered set of topics
+        # Optional set of device IDs to accept messages from (used with wildcard subscriptions)
+        self.allowed_device_ids: set[int] | None = None
+
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.resume_below = queue_size // 2
+        self.num_workers = workers
+        self.min_interval = 1 / max_messages_per_second if max_messages_per_second > 0 else 0.0
+
+        self._sock = None
+        self._paused = False
+        self._running = False
+        self._next_slot = 0.0
+        self._tasks: list[asyncio.Task] = []
+
+        # Metrics
+        self.received = 0
+        self.processed = 0
+        self.invalid = 0
+        self.dropped = 0
+        self.filtered = 0
+        self.pauses = 0
+        self.messages_per_second = 0.0
+
+    # --- paho callbacks (run on the event loop thread) ---
 
     def on_connect(self, client, userdata, flags, reasonCode, properties):
         """Callback function triggered upon a successful connection to the broker.
         Subscribes to any pre-defined topics in the subscription list."""
         print(f"[Connected] Reason code: {reasonCode}")
-        for topic in self.subscriptions:
-            print(f"[MQTT] Subscribing to topic: {topic}")
-            self.client.subscribe(topic)
+        # Batch topics into as few SUBSCRIBE packets as possible
+        topics = list(self.subscriptions)
+        for i in range(0, len(topics), SUBSCRIBE_BATCH_SIZE):
+            self.client.subscribe([(topic, 0) for topic in topics[i:i + SUBSCRIBE_BATCH_SIZE]])
+        print(f"[MQTT] Subscribed to {len(self.subscriptions)} topics")
+
+    def on_disconnect(self, client, userdata, flags, reasonCode, properties):
+        """Callback function triggered when the connection to the broker is lost or closed."""
+        print(f"[Disconnected] Reason code: {reasonCode}")
 
     def on_message(self, client, userdata, msg):
-        """Callback function triggered when a PUBLISH message is received."""
-        print(f"[MQTT] Received on {msg.topic}: {msg.payload.decode()}")
+        """Callback function triggered when a PUBLISH message is received.
+        Parses the payload once and queues it for the worker tasks."""
+        self.received += 1
+        if self.allowed_device_ids is not None:
+            try:
+                device_id = int(msg.topic.rsplit("/", 1)[-1])
+            except ValueError:
+                self.invalid += 1
+                return
+            if device_id not in self.allowed_device_ids:
+                self.filtered += 1
+                return
 
         try:
-            # Parse MQTT message payload
-            payload = json.loads(msg.payload.decode())
+            payload = json.loads(msg.payload)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self.invalid += 1
+            print(f"[ERROR] Failed to decode JSON from message on {msg.topic}")
+            return
 
-            # Validate payload structure
-            if "data" not in payload or "token" not in payload:
-                print(f"[ERROR] Invalid payload structure: {payload}")
-                return
+        # Validate payload structure
+        if not isinstance(payload, dict) or "data" not in payload or "token" not in payload:
+            self.invalid += 1
+            print(f"[ERROR] Invalid payload structure on {msg.topic}")
+            return
+
+        try:
+            self.queue.put_nowait((msg.topic, payload))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+
+        if self.queue.full():
+            self._pause_reading()
+
+    # --- Socket integration with the event loop ---
+
+    def _call_in_loop(self, fn, *args):
+        """Run fn on the event loop thread (paho may call back from an executor during connect)."""
+        try:
+            in_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._call_in_loop(self._add_reader, sock)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._call_in_loop(self._remove_reader, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._call_in_loop(self.loop.add_writer, sock, self.client.loop_write)
 
-            # Run coroutine safely from a thread
-            if self.loop:
-                asyncio.run_coroutine_threadsafe(
-                    self._store_device_data(msg.topic, payload),
-                    self.loop
-                )
-            else:
-                print("[ERROR] No running event loop")
-
-        except json.JSONDecodeError:
-            print(f"[ERROR] Failed to decode JSON from message: {msg.payload}")
-        except Exception as e:
-            print(f"[ERROR] Unexpected error: {e}")
-
-    def connect(self):
-        """Connects to the MQTT broker and starts the network loop in a separate thread."""
-        self.client.connect(self.broker, self.port, self.keepalive)
-        self.client.loop_start()
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._call_in_loop(self.loop.remove_writer, sock)
+
+    def _add_reader(self, sock):
+        self._sock = sock
+        if not self._paused:
+            self.loop.add_reader(sock, self.client.loop_read)
+
+    def _remove_reader(self, sock):
+        self.loop.remove_reader(sock)
+        if self._sock is sock:
+            self._sock = None
+
+    def _pause_reading(self):
+        """Stop reading from the broker until the queue has drained below the resume mark."""
+        if self._paused:
+            return
+        self._paused = True
+        self.pauses += 1
+        if self._sock is not None:
+            self.loop.remove_reader(self._sock)
+
+    def _resume_reading(self):
+        if not self._paused:
+            return
+        self._paused = False
+        if self._sock is not None:
+            self.loop.add_reader(self._sock, self.client.loop_read)
+
+    # --- Background tasks ---
+
+    async def _worker(self):
+        """Drains the message queue, optionally capped to a maximum message rate."""
+        while True:
+            topic, payload = await self.queue.get()
+            try:
+                if self.min_interval:
+                    now = time.monotonic()
+                    delay = self._next_slot - now
+                    self._next_slot = max(now, self._next_slot) + self.min_interval
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await self._store_device_data(topic, payload)
+                self.processed += 1
+            finally:
+                self.queue.task_done()
+                if self._paused and self.queue.qsize() <= self.resume_below:
+                    self._resume_reading()
+
+    async def _misc_loop(self):
+        """Handles keepalive pings, throughput measurement and reconnects once per second."""
+        backoff = 1
+        last_processed, last_time = self.processed, time.monotonic()
+        while self._running:
+            await asyncio.sleep(1)
+
+            now = time.monotonic()
+            self.messages_per_second = round((self.processed - last_processed) / (now - last_time), 2)
+            last_processed, last_time = self.processed, now
+
+            if self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN and self._running:
+                try:
+                    await self.loop.run_in_executor(None, self.client.reconnect)
+                    backoff = 1
+                except (OSError, mqtt.WebsocketConnectionError) as e:
+                    print(f"[MQTT] Reconnect failed: {e}. Retrying in {backoff}s")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+
+    # --- Public API ---
+
+    async def connect(self):
+        """Connects to the MQTT broker and starts the worker tasks on the event loop.
+        If the broker is unreachable the error is raised and reconnects are retried in the background."""
+        self._running = True
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+        self._tasks.append(asyncio.create_task(self._misc_loop()))
+        # The TCP connect itself is blocking, so keep it off the event loop
+        await self.loop.run_in_executor(None, self.client.connect, self.broker, self.port, self.keepalive)
 
     def subscribe_to_topics(self, topics):
         """Subscribes the client to a list of MQTT topics."""
-        self.subscriptions.extend(topics)
         for topic in topics:
-            self.client.subscribe(topic)
+            if topic not in self.subscriptions:
+                self.subscriptions[topic] = None
+                self.client.subscribe(topic)
+
+    def unsubscribe_from_topics(self, topics):
+        """Unsubscribes the client from a list of MQTT topics."""
+        for topic in topics:
+            if topic in self.subscriptions:
+                del self.subscriptions[topic]
+                self.client.unsubscribe(topic)
 
-    def disconnect(self):
-        """Stops the network loop and disconnects from the MQTT broker."""
-        self.client.loop_stop()
+    async def disconnect(self, drain_timeout: float = 5.0):
+        """Disconnects from the broker, processes queued messages and stops the worker tasks."""
+        self._running = False
         self.client.disconnect()
+        if self._sock is not None:
+            self._remove_reader(self._sock)
+
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"[MQTT] {self.queue.qsize()} queued messages not processed before shutdown")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.client.is_connected(),
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "paused": self._paused,
+            "pauses": self.pauses,
+            "received": self.received,
+            "processed": self.processed,
+            "invalid": self.invalid,
+            "dropped": self.dropped,
+            "filtered": self.filtered,
+            "messages_per_second": self.messages_per_second,
+        }
 
     @staticmethod
     async def _store_device_data(topic: str, payload: dict):
         """
-        Stores device data from an MQTT message directly to the database.
+        Validates an MQTT message and hands its reading to the ingestion buffer.
         Assumes payload contains 'token' and 'data' keys.
         """
         # Extract fields
         token = payload.get("token")
         data = payload.get("data")
 
-        device_id = int(topic.split("/")[-1])
         try:
-            # Connect to DB
-            async with db_session_context() as db:  # AsyncSession
-                # Validate JWT
-                is_authenticated = verify_device_token(token)
-                if not is_authenticated:
-                    raise ValueError("Device not authorized")
+            device_id = int(topic.split("/")[-1])
 
-                try:
-                    raw_timestamp = data.get("timestamp")
-                    if isinstance(raw_timestamp, str):
-                        # Convert ISO 8601 string to datetime object
-                        timestamp = datetime.fromisoformat(raw_timestamp.replace("Z", "+00:00"))
-                    else:
-                        timestamp = now_utc()
-                    # Step 3: Create new DeviceData entry
-                    db_data = DeviceData(
-                        device_id=device_id,
-                        reading_type=data.get("reading_type"),
-                        value=data.get("value"),
-                        timestamp=timestamp,
-                    )
-
-                    db.add(db_data)
-                    await db.commit()
-                    await db.refresh(db_data)
-                except SQLAlchemyError as e:
-                    await db.rollback()
-                    print(e)
-
-        except Exception as session_exc:
-            print(f"[ERROR] Failed to get DB session: {session_exc}")
+            # Validate JWT (cached) and make sure it belongs to the device in the topic
+            is_authenticated = verify_device_token_for_device(token, device_id)
+            if not is_authenticated:
+                raise ValueError("Device not authorized")
+
+            # Validate the reading the same way as the HTTP endpoint (ISO 8601 timestamps, "Z" suffix allowed)
+            reading = DeviceDataIn.model_validate(data)
+
+            # Queue the reading for the next group commit; MQTT does not wait for it
+            await ingest_buffer.submit([DeviceDataService.to_row(device_id, reading)], wait=False)
+
+        except (ValueError, ValidationError) as exc:
+            print(f"[ERROR] Rejected MQTT reading on {topic}: {exc}")
+        except Exception as exc:
+            print(f"[ERROR] Failed to store MQTT reading on {topic}: {exc}")
@@ -1,33 +1,56 @@
 import asyncio
 import os
 
+from app import metrics
 from app.services.device_service import DeviceService
 from app.db.session import db_session_context
 from app.mqtt.mqtt_client import MQTTClient
 
-from sqlalchemy import select
 from dotenv import load_dotenv
 load_dotenv()
 
 mqtt_client = None  # Keep reference for shutdown
 
+# "per_device" subscribes to devices/<id> for every enabled device,
+# "wildcard" subscribes once to devices/+ and filters messages in memory
+MQTT_SUBSCRIPTION_MODE = os.getenv("MQTT_SUBSCRIPTION_MODE", "per_device")
+WILDCARD_TOPIC = "devices/+"
+
+# IDs of devices allowed to publish over MQTT, kept current by the device routes
+enabled_device_ids: set[int] = set()
+
 
 def get_broker_url():
     return os.getenv("MQTT_BROKER_URL", "localhost")
 
 
+def get_device_topic(device_id: int) -> str:
+    return f"devices/{device_id}"
+
+
+def _create_client(loop) -> MQTTClient:
+    client = MQTTClient(client_id="myClient", loop=loop, broker=get_broker_url())
+    if MQTT_SUBSCRIPTION_MODE == "wildcard":
+        client.allowed_device_ids = enabled_device_ids
+        client.subscribe_to_topics([WILDCARD_TOPIC])
+    metrics.register("mqtt", client.stats)
+    return client
+
+
 async def initialize_all_mqtt_subscriptions(loop):
 
     global mqtt_client
-    broker_url = get_broker_url()
-    mqtt_client = MQTTClient(client_id="myClient", loop=loop, broker=broker_url)
+    mqtt_client = _create_client(loop)
 
     try:
         async with db_session_context() as db:
-            mqtt_topics = await DeviceService.get_mqtt_enabled_topics(db=db)
+            device_ids = await DeviceService.get_mqtt_enabled_device_ids(db=db)
 
-        mqtt_client.subscribe_to_topics(mqtt_topics)
-        mqtt_client.connect()
+        enabled_device_ids.clear()
+        enabled_device_ids.update(device_ids)
+        if MQTT_SUBSCRIPTION_MODE != "wildcard":
+            mqtt_client.subscribe_to_topics([get_device_topic(device_id) for device_id in sorted(device_ids)])
+        await mqtt_client.connect()
     except ConnectionRefusedError as e:
         print(f"🚫 MQTT connection failed: {e}")
     except Exception as e:
@@ -35,11 +58,12 @@ async def initialize_all_mqtt_subscriptions(loop):
 
 
 async def initialize_single_mqtt_subscription(device_id):
+    """Allows a newly registered or re-enabled device to publish over MQTT."""
     global mqtt_client
     if mqtt_client is None:
-        mqtt_client = MQTTClient(client_id="myClient", loop=asyncio.get_running_loop())
+        mqtt_client = _create_client(asyncio.get_running_loop())
         try:
-            mqtt_client.connect()
+            await mqtt_client.connect()
         except Exception as e:
             print(f"Failed to connect MQTT client: {e}")
             return
@@ -49,12 +73,20 @@ async def initialize_single_mqtt_subscription(device_id):
             topic = await DeviceService.get_mqtt_topic_for_device(db=db, device_id=device_id)
 
         if topic:
-            mqtt_client.subscribe_to_topics([topic])
+            enabled_device_ids.add(device_id)
+            if MQTT_SUBSCRIPTION_MODE != "wildcard":
+                mqtt_client.subscribe_to_topics([topic])
     except Exception as e:
         print(f"Failed to subscribe device {device_id} to MQTT: {e}")
 
 
+async def remove_single_mqtt_subscription(device_id):
+    """Stops accepting MQTT telemetry from a deleted or MQTT-disabled device."""
+    enabled_device_ids.discard(device_id)
+    if mqtt_client is not None and MQTT_SUBSCRIPTION_MODE != "wildcard":
+        mqtt_client.unsubscribe_from_topics([get_device_topic(device_id)])
+
 
 async def disconnect_all_mqtt_subscriptions():
     if mqtt_client:
-        mqtt_client.disconnect()
+        await mqtt_client.disconnect()
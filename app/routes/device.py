@@ -1,15 +1,19 @@
 from fastapi import APIRouter, Depends, status, Form, HTTPException, Response
-from typing import List
+from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
 
-from app.models.device import DeviceCreate, DeviceUpdate, DeviceRead, DeviceReadWithKey, Token
+from app.models.device import DeviceCreate, DeviceUpdate, DeviceRead, DeviceReadWithKey, DevicePresence, Token
 from app.models.user import UserBase
+from app.models.retention import RetentionPolicyBase, RetentionPolicyRead
 from app.services.device_service import DeviceService
+from app.services.device_registry import device_registry
+from app.services.heartbeat import heartbeat_tracker
+from app.services.retention_service import RetentionService
 from app.auth.auth_device_handler import authenticate_device, create_device_token
 from app.auth.auth_bearer import get_current_active_user
-from app.db.session import get_db_session
-from app.mqtt.mqtt_service import initialize_single_mqtt_subscription
+from app.db.session import get_db_session, get_read_session
+from app.mqtt.mqtt_service import initialize_single_mqtt_subscription, remove_single_mqtt_subscription
 
 router = APIRouter()
 
@@ -37,7 +41,7 @@ async def login_device_for_access_token(device_id: int = Form(...),
 
 
 @router.get("/device", status_code=status.HTTP_200_OK, response_model=List[DeviceRead], tags=["device"])
-async def get_devices_by_current_user(current_user: UserBase = Depends(get_current_active_user), db: AsyncSession = Depends(get_db_session)):
+async def get_devices_by_current_user(current_user: UserBase = Depends(get_current_active_user), db: AsyncSession = Depends(get_read_session)):
     """Retrieve all devices belonging to the currently authenticated user."""
     return await DeviceService.get_devices_by_user(db, current_user.id)
 
@@ -61,11 +65,51 @@ async def update_device(device_id: int, update_data: DeviceUpdate, current_user:
 async def delete_device(device_id: int, current_user: UserBase = Depends(get_current_active_user), db: AsyncSession = Depends(get_db_session)):
     """Delete a device owned by the current user."""
     await DeviceService.delete_device_for_user(db, device_id, current_user.id)
+    await remove_single_mqtt_subscription(device_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.put("/devices/{device_id}/mqtt", status_code=status.HTTP_200_OK, response_model=DeviceRead, tags=["device"])
 async def update_mqtt_enabled(device_id: int, mqtt_enabled: bool, current_user: UserBase = Depends(get_current_active_user), db: AsyncSession = Depends(get_db_session)):
     """Update a device owned by the current user."""
-    await DeviceService.update_mqtt_enabled_for_user(db, device_id, current_user.id, mqtt_enabled)
-    device = await DeviceService.get_user_device(db, device_id, current_user.id)
-    return DeviceRead.model_validate(device, from_attributes=True)
+    device = await DeviceService.update_mqtt_enabled_for_user(db, device_id, current_user.id, mqtt_enabled)
+    if mqtt_enabled:
+        await initialize_single_mqtt_subscription(device_id)
+    else:
+        await remove_single_mqtt_subscription(device_id)
+    return device
+
+
+@router.get("/devices/{device_id}/presence", status_code=status.HTTP_200_OK, response_model=DevicePresence, tags=["device"])
+async def get_device_presence(device_id: int, current_user: UserBase = Depends(get_current_active_user), db: AsyncSession = Depends(get_db_session)):
+    """Return whether a device owned by the current user is online, answered from memory."""
+    device = await device_registry.get(db, device_id)
+    if device is None or device.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    last_seen = heartbeat_tracker.last_seen(device_id, fallback=device.last_seen)
+    return DevicePresence(device_id=device_id, online=heartbeat_tracker.is_online(last_seen), last_seen=last_seen)
+
+
+@router.get("/devices/{device_id}/retention", status_code=status.HTTP_200_OK, response_model=List[RetentionPolicyRead], tags=["device"])
+async def get_device_retention(device_id: int, current_user: UserBase = Depends(get_current_active_user), db: AsyncSession = Depends(get_db_session)):
+    """List the retention policies of a device owned by the current user."""
+    await DeviceService.get_user_device(db, device_id, current_user.id)
+    return await RetentionService.get_device_policies(db, device_id)
+
+
+@router.put("/devices/{device_id}/retention", status_code=status.HTTP_200_OK, response_model=RetentionPolicyRead, tags=["device"])
+async def set_device_retention(device_id: int, policy: RetentionPolicyBase, current_user: UserBase = Depends(get_current_active_user), db: AsyncSession = Depends(get_db_session)):
+    """
+    Set how long a device's telemetry is kept, for all its reading types or for policy.reading_type.
+    Replaces an existing policy with the same scope.
+    """
+    await DeviceService.get_user_device(db, device_id, current_user.id)
+    return await RetentionService.set_device_policy(db, device_id, policy)
+
+
+@router.delete("/devices/{device_id}/retention", status_code=status.HTTP_204_NO_CONTENT, tags=["device"])
+async def delete_device_retention(device_id: int, reading_type: Optional[str] = None, current_user: UserBase = Depends(get_current_active_user), db: AsyncSession = Depends(get_db_session)):
+    """Remove a device's retention policy, so global policies apply again."""
+    await DeviceService.get_user_device(db, device_id, current_user.id)
+    await RetentionService.delete_device_policy(db, device_id, reading_type)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
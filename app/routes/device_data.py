@@ -1,112 +1,326 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+import csv
+import io
+import json
+import os
+from typing import Any, AsyncIterator, List, Literal, Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Path, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from datetime import datetime
 
 
-from app.db.session import get_db_session
+from app.db.session import get_read_session
 from app.auth.auth_device_bearer import get_current_device
 from app.auth.auth_bearer import get_current_user
-from app.models.device import Device, DeviceRead
-from app.models.device_data import DeviceData, DeviceDataIn, DeviceDataOut
+from app.models.device import DeviceInfo
+from app.models.user import UserInDB
+from app.models.device_data import (DeviceDataIn, DeviceDataOut,
+                                    DeviceDataBatchError, DeviceDataBatchOut, DeviceDataBucket,
+                                    DeviceDataImportOut, DeviceDataLatest, DeviceDataSummary)
+from app.services.bulk_import import BulkImportService, decode_lines
+from app.services.device_data_service import DeviceDataService
+from app.services.ingest_buffer import ingest_buffer
+from app.services.device_registry import device_registry
+from app.services.device_service import DeviceService
+from app.services.downsampling import DownsamplingService, LTTB_MAX_POINTS
+from app.services.latest_values import latest_values
+from app.services.rollup_service import RollupService, ROLLUPS_ENABLED, RESOLUTION_LABELS
+from app.utils import parse_duration, as_utc
 
 
 router = APIRouter()
 
+# Upper bound on the number of readings accepted in one batch upload
+INGEST_MAX_BATCH_SIZE = int(os.getenv("INGEST_MAX_BATCH_SIZE", 1000))
+# Upper bound on the number of readings returned per page by /data/last and /data/range
+DATA_MAX_PAGE_SIZE = int(os.getenv("DATA_MAX_PAGE_SIZE", 1000))
+# Upper bound on the number of devices in one multi-device query
+DATA_MAX_DEVICES = int(os.getenv("DATA_MAX_DEVICES", 500))
+# Upper bound on the number of time buckets one aggregation query may produce
+AGGREGATE_MAX_BUCKETS = int(os.getenv("AGGREGATE_MAX_BUCKETS", 10000))
+
+
+async def _ndjson_chunks(device_id: int, start: datetime, end: datetime) -> AsyncIterator[str]:
+    """One JSON object per line, one yielded string per cursor chunk."""
+    async for rows in DeviceDataService.stream_range(device_id, start, end):
+        yield "".join(
+            json.dumps({"reading_type": reading_type, "value": value, "timestamp": as_utc(timestamp).isoformat()}) + "\n"
+            for timestamp, reading_type, value in rows
+        )
+
+
+async def _csv_chunks(device_id: int, start: datetime, end: datetime) -> AsyncIterator[str]:
+    """CSV with a header row, one yielded string per cursor chunk."""
+    yield "timestamp,reading_type,value\r\n"
+    async for rows in DeviceDataService.stream_range(device_id, start, end):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            (as_utc(timestamp).isoformat(), reading_type, value) for timestamp, reading_type, value in rows
+        )
+        yield buffer.getvalue()
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[tuple[datetime, int]]:
+    """Decode the cursor query parameter, rejecting malformed cursors with 400."""
+    if cursor is None:
+        return None
+    try:
+        return DeviceDataService.decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def parse_time_range(start: str, end: str) -> tuple[datetime, datetime]:
+    """Parse ISO 8601 start/end query parameters, rejecting invalid or empty ranges with 400."""
+    try:
+        start_dt = datetime.fromisoformat(start)
+        end_dt = datetime.fromisoformat(end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use ISO 8601.")
+
+    if start_dt >= end_dt:
+        raise HTTPException(status_code=400, detail="Start must be before end.")
+    return start_dt, end_dt
+
+
+async def get_owned_device(db: AsyncSession, device_id: int, user: UserInDB) -> DeviceInfo:
+    """Return the device if it exists and belongs to the user (cached, see device_registry)."""
+    device = await device_registry.get(db, device_id)
+    if device is None or device.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return device
+
+
+
+async def get_owned_device_ids(db: AsyncSession, device_ids: list[int], user: UserInDB) -> list[int]:
+    """Deduplicate device IDs and check in one query that they all belong to the user (404 otherwise)."""
+    ids = list(dict.fromkeys(device_ids))
+    if len(ids) > DATA_MAX_DEVICES:
+        raise HTTPException(status_code=400, detail=f"At most {DATA_MAX_DEVICES} devices per request.")
+    if await DeviceService.get_user_device_ids(db, ids, user.id) != set(ids):
+        raise HTTPException(status_code=404, detail="Device not found")
+    return ids
 
 
 @router.post("/devices/data", response_model=DeviceDataOut, tags=["data_ingestion"])
 async def ingest_device_data(data: DeviceDataIn,
-                             device: DeviceRead = Depends(get_current_device),
-                             db: AsyncSession = Depends(get_db_session)):
-    """Ingest telemetry data from a device associated with the current authenticated user."""
-    # Check if the device belongs to this user
+                             device: DeviceInfo = Depends(get_current_device)):
+    """Ingest telemetry data from the current authenticated device."""
+    # The device was already checked (exists and active) by get_current_device
+
+    # Store the telemetry data (waits for the group commit that contains it)
+    row = DeviceDataService.to_row(device.id, data)
+    await ingest_buffer.submit([row])
+
+    return DeviceDataOut.model_validate(row)
+
+
+@router.post("/devices/data/batch", response_model=DeviceDataBatchOut, tags=["data_ingestion"])
+async def ingest_device_data_batch(readings: list[dict[str, Any]] = Body(..., description="List of readings to ingest"),
+                                   device: DeviceInfo = Depends(get_current_device)):
+    """
+    Ingest a buffered batch of telemetry readings from the current authenticated device.
 
-    # Safely extract and validate device ID
-    if device.id is None:
-        raise HTTPException(status_code=401, detail="Invalid token: device ID is missing")
+    Every reading is validated on its own: valid readings are written together in a
+    single multi-row insert and transaction, invalid ones are reported back by index.
+    """
+    if len(readings) > INGEST_MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413,
+                            detail=f"Batch too large. At most {INGEST_MAX_BATCH_SIZE} readings per request.")
 
-    device_id = int(device.id)
-    device = await db.get(Device, device_id)
-    if not device:
-        raise HTTPException(status_code=403, detail="This device is not authorized")
+    accepted: list[DeviceDataIn] = []
+    rejected: list[DeviceDataBatchError] = []
+    for index, item in enumerate(readings):
+        try:
+            accepted.append(DeviceDataIn.model_validate(item))
+        except ValidationError as e:
+            rejected.append(DeviceDataBatchError(index=index,
+                                                 errors=e.errors(include_url=False, include_context=False)))
 
-    # Store the telemetry data
-    db_data = DeviceData(
-        device_id=device_id,
-        reading_type=data.reading_type,
-        value=data.value,
-        timestamp=data.timestamp,
-    )
+    await ingest_buffer.submit([DeviceDataService.to_row(device.id, item) for item in accepted])
+    return DeviceDataBatchOut(accepted=len(accepted), rejected=rejected)
 
-    db.add(db_data)
-    await db.commit()
-    await db.refresh(db_data)
 
-    return db_data
+@router.post("/devices/data/import", response_model=DeviceDataImportOut, tags=["data_ingestion"])
+async def import_device_data(
+    request: Request,
+    format: Literal["csv", "ndjson"] = Query("ndjson", description="Body format: CSV with a header row, or one JSON object per line"),
+    user: UserInDB = Depends(get_current_user),
+):
+    """
+    Bulk-import historical readings of the current user's devices, e.g. when migrating
+    from another platform or backfilling after a gateway outage.
+
+    The body is streamed: every line holds device_id, reading_type, value and timestamp,
+    and is written in large chunks with COPY. Invalid lines and readings of devices
+    the user does not own are rejected and reported by line number.
+    """
+    return await BulkImportService.load(decode_lines(request.stream()), format, user.id)
+
+
+
+
+@router.get("/devices/data/last", response_model=list[DeviceDataLatest], tags=["device_data"])
+async def get_last_data_of_devices(
+    device_ids: List[int] = Query(..., description="Devices to query (repeat the parameter for several)"),
+    limit: int = Query(10, gt=0, le=DATA_MAX_PAGE_SIZE, description="Number of recent data points per device"),
+    db: AsyncSession = Depends(get_read_session),
+    user: UserInDB = Depends(get_current_user),
+):
+    """
+    Get the last X data points of each of several devices, newest first, in one request.
+
+    Ownership of all devices is checked in one query and the readings are fetched
+    in one query, so a fleet dashboard needs a single call instead of one per device.
+    """
+    ids = await get_owned_device_ids(db, device_ids, user)
+    readings = await DeviceDataService.latest_many(db, ids, limit)
+    return [DeviceDataLatest(device_id=device_id, readings=readings[device_id]) for device_id in ids]
 
 
+@router.get("/devices/data/summary", response_model=list[DeviceDataSummary], tags=["device_data"])
+async def get_data_summary_of_devices(
+    device_ids: List[int] = Query(..., description="Devices to query (repeat the parameter for several)"),
+    start: str = Query(..., description="Start datetime in ISO 8601 format (e.g., 2025-07-24T00:00:00Z)"),
+    end: str = Query(..., description="End datetime in ISO 8601 format (e.g., 2025-07-25T00:00:00Z)"),
+    reading_type: Optional[str] = Query(None, description="Only summarize this reading type"),
+    db: AsyncSession = Depends(get_read_session),
+    user: UserInDB = Depends(get_current_user),
+):
+    """Get count, min, max, mean and last value per device and reading type between start and end."""
+    start_dt, end_dt = parse_time_range(start, end)
+    ids = await get_owned_device_ids(db, device_ids, user)
+    return await DeviceDataService.summarize_many(db, ids, start_dt, end_dt, reading_type)
 
 
 @router.get("/devices/{device_id}/data/last", response_model=list[DeviceDataOut], tags=["device_data"])
 async def get_last_device_data(
+    response: Response,
     device_id: int = Path(..., description="ID of the device"),
-    limit: int = Query(10, gt=0, description="Number of recent data points to return"),
-    db: AsyncSession = Depends(get_db_session),
-    user = Depends(get_current_user),  # Use get_current_admin if needed
+    limit: int = Query(10, gt=0, le=DATA_MAX_PAGE_SIZE, description="Number of recent data points to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page, to continue into older data"),
+    db: AsyncSession = Depends(get_read_session),
+    user: UserInDB = Depends(get_current_user),
 ):
-    """Get the last X data points for the given device (admin/user scoped)."""
+    """
+    Get the last X data points for the given device (user scoped), newest first.
+    If older data exists, the X-Next-Cursor header holds the cursor of the next page.
 
-    # Optional: Add ownership check (if user is not admin)
-    device = await db.get(Device, device_id)
-    if not device:
-        raise HTTPException(status_code=404, detail="Device not found")
+    First pages up to the latest-values buffer size are answered from memory.
+    """
+    after = parse_cursor(cursor)
 
-    # Add device-user ownership validation here if needed
+    # Device must exist and belong to the current user
+    await get_owned_device(db, device_id, user)
 
-    result = await db.execute(
-        select(DeviceData)
-        .where(DeviceData.device_id == device_id)
-        .order_by(DeviceData.timestamp.desc())
-        .limit(limit)
-    )
-    return result.scalars().all()
+    if after is None:
+        cached = await latest_values.latest(db, device_id, limit)
+        if cached is not None:
+            rows, position = cached
+            if position is not None:
+                response.headers["X-Next-Cursor"] = DeviceDataService.encode_cursor(*position)
+            return rows
+
+    rows, next_cursor = await DeviceDataService.page(db, device_id, limit, after, newest_first=True)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 
 @router.get("/devices/{device_id}/data/range", response_model=list[DeviceDataOut], tags=["device_data"])
 async def get_device_data_in_range(
+    response: Response,
     device_id: int = Path(..., description="ID of the device"),
     start: str = Query(..., description="Start datetime in ISO 8601 format (e.g., 2025-07-24T00:00:00 or 2025-07-24T00:00:00Z)"),
     end: str = Query(..., description="End datetime in ISO 8601 format (e.g., 2025-07-25T00:00:00 or 2025-07-25T00:00:00Z)"),
-    db: AsyncSession = Depends(get_db_session),
-    user = Depends(get_current_user),  # Or get_current_admin
+    max_points: Optional[int] = Query(None, gt=0, description="Point budget. If the raw data exceeds it, the data is downsampled"),
+    downsample: Literal["rollup", "lttb"] = Query("rollup", description="How max_points downsamples: rollup bucket means, or LTTB over the readings"),
+    format: Literal["json", "ndjson", "csv"] = Query("json", description="json, or ndjson/csv to stream raw readings"),
+    limit: int = Query(DATA_MAX_PAGE_SIZE, gt=0, le=DATA_MAX_PAGE_SIZE, description="Page size of json results"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    db: AsyncSession = Depends(get_read_session),
+    user: UserInDB = Depends(get_current_user),
 ):
-    """Get data points between start and end timestamps for a given device."""
+    """
+    Get data points between start and end timestamps for a given device.
 
-    try:
-        start_dt = datetime.fromisoformat(start)
-        end_dt = datetime.fromisoformat(end)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use ISO 8601.")
+    With max_points the data is served from 1m/1h/1d rollups when the raw readings
+    would exceed the budget; the X-Resolution header tells which one was used.
+    With downsample=lttb, Largest-Triangle-Three-Buckets picks the max_points readings
+    (split between reading types) that best keep the shape of each series instead.
 
-    if start_dt >= end_dt:
-        raise HTTPException(status_code=400, detail="Start must be before end.")
+    Raw json results are paginated oldest first: when more data follows, the
+    X-Next-Cursor header holds the cursor of the next page.
 
-    device = await db.get(Device, device_id)
-    if not device:
-        raise HTTPException(status_code=404, detail="Device not found")
+    The ndjson and csv formats stream raw readings from a server-side cursor, so
+    exports of any size use constant memory.
+    """
 
-    # Optional: Add access control check for user ownership
+    start_dt, end_dt = parse_time_range(start, end)
+    after = parse_cursor(cursor)
+    if format != "json" and max_points is not None:
+        raise HTTPException(status_code=400, detail="max_points is only supported with format=json.")
+    if downsample == "lttb" and (max_points is None or max_points > LTTB_MAX_POINTS):
+        raise HTTPException(status_code=400, detail=f"downsample=lttb requires max_points of at most {LTTB_MAX_POINTS}.")
 
-    result = await db.execute(
-        select(DeviceData)
-        .where(
-            DeviceData.device_id == device_id,
-            DeviceData.timestamp >= start_dt,
-            DeviceData.timestamp <= end_dt,
-        )
-        .order_by(DeviceData.timestamp.asc())
-    )
-    return result.scalars().all()
+    # Device must exist and belong to the current user
+    await get_owned_device(db, device_id, user)
+
+    if format == "ndjson":
+        return StreamingResponse(_ndjson_chunks(device_id, start_dt, end_dt), media_type="application/x-ndjson")
+    if format == "csv":
+        return StreamingResponse(_csv_chunks(device_id, start_dt, end_dt), media_type="text/csv",
+                                 headers={"Content-Disposition": f'attachment; filename="device-{device_id}.csv"'})
+
+    if downsample == "lttb":
+        try:
+            points, resolution = await DownsamplingService.lttb_points(db, device_id, start_dt, end_dt, max_points)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        response.headers["X-Resolution"] = RESOLUTION_LABELS.get(resolution, "raw")
+        return points
+
+    if max_points is not None and ROLLUPS_ENABLED:
+        resolution = await RollupService.choose_resolution(db, device_id, start_dt, end_dt, max_points)
+        response.headers["X-Resolution"] = RESOLUTION_LABELS.get(resolution, "raw")
+        if resolution is not None:
+            return await RollupService.points(db, device_id, start_dt, end_dt, resolution)
+
+    rows, next_cursor = await DeviceDataService.page(db, device_id, limit, after, start=start_dt, end=end_dt)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+
+@router.get("/devices/{device_id}/data/aggregate", response_model=list[DeviceDataBucket], tags=["device_data"])
+async def get_device_data_aggregate(
+    device_id: int = Path(..., description="ID of the device"),
+    start: str = Query(..., description="Start datetime in ISO 8601 format (e.g., 2025-07-24T00:00:00Z)"),
+    end: str = Query(..., description="End datetime in ISO 8601 format (e.g., 2025-07-31T00:00:00Z)"),
+    bucket: str = Query("1m", description="Bucket width, e.g. 30s, 5m, 1h or 1d"),
+    reading_type: Optional[str] = Query(None, description="Only aggregate this reading type"),
+    db: AsyncSession = Depends(get_read_session),
+    user: UserInDB = Depends(get_current_user),
+):
+    """
+    Get min, max, mean, count and last value per reading type and time bucket.
+
+    Buckets are aligned to the Unix epoch and computed in the database, so the
+    response size depends on the number of buckets rather than on the raw data.
+    """
+    start_dt, end_dt = parse_time_range(start, end)
+    try:
+        bucket_seconds = parse_duration(bucket)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid bucket. Use a number followed by s, m, h or d.")
+
+    if (end_dt - start_dt).total_seconds() / bucket_seconds > AGGREGATE_MAX_BUCKETS:
+        raise HTTPException(status_code=400,
+                            detail=f"Too many buckets. At most {AGGREGATE_MAX_BUCKETS} per request, use a wider bucket.")
 
+    # Device must exist and belong to the current user
+    await get_owned_device(db, device_id, user)
 
+    return await DeviceDataService.aggregate(db, device_id, start_dt, end_dt, bucket_seconds, reading_type)
@@ -0,0 +1,34 @@
+import hmac
+import os
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.security.utils import get_authorization_scheme_param
+
+from app import metrics
+
+load_dotenv()
+
+# Bearer token that scrapers send to read /metrics; the endpoint is disabled while unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+router = APIRouter()
+
+
+async def verify_metrics_token(request: Request) -> None:
+    """
+    Metrics describe the whole process (all tenants' load, pool and cache state), so a
+    user login is not enough: they need the operator's METRICS_TOKEN.
+    """
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+@router.get("/metrics", status_code=status.HTTP_200_OK, tags=["metrics"], dependencies=[Depends(verify_metrics_token)])
+async def get_metrics():
+    """Return in-process runtime metrics (ingestion buffer, caches, pools) as JSON. Requires METRICS_TOKEN."""
+    return metrics.collect()
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.auth_bearer import get_current_user
+from app.db.session import get_db_session, db_session_context
+from app.models.user import UserInDB
+from app.routes.device_data import get_owned_device
+from app.services.broadcaster import Subscription, telemetry_broadcaster
+
+
+router = APIRouter()
+
+# Upper bound on the number of devices in one live subscription
+STREAM_MAX_DEVICES = int(os.getenv("STREAM_MAX_DEVICES", 100))
+# Idle time after which a keepalive is sent, so proxies keep the connection and dead clients are noticed
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", 15))
+# WebSocket subprotocol that carries the access token as the next subprotocol entry
+WS_BEARER_SUBPROTOCOL = "bearer"
+
+
+async def check_subscription(db: AsyncSession, device_ids: list[int], user: UserInDB) -> set[int]:
+    """Validate the requested device IDs: at most STREAM_MAX_DEVICES, all owned by the user."""
+    ids = set(device_ids)
+    if len(ids) > STREAM_MAX_DEVICES:
+        raise HTTPException(status_code=400, detail=f"At most {STREAM_MAX_DEVICES} devices per subscription.")
+    for device_id in ids:
+        await get_owned_device(db, device_id, user)
+    return ids
+
+
+async def _sse_events(device_ids: set[int]) -> AsyncIterator[str]:
+    subscription = telemetry_broadcaster.subscribe(device_ids)
+    try:
+        reported_drops = 0
+        while True:
+            messages = await subscription.next_batch(STREAM_KEEPALIVE_SECONDS)
+            if subscription.dropped > reported_drops:
+                yield f"event: dropped\ndata: {json.dumps({'dropped': subscription.dropped - reported_drops})}\n\n"
+                reported_drops = subscription.dropped
+            if messages:
+                yield "".join(f"data: {message}\n\n" for message in messages)
+            else:
+                yield ": keepalive\n\n"
+    finally:
+        telemetry_broadcaster.unsubscribe(subscription)
+
+
+@router.get("/devices/data/stream", tags=["device_data"])
+async def stream_device_data(
+    device_ids: List[int] = Query(..., description="Devices to subscribe to (repeat the parameter for several)"),
+    db: AsyncSession = Depends(get_db_session),
+    user: UserInDB = Depends(get_current_user),
+):
+    """
+    Server-Sent Events stream of new readings of the given devices.
+
+    Each reading is a `data:` event with a JSON object. Slow clients lose their oldest
+    queued readings and receive a `dropped` event with the number lost.
+    """
+    ids = await check_subscription(db, device_ids, user)
+    return StreamingResponse(_sse_events(ids), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _send_messages(websocket: WebSocket, subscription: Subscription) -> None:
+    reported_drops = 0
+    while True:
+        messages = await subscription.next_batch(STREAM_KEEPALIVE_SECONDS)
+        if subscription.dropped > reported_drops:
+            await websocket.send_text(json.dumps({"event": "dropped", "dropped": subscription.dropped - reported_drops}))
+            reported_drops = subscription.dropped
+        for message in messages:
+            await websocket.send_text(message)
+        if not messages:
+            await websocket.send_text(json.dumps({"event": "keepalive"}))
+
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    # Messages from the client are ignored
+    while True:
+        if (await websocket.receive())["type"] == "websocket.disconnect":
+            return
+
+
+def _websocket_token(websocket: WebSocket) -> tuple[Optional[str], Optional[str]]:
+    """
+    Token from the Authorization header, or from the subprotocols `bearer, <token>` for
+    browsers, which cannot set headers on a WebSocket. Returns the token and the subprotocol
+    to accept. Query parameters are not accepted: URLs end up in access logs.
+    """
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:], None
+    subprotocols = websocket.scope.get("subprotocols", [])
+    if len(subprotocols) == 2 and subprotocols[0] == WS_BEARER_SUBPROTOCOL:
+        return subprotocols[1], WS_BEARER_SUBPROTOCOL
+    return None, None
+
+
+@router.websocket("/devices/data/ws")
+async def stream_device_data_ws(websocket: WebSocket, device_ids: List[int] = Query(...)):
+    """
+    WebSocket variant of /devices/data/stream: one JSON text message per reading.
+
+    Authenticate with the Authorization header or, from a browser, with
+    `new WebSocket(url, ["bearer", token])`.
+    """
+    token, subprotocol = _websocket_token(websocket)
+
+    async with db_session_context() as db:
+        try:
+            user = await get_current_user(token or "", db)
+            ids = await check_subscription(db, device_ids, user)
+        except HTTPException as e:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+            return
+
+    await websocket.accept(subprotocol=subprotocol)
+    subscription = telemetry_broadcaster.subscribe(ids)
+    sender = asyncio.create_task(_send_messages(websocket, subscription))
+    receiver = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        telemetry_broadcaster.unsubscribe(subscription)
+        for task in (sender, receiver):
+            try:
+                await task
+            except (asyncio.CancelledError, WebSocketDisconnect, RuntimeError):
+                pass
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Iterable
+
+from dotenv import load_dotenv
+
+from app import metrics
+from app.services.ingest_buffer import ingest_buffer
+from app.utils import as_utc
+
+load_dotenv()
+
+# Messages buffered per subscriber; beyond this the oldest ones are dropped
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 1000))
+
+
+class Subscription:
+    """
+    Bounded message queue of one live-telemetry subscriber.
+
+    Backed by a deque with maxlen, so a slow consumer loses its oldest messages
+    instead of growing memory or slowing down ingestion.
+    """
+
+    def __init__(self, device_ids: Iterable[int], queue_size: int = STREAM_QUEUE_SIZE):
+        self.device_ids = frozenset(device_ids)
+        self._messages: deque[str] = deque(maxlen=queue_size)
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, message: str) -> None:
+        if len(self._messages) == self._messages.maxlen:
+            self.dropped += 1
+        self._messages.append(message)
+        self._ready.set()
+
+    async def next_batch(self, timeout: float) -> list[str]:
+        """Wait up to timeout seconds for messages and return all queued ones (empty on timeout)."""
+        if not self._messages:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        messages = list(self._messages)
+        self._messages.clear()
+        return messages
+
+
+class TelemetryBroadcaster:
+    """
+    Fans committed readings out to live subscribers of their device.
+
+    Fed by the ingestion buffer after commit, so readings from HTTP and MQTT are
+    pushed the same way. Each reading is serialized once, whatever the number of
+    subscribers.
+    """
+
+    def __init__(self, queue_size: int = STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: dict[int, set[Subscription]] = {}
+
+        # Metrics
+        self.published = 0
+        self.delivered = 0
+        self.dropped_from_closed = 0
+
+    def subscribe(self, device_ids: Iterable[int]) -> Subscription:
+        subscription = Subscription(device_ids, self.queue_size)
+        for device_id in subscription.device_ids:
+            self._subscribers.setdefault(device_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for device_id in subscription.device_ids:
+            subscribers = self._subscribers.get(device_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[device_id]
+        self.dropped_from_closed += subscription.dropped
+
+    def publish(self, rows: list[dict]) -> None:
+        """Ingestion listener: queue every reading for the subscribers of its device."""
+        if not self._subscribers:
+            return
+        for row in rows:
+            subscribers = self._subscribers.get(row["device_id"])
+            if not subscribers:
+                continue
+            message = json.dumps({
+                "device_id": row["device_id"],
+                "reading_type": row["reading_type"],
+                "value": row["value"],
+                "timestamp": as_utc(row["timestamp"]).isoformat(),
+            })
+            self.published += 1
+            for subscription in subscribers:
+                subscription.push(message)
+                self.delivered += 1
+
+    def stats(self) -> dict:
+        subscriptions = {s for subscribers in self._subscribers.values() for s in subscribers}
+        return {
+            "subscribers": len(subscriptions),
+            "devices": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped_from_closed + sum(s.dropped for s in subscriptions),
+        }
+
+
+# Process-wide broadcaster fed by the ingestion buffer
+telemetry_broadcaster = TelemetryBroadcaster()
+ingest_buffer.add_listener(telemetry_broadcaster.publish)
+metrics.register("live_telemetry", telemetry_broadcaster.stats)
@@ -0,0 +1,175 @@
+import codecs
+import csv
+import os
+import time
+from typing import AsyncIterable, AsyncIterator, Optional, Union
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import db_session_context
+from app.models.device import Device
+from app.models.device_data import DeviceData, DeviceDataImportIn, DeviceDataImportOut, DeviceDataBatchError
+from app.services.latest_values import latest_values
+from app.services.reading_types import reading_types
+from app.services.rollup_service import RollupService, ROLLUPS_ENABLED
+from app.utils import as_utc
+
+load_dotenv()
+
+# Readings written per transaction (one COPY or executemany each)
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", 10000))
+# Rejected lines reported in detail; further rejections are only counted
+BULK_IMPORT_MAX_ERRORS = int(os.getenv("BULK_IMPORT_MAX_ERRORS", 100))
+
+COPY_COLUMNS = ("device_id", "reading_type_id", "value", "timestamp")
+
+# (line number, validated reading or its validation error)
+ParsedLine = tuple[int, Union[DeviceDataImportIn, ValidationError]]
+
+DEVICE_NOT_FOUND = [{"type": "device_not_found", "loc": ["device_id"], "msg": "Device not found"}]
+
+
+async def decode_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Split a stream of UTF-8 byte chunks (e.g. a request body) into lines."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def parse_ndjson(lines: AsyncIterable[str]) -> AsyncIterator[ParsedLine]:
+    """One reading per non-empty line, as a JSON object."""
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            yield number, DeviceDataImportIn.model_validate_json(line)
+        except ValidationError as e:
+            yield number, e
+
+
+async def parse_csv(lines: AsyncIterable[str]) -> AsyncIterator[ParsedLine]:
+    """One reading per row after a header row naming the columns (device_id, reading_type, value, timestamp)."""
+    number = 0
+    header = None
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        fields = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in fields]
+            continue
+        try:
+            yield number, DeviceDataImportIn.model_validate(dict(zip(header, fields)))
+        except ValidationError as e:
+            yield number, e
+
+
+PARSERS = {"csv": parse_csv, "ndjson": parse_ndjson}
+
+
+class BulkImportService:
+    """
+    Bulk loader for historical telemetry (platform migrations, gateway backfills).
+
+    Readings are validated line by line and written BULK_IMPORT_CHUNK_SIZE at a
+    time, each chunk in one transaction: device ownership is checked with one
+    query per chunk, reading types are interned, rows are sent with COPY on
+    PostgreSQL (executemany elsewhere) and the rollups are updated incrementally.
+    Imported readings bypass the ingestion buffer and its live listeners.
+    """
+
+    @staticmethod
+    async def _valid_devices(db: AsyncSession, device_ids: set[int], user_id: Optional[int]) -> set[int]:
+        query = select(Device.id).where(Device.id.in_(device_ids))
+        if user_id is not None:
+            query = query.where(Device.user_id == user_id)
+        return set((await db.execute(query)).scalars().all())
+
+    @staticmethod
+    async def copy_rows(db: AsyncSession, rows: list[dict]) -> None:
+        """
+        Write devicedata column mappings in the session's transaction: with COPY
+        (asyncpg copy_records_to_table) on PostgreSQL, one executemany elsewhere.
+        """
+        if db.get_bind().dialect.name != "postgresql":
+            await db.execute(insert(DeviceData), rows)
+            return
+        # COPY runs on the driver connection inside the transaction SQLAlchemy already
+        # began on it, so a statement must have run in this session before
+        connection = await (await db.connection()).get_raw_connection()
+        await connection.driver_connection.copy_records_to_table(
+            DeviceData.__tablename__,
+            records=[tuple(row[column] for column in COPY_COLUMNS) for row in rows],
+            columns=COPY_COLUMNS,
+        )
+
+    @staticmethod
+    async def _write_chunk(readings: list[tuple[int, DeviceDataImportIn]], user_id: Optional[int],
+                           errors: list[DeviceDataBatchError]) -> int:
+        """Write one chunk of validated readings, rejecting those of foreign or unknown devices. Returns rows written."""
+        async with db_session_context() as db:
+            devices = await BulkImportService._valid_devices(db, {reading.device_id for _, reading in readings}, user_id)
+            rows = []
+            for number, reading in readings:
+                if reading.device_id not in devices:
+                    if len(errors) < BULK_IMPORT_MAX_ERRORS:
+                        errors.append(DeviceDataBatchError(index=number, errors=DEVICE_NOT_FOUND))
+                    continue
+                rows.append({"device_id": reading.device_id, "reading_type": reading.reading_type,
+                             "value": reading.value, "timestamp": as_utc(reading.timestamp)})
+            if not rows:
+                return 0
+
+            type_ids, created = await reading_types.ids_for(db, {row["reading_type"] for row in rows})
+            await BulkImportService.copy_rows(db, [{**row, "reading_type_id": type_ids[row["reading_type"]]} for row in rows])
+            if ROLLUPS_ENABLED:
+                await RollupService.apply(db, rows)
+            await db.commit()
+        reading_types.remember(created)
+        for device_id in {row["device_id"] for row in rows}:
+            latest_values.forget(device_id)
+        return len(rows)
+
+    @staticmethod
+    async def load(lines: AsyncIterable[str], format: str, user_id: Optional[int] = None) -> DeviceDataImportOut:
+        """
+        Import CSV or NDJSON lines. With user_id, only readings of that user's devices are
+        accepted. Chunks written before a database error stay committed.
+        """
+        started = time.perf_counter()
+        accepted = rejected = 0
+        errors: list[DeviceDataBatchError] = []
+        chunk: list[tuple[int, DeviceDataImportIn]] = []
+
+        async for number, parsed in PARSERS[format](lines):
+            if isinstance(parsed, ValidationError):
+                rejected += 1
+                if len(errors) < BULK_IMPORT_MAX_ERRORS:
+                    errors.append(DeviceDataBatchError(
+                        index=number, errors=parsed.errors(include_url=False, include_context=False)))
+                continue
+            chunk.append((number, parsed))
+            if len(chunk) >= BULK_IMPORT_CHUNK_SIZE:
+                written = await BulkImportService._write_chunk(chunk, user_id, errors)
+                accepted, rejected = accepted + written, rejected + len(chunk) - written
+                chunk = []
+        if chunk:
+            written = await BulkImportService._write_chunk(chunk, user_id, errors)
+            accepted, rejected = accepted + written, rejected + len(chunk) - written
+
+        errors.sort(key=lambda error: error.index)
+        return DeviceDataImportOut(accepted=accepted, rejected=rejected, errors=errors,
+                                   duration_seconds=round(time.perf_counter() - started, 3))
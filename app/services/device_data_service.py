@@ -0,0 +1,400 @@
+import base64
+import binascii
+import os
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+
+from dotenv import load_dotenv
+
+from sqlalchemy import Integer, case, column, func, insert, select, true, tuple_, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.buckets import bucket_epoch, floor_time, ceil_time
+from app.db.session import read_session_context
+from app.models.device_data import DeviceData, DeviceDataIn, DeviceDataOut, DeviceDataBucket, DeviceDataSummary
+from app.services.archive_service import ArchiveService, ARCHIVE_CHUNK_SECONDS, columns_of, merge_columns, to_readings
+from app.services.reading_types import reading_types, has_reading_type
+from app.services.rollup_service import RollupService, ROLLUPS_ENABLED
+from app.utils import now_utc, as_utc, to_micros, from_micros
+
+load_dotenv()
+
+# Rows fetched from the server-side cursor per round trip when streaming exports
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 5000))
+
+
+class DeviceDataService:
+    """
+    Service class for storing and querying device telemetry.
+
+    Keeps the SQL for the devicedata table in one place so that the HTTP
+    routes, the MQTT client and the ingestion buffer persist readings the same way.
+    """
+
+    @staticmethod
+    def to_row(device_id: int, data: DeviceDataIn) -> dict:
+        """Convert an incoming reading into a plain column mapping for bulk inserts."""
+        return {
+            "device_id": device_id,
+            "reading_type": data.reading_type,
+            "value": data.value,
+            "timestamp": data.timestamp or now_utc(),
+        }
+
+    @staticmethod
+    async def insert_rows(db: AsyncSession, rows: list[dict]) -> int:
+        """
+        Store many readings with one multi-row INSERT and one commit.
+        Reading type names are stored as ReadingType IDs, created as needed.
+        The rollups are updated in the same transaction, and every row dict
+        gets the "id" it was stored with.
+        Returns the number of rows written.
+        """
+        if not rows:
+            return 0
+        type_ids, created = await reading_types.ids_for(db, {row["reading_type"] for row in rows})
+        result = await db.execute(
+            insert(DeviceData).returning(DeviceData.id, sort_by_parameter_order=True),
+            [{"device_id": row["device_id"], "reading_type_id": type_ids[row["reading_type"]],
+              "value": row["value"], "timestamp": row["timestamp"]} for row in rows],
+        )
+        for row, row_id in zip(rows, result.scalars().all()):
+            row["id"] = row_id
+        if ROLLUPS_ENABLED:
+            await RollupService.apply(db, rows)
+        await db.commit()
+        reading_types.remember(created)
+        return len(rows)
+
+    @staticmethod
+    def encode_cursor(timestamp: datetime, row_id: int) -> str:
+        """Opaque pagination cursor for the (timestamp, id) position of a reading."""
+        position = f"{as_utc(timestamp).isoformat()}|{row_id}"
+        return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple[datetime, int]:
+        """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+        try:
+            position = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            timestamp, row_id = position.split("|")
+            return datetime.fromisoformat(timestamp), int(row_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+            raise ValueError("Invalid cursor") from e
+
+    @staticmethod
+    async def page(db: AsyncSession, device_id: int, limit: int, after: Optional[tuple[datetime, int]] = None,
+                   newest_first: bool = False, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None) -> tuple[list[DeviceDataOut], Optional[str]]:
+        """
+        One page of a device's readings ordered by (timestamp, id), and the cursor of the next page.
+
+        Keyset pagination: the page starts right after the `after` position instead of
+        skipping rows with OFFSET, so every page costs the same. The returned cursor
+        is None on the last page. Archived readings are merged in.
+        """
+        conditions = [DeviceData.device_id == device_id]
+        if start is not None:
+            conditions.append(DeviceData.timestamp >= start)
+        if end is not None:
+            conditions.append(DeviceData.timestamp <= end)
+        if after is not None:
+            position = tuple_(DeviceData.timestamp, DeviceData.id)
+            conditions.append(position < after if newest_first else position > after)
+
+        if newest_first:
+            order = (DeviceData.timestamp.desc(), DeviceData.id.desc())
+        else:
+            order = (DeviceData.timestamp.asc(), DeviceData.id.asc())
+
+        # Fetch one extra row to learn whether another page follows
+        result = await db.execute(
+            select(DeviceData.id, DeviceData.reading_type_id, DeviceData.value, DeviceData.timestamp)
+            .where(*conditions).order_by(*order).limit(limit + 1)
+        )
+        rows = [(to_micros(timestamp), row_id, type_id, value) for row_id, type_id, value, timestamp in result.all()]
+        archived = await ArchiveService.page(db, device_id, limit + 1, after, newest_first, start, end)
+        if archived:
+            rows = sorted(rows + archived, reverse=newest_first)[:limit + 1]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = DeviceDataService.encode_cursor(from_micros(rows[-1][0]), rows[-1][1])
+        names = await reading_types.names_for(db, {type_id for _, _, type_id, _ in rows})
+        return [DeviceDataOut(reading_type=names[type_id], value=value, timestamp=from_micros(micros))
+                for micros, _, type_id, value in rows], next_cursor
+
+    @staticmethod
+    async def _stream_raw(db: AsyncSession, device_id: int, start: datetime, end: datetime,
+                          include_end: bool) -> AsyncIterator[list]:
+        result = await db.stream(
+            select(DeviceData.timestamp, DeviceData.reading_type_id, DeviceData.value)
+            .where(
+                DeviceData.device_id == device_id,
+                DeviceData.timestamp >= start,
+                DeviceData.timestamp <= end if include_end else DeviceData.timestamp < end,
+            )
+            .order_by(DeviceData.timestamp.asc())
+            .execution_options(yield_per=STREAM_CHUNK_SIZE)
+        )
+        async for rows in result.partitions():
+            names = await reading_types.names_for(db, {type_id for _, type_id, _ in rows})
+            yield [(timestamp, names[type_id], value) for timestamp, type_id, value in rows]
+
+    @staticmethod
+    async def _archived_day(db: AsyncSession, device_id: int, start: datetime, end: datetime,
+                            include_end: bool) -> list[tuple]:
+        """Raw and archived readings of one archived day, merged into (micros, id, type_id, value) order."""
+        result = await db.execute(
+            select(DeviceData.timestamp, DeviceData.id, DeviceData.reading_type_id, DeviceData.value)
+            .where(
+                DeviceData.device_id == device_id,
+                DeviceData.timestamp >= start,
+                DeviceData.timestamp <= end if include_end else DeviceData.timestamp < end,
+            )
+        )
+        hot = columns_of([(to_micros(timestamp), *rest) for timestamp, *rest in result.all()])
+        archived = await ArchiveService.columns(db, [device_id], start, end, include_end)
+        return to_readings(merge_columns(hot, *archived.values()))
+
+    @staticmethod
+    async def stream_range(device_id: int, start: datetime, end: datetime) -> AsyncIterator[list]:
+        """
+        Yield a device's (timestamp, reading_type, value) rows in [start, end], oldest first,
+        in chunks of STREAM_CHUNK_SIZE read from a server-side cursor.
+
+        Uses its own session, so it can run while a streaming response is being sent,
+        and only one chunk is held in memory however large the range is. Archived days
+        are decoded and merged one day at a time. Reads from the replica when one is usable.
+        """
+        async with read_session_context() as db:
+            position = start
+            for day in await ArchiveService.days(db, device_id, start, end):
+                if position < day:
+                    async for chunk in DeviceDataService._stream_raw(db, device_id, position, day, include_end=False):
+                        yield chunk
+                day_end = day + timedelta(seconds=ARCHIVE_CHUNK_SECONDS)
+                readings = await DeviceDataService._archived_day(db, device_id, max(day, position),
+                                                                 min(day_end, end), include_end=day_end > end)
+                names = await reading_types.names_for(db, {type_id for _, _, type_id, _ in readings})
+                for i in range(0, len(readings), STREAM_CHUNK_SIZE):
+                    yield [(from_micros(micros), names[type_id], value)
+                           for micros, _, type_id, value in readings[i:i + STREAM_CHUNK_SIZE]]
+                position = day_end
+            if position <= end:
+                async for chunk in DeviceDataService._stream_raw(db, device_id, position, end, include_end=True):
+                    yield chunk
+
+    @staticmethod
+    async def latest_many(db: AsyncSession, device_ids: list[int], limit: int) -> dict[int, list[DeviceDataOut]]:
+        """
+        The newest `limit` readings of every device, newest first, in one query.
+
+        PostgreSQL runs one index probe with LIMIT per device (LATERAL join); a
+        ROW_NUMBER() window would rank the devices' entire history first. Other
+        databases use ROW_NUMBER() OVER (PARTITION BY device_id). Archived readings
+        are merged in for the devices whose raw readings do not reach past their archive.
+        """
+        order = (DeviceData.timestamp.desc(), DeviceData.id.desc())
+        if db.get_bind().dialect.name == "postgresql":
+            ids = values(column("device_id", Integer), name="ids").data([(device_id,) for device_id in device_ids])
+            latest = (
+                select(DeviceData.id, DeviceData.reading_type_id, DeviceData.value, DeviceData.timestamp)
+                .where(DeviceData.device_id == ids.c.device_id)
+                .order_by(*order)
+                .limit(limit)
+                .lateral()
+            )
+            query = select(ids.c.device_id, latest).select_from(ids).join(latest, true())
+        else:
+            ranked = (
+                select(
+                    DeviceData.device_id,
+                    DeviceData.id,
+                    DeviceData.reading_type_id,
+                    DeviceData.value,
+                    DeviceData.timestamp,
+                    func.row_number().over(partition_by=DeviceData.device_id, order_by=order).label("rank"),
+                )
+                .where(DeviceData.device_id.in_(device_ids))
+                .subquery()
+            )
+            query = (
+                select(ranked.c.device_id, ranked.c.id, ranked.c.reading_type_id, ranked.c.value, ranked.c.timestamp)
+                .where(ranked.c.rank <= limit)
+                .order_by(ranked.c.device_id, ranked.c.rank)
+            )
+
+        rows: dict[int, list[tuple]] = {device_id: [] for device_id in device_ids}
+        for device_id, row_id, type_id, value, timestamp in (await db.execute(query)).all():
+            rows[device_id].append((to_micros(timestamp), row_id, type_id, value))
+        for device_id, archive_end in (await ArchiveService.newest(db, device_ids)).items():
+            latest = rows[device_id]
+            if len(latest) < limit or latest[-1][0] <= to_micros(archive_end):
+                archived = await ArchiveService.page(db, device_id, limit, newest_first=True)
+                rows[device_id] = sorted(latest + archived, reverse=True)[:limit]
+
+        names = await reading_types.names_for(db, {row[2] for latest in rows.values() for row in latest})
+        return {
+            device_id: [DeviceDataOut(reading_type=names[type_id], value=value, timestamp=from_micros(micros))
+                        for micros, _, type_id, value in latest]
+            for device_id, latest in rows.items()
+        }
+
+    @staticmethod
+    async def summarize_many(db: AsyncSession, device_ids: list[int], start: datetime, end: datetime,
+                             reading_type: Optional[str] = None) -> list[DeviceDataSummary]:
+        """
+        Count, min, max, mean and last value per device and reading type in [start, end],
+        in one query. Archived readings are merged in.
+        """
+        conditions = [
+            DeviceData.device_id.in_(device_ids),
+            DeviceData.timestamp >= start,
+            DeviceData.timestamp <= end,
+        ]
+        if reading_type is not None:
+            conditions.append(has_reading_type(reading_type))
+
+        # Rank readings of each device and type, newest first, to pick the last value
+        ranked = (
+            select(
+                DeviceData.device_id,
+                DeviceData.reading_type_id,
+                DeviceData.value,
+                DeviceData.timestamp,
+                func.row_number().over(
+                    partition_by=(DeviceData.device_id, DeviceData.reading_type_id),
+                    order_by=(DeviceData.timestamp.desc(), DeviceData.id.desc()),
+                ).label("rank"),
+            )
+            .where(*conditions)
+            .subquery()
+        )
+        result = await db.execute(
+            select(
+                ranked.c.device_id,
+                ranked.c.reading_type_id,
+                func.count(),
+                func.min(ranked.c.value),
+                func.max(ranked.c.value),
+                func.avg(ranked.c.value),
+                func.max(case((ranked.c.rank == 1, ranked.c.value))),
+                func.max(ranked.c.timestamp),
+            )
+            .group_by(ranked.c.device_id, ranked.c.reading_type_id)
+        )
+        rows = {(row[0], row[1]): row[2:] for row in result.all()}
+        archived = await ArchiveService.summarize(db, device_ids, start, end, reading_type)
+        DeviceDataService._merge_archived(rows, archived)
+
+        names = await reading_types.names_for(db, {type_id for _, type_id in rows})
+        summaries = [
+            DeviceDataSummary(device_id=device_id, reading_type=names[type_id], count=row[0], min=row[1], max=row[2],
+                              mean=row[3], last=row[4], last_timestamp=as_utc(row[5]))
+            for (device_id, type_id), row in rows.items()
+        ]
+        summaries.sort(key=lambda summary: (summary.device_id, summary.reading_type))
+        return summaries
+
+    @staticmethod
+    async def aggregate(db: AsyncSession, device_id: int, start: datetime, end: datetime,
+                        bucket_seconds: int, reading_type: Optional[str] = None) -> list[DeviceDataBucket]:
+        """
+        Min, max, mean, count and last value per reading type and time bucket,
+        computed in the database so only one row per bucket is transferred.
+
+        Buckets are aligned to the epoch and always complete: start and end are
+        widened to bucket boundaries. When the bucket width is a multiple of a
+        rollup resolution, and the rollups cover every reading of the range, the
+        buckets are merged from rollups instead of raw data; otherwise buckets of
+        archived readings are merged into the raw ones.
+        """
+        dialect_name = db.get_bind().dialect.name
+        start = floor_time(start, bucket_seconds)
+        end = ceil_time(end, bucket_seconds)
+
+        resolution = RollupService.resolution_for_bucket(bucket_seconds)
+        if resolution is not None and await RollupService.covers(db, device_id, start, end, resolution, reading_type):
+            query = RollupService.aggregate_query(dialect_name, device_id, start, end,
+                                                  bucket_seconds, resolution, reading_type)
+            return DeviceDataService._to_buckets((await db.execute(query)).all())
+
+        bucket = bucket_epoch(dialect_name, DeviceData.timestamp, bucket_seconds)
+        conditions = [
+            DeviceData.device_id == device_id,
+            DeviceData.timestamp >= start,
+            DeviceData.timestamp < end,
+        ]
+        if reading_type is not None:
+            conditions.append(has_reading_type(reading_type))
+
+        # Rank readings inside each bucket, newest first, to pick the last value
+        ranked = (
+            select(
+                DeviceData.reading_type_id,
+                bucket.label("bucket"),
+                DeviceData.value,
+                DeviceData.timestamp,
+                func.row_number().over(
+                    partition_by=(DeviceData.reading_type_id, bucket),
+                    order_by=(DeviceData.timestamp.desc(), DeviceData.id.desc()),
+                ).label("rank"),
+            )
+            .where(*conditions)
+            .subquery()
+        )
+        result = await db.execute(
+            select(
+                ranked.c.reading_type_id,
+                ranked.c.bucket,
+                func.count(),
+                func.min(ranked.c.value),
+                func.max(ranked.c.value),
+                func.avg(ranked.c.value),
+                func.max(case((ranked.c.rank == 1, ranked.c.value))),
+                func.max(ranked.c.timestamp),
+            )
+            .group_by(ranked.c.reading_type_id, ranked.c.bucket)
+        )
+        rows = {(row[0], int(row[1])): row[2:] for row in result.all()}
+
+        archived = await ArchiveService.aggregate(db, device_id, start, end, bucket_seconds, reading_type)
+        DeviceDataService._merge_archived(rows, archived)
+
+        names = await reading_types.names_for(db, {type_id for type_id, _ in rows})
+        return DeviceDataService._to_buckets([(names[type_id], epoch, *row[:5])
+                                              for (type_id, epoch), row in rows.items()])
+
+    @staticmethod
+    def _merge_archived(rows: dict, archived: dict) -> None:
+        """
+        Merge archived (count, min, max, sum, last, last micros) stats into raw
+        (count, min, max, mean, last, last timestamp) rows with the same keys.
+        The archived last value wins only when it is strictly newer.
+        """
+        for key, (count, low, high, total, last, last_micros) in archived.items():
+            row = rows.get(key)
+            if row is None:
+                rows[key] = (count, low, high, total / count, last, from_micros(last_micros))
+                continue
+            raw_count, raw_low, raw_high, raw_mean, raw_last, raw_last_timestamp = row
+            newer = last_micros > to_micros(raw_last_timestamp)
+            rows[key] = (raw_count + count, min(raw_low, low), max(raw_high, high),
+                         (raw_mean * raw_count + total) / (raw_count + count),
+                         last if newer else raw_last, from_micros(last_micros) if newer else raw_last_timestamp)
+
+    @staticmethod
+    def _to_buckets(rows) -> list[DeviceDataBucket]:
+        """Convert (reading_type, bucket epoch, count, min, max, mean, last) rows into schemas, ordered by type and bucket."""
+        buckets = [
+            DeviceDataBucket(
+                reading_type=row[0],
+                bucket_start=datetime.fromtimestamp(float(row[1]), timezone.utc),
+                count=row[2], min=row[3], max=row[4], mean=row[5], last=row[6],
+            )
+            for row in rows
+        ]
+        buckets.sort(key=lambda bucket: (bucket.reading_type, bucket.bucket_start))
+        return buckets
@@ -0,0 +1,97 @@
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.db.session import is_replica
+from app.models.device import Device, DeviceInfo
+
+load_dotenv()
+
+# Registry settings loaded from environment
+DEVICE_REGISTRY_MAX_SIZE = int(os.getenv("DEVICE_REGISTRY_MAX_SIZE", 100000))
+DEVICE_REGISTRY_TTL_SECONDS = float(os.getenv("DEVICE_REGISTRY_TTL_SECONDS", 60))
+
+
+class DeviceRegistry:
+    """
+    TTL- and size-bounded in-process cache of device metadata.
+
+    Answers "does this device exist, is it active, who owns it" without a
+    database round trip. DeviceService invalidates entries when a device is
+    updated or deleted; the TTL bounds staleness for changes made by other
+    processes.
+    """
+
+    def __init__(self, max_size: int = DEVICE_REGISTRY_MAX_SIZE,
+                 ttl_seconds: float = DEVICE_REGISTRY_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries: OrderedDict[int, tuple[float, DeviceInfo]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_cached(self, device_id: int) -> DeviceInfo | None:
+        """Return the cached metadata for a device without touching the database."""
+        entry = self._entries.get(device_id)
+        if entry is None:
+            return None
+        expires_at, info = entry
+        if expires_at <= time.monotonic():
+            del self._entries[device_id]
+            return None
+        self._entries.move_to_end(device_id)
+        return info
+
+    async def get(self, db: AsyncSession, device_id: int) -> DeviceInfo | None:
+        """Return the metadata for a device, loading it from the database on a miss."""
+        info = self.get_cached(device_id)
+        if info is not None:
+            self.hits += 1
+            return info
+
+        self.misses += 1
+        query = select(Device.id, Device.user_id, Device.is_active, Device.mqtt_enabled,
+                       Device.last_seen).where(Device.id == device_id)
+        row = (await db.execute(query)).one_or_none()
+        if row is None:
+            return None
+        info = DeviceInfo.model_validate(row, from_attributes=True)
+        if not is_replica(db):
+            # A lagging replica could re-cache a device right after it was invalidated
+            self.put(info)
+        return info
+
+    def put(self, info: DeviceInfo) -> None:
+        self._entries[info.id] = (time.monotonic() + self.ttl, info)
+        self._entries.move_to_end(info.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, device_id: int) -> None:
+        """Forget a device so the next lookup reloads it."""
+        if self._entries.pop(device_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+# Process-wide registry shared by the auth dependencies and routes
+device_registry = DeviceRegistry()
+metrics.register("device_registry", device_registry.stats)
@@ -1,11 +1,16 @@
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, select, update
 from datetime import datetime, timezone
 
 from app.models.device import (Device, DeviceCreate, DeviceUpdate, DeviceRead,
                                DeviceReadWithKey, DeviceReadWithHashedKey)
+from app.models.device_data import DeviceDataArchive, DeviceDataRollup
+from app.models.retention import RetentionPolicy
 from app.auth.auth_device_handler import generate_device_key, hash_device_key
+from app.services.device_registry import device_registry
+from app.services.heartbeat import heartbeat_tracker
+from app.services.latest_values import latest_values
 
 class DeviceService:
     """
@@ -41,6 +46,13 @@ class DeviceService:
             raise HTTPException(status_code=404, detail="Device not found")
         return device
 
+    @staticmethod
+    async def get_user_device_ids(db: AsyncSession, device_ids: list[int], user_id: int) -> set[int]:
+        """The subset of device_ids that belong to the user, checked in one query."""
+        query = select(Device.id).where(Device.id.in_(device_ids), Device.user_id == user_id)
+        result = await db.execute(query)
+        return set(result.scalars().all())
+
     @staticmethod
     async def create_device(db: AsyncSession, device_data: DeviceCreate, user_id: int) -> DeviceReadWithKey:
         """Create a new device for a given user, ensuring the name is unique per user."""
@@ -56,7 +68,7 @@ class DeviceService:
 
         #Generate device key and hash it
         device_key = generate_device_key()
-        hashed_device_key = hash_device_key(device_key)
+        hashed_device_key = await hash_device_key(device_key)
 
         device = Device(
             name=device_data.name,
@@ -83,9 +95,16 @@ class DeviceService:
         for field, value in update_data.model_dump(exclude_unset=True).items():
             setattr(device, field, value)
         await db.commit()
+        device_registry.invalidate(device.id)
         await db.refresh(device)
         return DeviceRead.model_validate(device, from_attributes=True)
 
+    @staticmethod
+    async def update_device_key_hash(db: AsyncSession, device_id: int, hashed_device_key: str) -> None:
+        """Replace the stored hash of a device key (used when migrating hash schemes)."""
+        await db.execute(update(Device).where(Device.id == device_id).values(hashed_device_key=hashed_device_key))
+        await db.commit()
+
     @staticmethod
     async def update_device_for_user(db: AsyncSession, device_id: int, user_id: int, update_data: DeviceUpdate) -> DeviceRead:
         """Update a device that belongs to a specific user."""
@@ -96,8 +115,15 @@ class DeviceService:
     @staticmethod
     async def delete_device(db: AsyncSession, device: Device) -> None:
         """Permanently delete a device."""
+        device_id = device.id
+        await db.execute(delete(DeviceDataRollup).where(DeviceDataRollup.device_id == device_id))
+        await db.execute(delete(DeviceDataArchive).where(DeviceDataArchive.device_id == device_id))
+        await db.execute(delete(RetentionPolicy).where(RetentionPolicy.device_id == device_id))
         await db.delete(device)
         await db.commit()
+        device_registry.invalidate(device_id)
+        heartbeat_tracker.forget(device_id)
+        latest_values.forget(device_id)
 
     @staticmethod
     async def delete_device_for_user(db: AsyncSession, device_id: int, user_id: int) -> None:
@@ -112,14 +138,21 @@ class DeviceService:
         if device.mqtt_enabled != mqtt_enabled:
             device.mqtt_enabled = mqtt_enabled
             await db.commit()
+            device_registry.invalidate(device_id)
             await db.refresh(device)
         return DeviceRead.model_validate(device, from_attributes=True)
 
     @staticmethod
-    async def get_mqtt_enabled_topics(db: AsyncSession) -> list:
+    async def get_mqtt_enabled_device_ids(db: AsyncSession) -> set[int]:
+        """Retrieve the IDs of all devices allowed to publish telemetry over MQTT."""
         query = select(Device.id).where(Device.mqtt_enabled == True)
         result = await db.execute(query)
-        topics = [f"devices/{row[0]}" for row in result.all()]
+        return set(result.scalars().all())
+
+    @staticmethod
+    async def get_mqtt_enabled_topics(db: AsyncSession) -> list:
+        device_ids = await DeviceService.get_mqtt_enabled_device_ids(db)
+        topics = [f"devices/{device_id}" for device_id in sorted(device_ids)]
         return topics
 
     @staticmethod
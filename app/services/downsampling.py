@@ -0,0 +1,116 @@
+import os
+from array import array
+from contextlib import aclosing
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.device_data import DeviceDataOut
+from app.services.device_data_service import DeviceDataService
+from app.services.rollup_service import RollupService, ROLLUPS_ENABLED
+from app.utils import as_utc
+
+load_dotenv()
+
+# Upper bound on max_points for LTTB responses
+LTTB_MAX_POINTS = int(os.getenv("LTTB_MAX_POINTS", 10000))
+# Largest series downsampled from raw readings; bigger ranges are downsampled from the finest rollup that fits
+LTTB_MAX_SOURCE_POINTS = int(os.getenv("LTTB_MAX_SOURCE_POINTS", 500000))
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points of the series (x, y),
+    x ascending, that best keep its visual shape. The first and last points are always kept.
+
+    The bucket averages are computed for all buckets at once from cumulative sums;
+    each bucket then needs one vectorized triangle-area pass over its points.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # threshold - 2 buckets over the points between the first and the last one
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = edges[1:] - edges[:-1]
+    mean_x = (cum_x[edges[1:]] - cum_x[edges[:-1]]) / sizes
+    mean_y = (cum_y[edges[1:]] - cum_y[edges[:-1]]) / sizes
+    # The third vertex of each triangle is the mean of the next bucket (the last point for the last bucket)
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+class DownsamplingService:
+    """Service class for shape-preserving downsampling of range queries."""
+
+    @staticmethod
+    def _append(series: dict[str, tuple[array, array]], rows) -> None:
+        for timestamp, reading_type, value in rows:
+            xs, ys = series.setdefault(reading_type, (array("d"), array("d")))
+            xs.append(as_utc(timestamp).timestamp())
+            ys.append(value)
+
+    @staticmethod
+    async def _series(db: AsyncSession, device_id: int, start: datetime, end: datetime,
+                      resolution: Optional[int]) -> dict[str, tuple[array, array]]:
+        """
+        (epoch seconds, values) per reading type, from raw readings or from a rollup resolution.
+        Raises ValueError if there are more than LTTB_MAX_SOURCE_POINTS raw readings.
+        """
+        series: dict[str, tuple[array, array]] = {}
+        if resolution is not None:
+            points = await RollupService.points(db, device_id, start, end, resolution)
+            DownsamplingService._append(series, ((p.timestamp, p.reading_type, p.value) for p in points))
+        else:
+            # Raw readings are read chunk by chunk into compact arrays of 16 bytes per reading
+            count = 0
+            async with aclosing(DeviceDataService.stream_range(device_id, start, end)) as chunks:
+                async for rows in chunks:
+                    count += len(rows)
+                    if count > LTTB_MAX_SOURCE_POINTS:
+                        raise ValueError(f"The range holds more than {LTTB_MAX_SOURCE_POINTS} readings without "
+                                         f"rollups to downsample from. Request a shorter range.")
+                    DownsamplingService._append(series, rows)
+        return series
+
+    @staticmethod
+    async def lttb_points(db: AsyncSession, device_id: int, start: datetime, end: datetime,
+                          max_points: int) -> tuple[list[DeviceDataOut], Optional[int]]:
+        """
+        Downsample the device's readings in [start, end] to about max_points with LTTB,
+        split evenly between reading types. Returns the points, oldest first, and the rollup
+        resolution they were taken from (None for raw readings). Raises ValueError if the range
+        has too many raw readings and no rollups that cover it.
+        """
+        resolution = None
+        if ROLLUPS_ENABLED:
+            resolution = await RollupService.choose_resolution(db, device_id, start, end, LTTB_MAX_SOURCE_POINTS)
+
+        series = await DownsamplingService._series(db, device_id, start, end, resolution)
+        budget = max(3, max_points // max(1, len(series)))
+
+        points = []
+        for reading_type, (xs, ys) in series.items():
+            x = np.frombuffer(xs, dtype=np.float64)
+            y = np.frombuffer(ys, dtype=np.float64)
+            for i in lttb(x, y, budget):
+                points.append(DeviceDataOut(reading_type=reading_type, value=float(y[i]),
+                                            timestamp=datetime.fromtimestamp(x[i], timezone.utc)))
+        points.sort(key=lambda p: (p.timestamp, p.reading_type))
+        return points, resolution
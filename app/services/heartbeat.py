@@ -0,0 +1,144 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import case, update
+
+from app import metrics
+from app.db.session import db_session_context
+from app.models.device import Device
+from app.services.ingest_buffer import ingest_buffer
+from app.utils import now_utc, as_utc
+
+load_dotenv()
+
+# Heartbeat settings loaded from environment
+HEARTBEAT_FLUSH_INTERVAL_SECONDS = float(os.getenv("HEARTBEAT_FLUSH_INTERVAL_SECONDS", 30))
+PRESENCE_TIMEOUT_SECONDS = float(os.getenv("PRESENCE_TIMEOUT_SECONDS", 300))
+
+# Devices updated per UPDATE statement
+FLUSH_CHUNK_SIZE = 1000
+
+
+class HeartbeatTracker:
+    """
+    Tracks when each device last sent telemetry and writes Device.last_seen in bulk.
+
+    Both ingestion paths feed the tracker through the ingestion buffer. Instead of
+    one UPDATE per reading, the latest time per device is kept in memory and
+    flushed every `flush_interval` seconds with one UPDATE per chunk of devices.
+    Presence (online/offline) is answered from memory.
+    """
+
+    def __init__(self, flush_interval: float = HEARTBEAT_FLUSH_INTERVAL_SECONDS,
+                 presence_timeout: float = PRESENCE_TIMEOUT_SECONDS):
+        self.flush_interval = flush_interval
+        self.presence_timeout = timedelta(seconds=presence_timeout)
+        self._last_seen: dict[int, datetime] = {}
+        self._dirty: set[int] = set()
+        self._task: asyncio.Task | None = None
+
+        # Metrics
+        self.flush_count = 0
+        self.devices_flushed = 0
+        self.flush_failures = 0
+
+    def touch(self, device_id: int, seen_at: datetime | None = None) -> None:
+        """Record that a device communicated at seen_at (defaults to now)."""
+        seen_at = seen_at or now_utc()
+        previous = self._last_seen.get(device_id)
+        if previous is None or seen_at > previous:
+            self._last_seen[device_id] = seen_at
+            self._dirty.add(device_id)
+
+    def record_rows(self, rows: list[dict]) -> None:
+        """Ingestion listener: mark every device in a committed batch as seen now."""
+        seen_at = now_utc()
+        for device_id in {row["device_id"] for row in rows}:
+            self.touch(device_id, seen_at)
+
+    def last_seen(self, device_id: int, fallback: datetime | None = None) -> datetime | None:
+        """Latest known contact time, falling back to a value loaded from the database."""
+        seen = self._last_seen.get(device_id)
+        if fallback is not None:
+            fallback = as_utc(fallback)
+            if seen is None or fallback > seen:
+                return fallback
+        return seen
+
+    def is_online(self, last_seen: datetime | None) -> bool:
+        return last_seen is not None and now_utc() - last_seen <= self.presence_timeout
+
+    def forget(self, device_id: int) -> None:
+        """Drop a deleted device from the tracker."""
+        self._last_seen.pop(device_id, None)
+        self._dirty.discard(device_id)
+
+    async def flush(self) -> None:
+        """Write the pending last_seen values with one UPDATE per chunk of devices."""
+        if not self._dirty:
+            return
+        pending = {device_id: self._last_seen[device_id] for device_id in self._dirty}
+        self._dirty = set()
+
+        # Update device rows in ID order, so concurrent flushes of several workers cannot deadlock
+        items = sorted(pending.items())
+        try:
+            async with db_session_context() as db:
+                for i in range(0, len(items), FLUSH_CHUNK_SIZE):
+                    chunk = dict(items[i:i + FLUSH_CHUNK_SIZE])
+                    await db.execute(
+                        update(Device)
+                        .where(Device.id.in_(chunk.keys()))
+                        .values(last_seen=case(chunk, value=Device.id))
+                        .execution_options(synchronize_session=False)
+                    )
+                await db.commit()
+            self.flush_count += 1
+            self.devices_flushed += len(items)
+        except BaseException as e:
+            # Keep the values of devices that still exist so the next flush retries them
+            self._dirty.update(device_id for device_id in pending if device_id in self._last_seen)
+            if not isinstance(e, Exception):
+                raise
+            self.flush_failures += 1
+            print(f"[ERROR] Failed to flush device heartbeats: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[ERROR] Heartbeat flush failed: {e}")
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic flush and write whatever is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "tracked_devices": len(self._last_seen),
+            "pending_updates": len(self._dirty),
+            "flush_count": self.flush_count,
+            "devices_flushed": self.devices_flushed,
+            "flush_failures": self.flush_failures,
+        }
+
+
+# Process-wide tracker fed by the ingestion buffer
+heartbeat_tracker = HeartbeatTracker()
+ingest_buffer.add_listener(heartbeat_tracker.record_rows)
+metrics.register("heartbeat", heartbeat_tracker.stats)
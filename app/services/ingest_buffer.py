@@ -0,0 +1,242 @@
+import asyncio
+import os
+import time
+from typing import Callable
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, SQLAlchemyError, StatementError
+
+from app import metrics
+from app.db.session import db_session_context
+from app.services.device_data_service import DeviceDataService
+
+load_dotenv()
+
+# Buffer settings loaded from environment
+INGEST_BUFFER_ENABLED = os.getenv("INGEST_BUFFER_ENABLED", "1") == "1"
+INGEST_BUFFER_MAX_ROWS = int(os.getenv("INGEST_BUFFER_MAX_ROWS", 1000))
+INGEST_BUFFER_MAX_AGE_MS = int(os.getenv("INGEST_BUFFER_MAX_AGE_MS", 50))
+INGEST_BUFFER_MAX_PENDING = int(os.getenv("INGEST_BUFFER_MAX_PENDING", 10000))
+
+
+def _caused_by_rows(error: Exception) -> bool:
+    """Whether a write failed because of the rows themselves, so other rows may still be written."""
+    if isinstance(error, DBAPIError):
+        return isinstance(error, (IntegrityError, DataError)) and not error.connection_invalidated
+    return isinstance(error, StatementError)
+
+
+class IngestBuffer:
+    """
+    Write-behind buffer for telemetry rows with group commit.
+
+    Both ingestion paths submit DeviceData rows here. A background task writes
+    everything pending in one bulk insert and one commit once `max_rows` rows
+    are queued or the oldest row is `max_age_ms` old. Submitters can wait for
+    the commit that contains their rows (HTTP) or return immediately (MQTT).
+
+    Memory is bounded by `max_pending`: once that many rows are queued,
+    submit() waits until the next flush has drained the buffer.
+    """
+
+    def __init__(self, max_rows: int = INGEST_BUFFER_MAX_ROWS,
+                 max_age_ms: int = INGEST_BUFFER_MAX_AGE_MS,
+                 max_pending: int = INGEST_BUFFER_MAX_PENDING,
+                 enabled: bool = INGEST_BUFFER_ENABLED):
+        self.max_rows = max_rows
+        self.max_age = max_age_ms / 1000
+        self.max_pending = max(max_pending, max_rows)
+        self.enabled = enabled
+
+        # Pending entries: (rows, future or None) per submit() call
+        self._entries: list[tuple[list[dict], asyncio.Future | None]] = []
+        self._pending_rows = 0
+        self._oldest_at: float | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self._has_rows: asyncio.Event | None = None
+        self._full: asyncio.Event | None = None
+        self._drained: asyncio.Event | None = None
+        # Called with the committed rows after every successful write
+        self._listeners: list[Callable[[list[dict]], None]] = []
+
+        # Metrics
+        self.flush_count = 0
+        self.rows_flushed = 0
+        self.rows_failed = 0
+        self.flush_latency_ms = metrics.Histogram()
+
+    def add_listener(self, listener: Callable[[list[dict]], None]) -> None:
+        """Register a callback that receives rows once they are committed (both ingestion paths)."""
+        self._listeners.append(listener)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        """Number of rows waiting to be written."""
+        return self._pending_rows
+
+    async def start(self) -> None:
+        """Start the background flush task on the running event loop."""
+        if not self.enabled or self.running:
+            return
+        self._has_rows = asyncio.Event()
+        self._full = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task after it has flushed whatever is still pending."""
+        if self.running:
+            self._stopping = True
+            self._has_rows.set()
+            self._full.set()
+            await self._task
+        self._task = None
+        await self.flush()
+
+    async def submit(self, rows: list[dict], wait: bool = True) -> None:
+        """
+        Queue rows for the next group commit.
+
+        With wait=True this returns once the rows are committed and re-raises
+        the database error if they could not be written.
+        """
+        if not rows:
+            return
+        if not self.running or self._stopping:
+            # Buffer disabled, not started (scripts) or shutting down: write directly
+            await self._write(rows)
+            return
+
+        # Backpressure: wait for a flush if this would exceed the memory bound
+        while self._pending_rows and self._pending_rows + len(rows) > self.max_pending:
+            self._drained.clear()
+            await self._drained.wait()
+
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self._entries.append((rows, future))
+        self._pending_rows += len(rows)
+        if self._oldest_at is None:
+            self._oldest_at = time.monotonic()
+        self._has_rows.set()
+        if self._pending_rows >= self.max_rows:
+            self._full.set()
+
+        if future is not None:
+            await future
+
+    async def flush(self) -> None:
+        """Write all pending rows now."""
+        entries = self._entries
+        if not entries:
+            return
+        self._entries = []
+        self._pending_rows = 0
+        self._oldest_at = None
+        if self._drained is not None:
+            self._drained.set()
+
+        started = time.perf_counter()
+        rows = [row for entry_rows, _ in entries for row in entry_rows]
+        try:
+            await self._write(rows)
+            self.rows_flushed += len(rows)
+            for _, future in entries:
+                if future is not None and not future.done():
+                    future.set_result(None)
+        except Exception as e:
+            if _caused_by_rows(e):
+                # One bad entry must not fail the whole group: retry each entry on its own
+                await self._write_each(entries)
+            else:
+                # Not a statement error (e.g. the database is unreachable): fail the whole group at
+                # once, instead of retrying every entry against a database that is gone
+                for entry_rows, future in entries:
+                    self._fail(entry_rows, future, e)
+        finally:
+            self.flush_count += 1
+            self.flush_latency_ms.observe((time.perf_counter() - started) * 1000)
+
+    async def _write_each(self, entries: list[tuple[list[dict], asyncio.Future | None]]) -> None:
+        for i, (entry_rows, future) in enumerate(entries):
+            try:
+                await self._write(entry_rows)
+            except Exception as e:
+                self._fail(entry_rows, future, e)
+                if not _caused_by_rows(e):
+                    for rest_rows, rest_future in entries[i + 1:]:
+                        self._fail(rest_rows, rest_future, e)
+                    return
+                continue
+            self.rows_flushed += len(entry_rows)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    def _fail(self, rows: list[dict], future: asyncio.Future | None, error: Exception) -> None:
+        """Count rows that could not be written and report the error to their submitter."""
+        self.rows_failed += len(rows)
+        if future is not None and not future.done():
+            future.set_exception(error)
+        else:
+            print(f"[ERROR] Dropped {len(rows)} buffered rows: {error}")
+
+    async def _run(self) -> None:
+        """Background loop: flush when the buffer is full or its oldest row is too old."""
+        while not self._stopping:
+            if not self._entries:
+                self._has_rows.clear()
+                await self._has_rows.wait()
+                continue
+
+            age = time.monotonic() - self._oldest_at
+            if self._pending_rows < self.max_rows and age < self.max_age:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.max_age - age)
+                except asyncio.TimeoutError:
+                    pass
+
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[ERROR] Ingest buffer flush failed: {e}")
+
+        # Final flush on shutdown
+        await self.flush()
+
+    async def _write(self, rows: list[dict]) -> None:
+        async with db_session_context() as db:
+            try:
+                await DeviceDataService.insert_rows(db, rows)
+            except SQLAlchemyError:
+                await db.rollback()
+                raise
+
+        for listener in self._listeners:
+            try:
+                listener(rows)
+            except Exception as e:
+                print(f"[ERROR] Ingest listener {listener!r} failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "depth": self._pending_rows,
+            "max_pending": self.max_pending,
+            "flush_count": self.flush_count,
+            "rows_flushed": self.rows_flushed,
+            "rows_failed": self.rows_failed,
+            "flush_latency_ms": self.flush_latency_ms.snapshot(),
+        }
+
+
+# Process-wide buffer shared by the HTTP routes and the MQTT client
+ingest_buffer = IngestBuffer()
+metrics.register("ingest_buffer", ingest_buffer.stats)
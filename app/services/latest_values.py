@@ -0,0 +1,267 @@
+import bisect
+import os
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.db.session import db_session_context, is_replica
+from app.models.device_data import DeviceData, DeviceDataOut
+from app.services.archive_service import ArchiveService
+from app.services.ingest_buffer import ingest_buffer
+from app.services.reading_types import reading_types
+from app.utils import to_micros, from_micros
+
+load_dotenv()
+
+# Readings kept per device and reading type; /data/last requests up to this limit are served from memory
+LATEST_BUFFER_SIZE = int(os.getenv("LATEST_BUFFER_SIZE", 50))
+# Devices kept in memory (least recently used ones are dropped)
+LATEST_CACHE_MAX_DEVICES = int(os.getenv("LATEST_CACHE_MAX_DEVICES", 10000))
+# Seconds after which a device is reloaded from the database, to pick up readings written
+# by other processes (e.g. python -m app.db.bulk_load); 0 keeps devices until evicted
+LATEST_CACHE_TTL_SECONDS = float(os.getenv("LATEST_CACHE_TTL_SECONDS", 300))
+
+
+class RingBuffer:
+    """
+    Fixed-size ring buffer of (timestamp, id, value) readings, ordered oldest to newest.
+
+    Backed by three typed arrays instead of Python objects. Appending a reading newer
+    than the newest one is O(1) and overwrites the oldest entry once full; a late
+    reading is inserted at its sorted position.
+    """
+    __slots__ = ("size", "_micros", "_ids", "_values", "_start", "_count")
+
+    def __init__(self, size: int):
+        self.size = size
+        self._micros = array("q", bytes(8 * size))
+        self._ids = array("q", bytes(8 * size))
+        self._values = array("d", bytes(8 * size))
+        self._start = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, micros: int, row_id: int, value: float) -> bool:
+        """
+        Add a reading, ignoring one that is already present.
+        Returns True if an older reading was evicted or the new one was dropped.
+        """
+        if self._count:
+            newest = (self._start + self._count - 1) % self.size
+            key, newest_key = (micros, row_id), (self._micros[newest], self._ids[newest])
+            if key == newest_key:
+                return False
+            if key < newest_key:
+                return self._insert_sorted(micros, row_id, value)
+        if self._count < self.size:
+            index = (self._start + self._count) % self.size
+            self._count += 1
+            evicted = False
+        else:
+            index = self._start
+            self._start = (self._start + 1) % self.size
+            evicted = True
+        self._micros[index] = micros
+        self._ids[index] = row_id
+        self._values[index] = value
+        return evicted
+
+    def _insert_sorted(self, micros: int, row_id: int, value: float) -> bool:
+        entries = self.oldest_first()
+        position = bisect.bisect_left(entries, (micros, row_id))
+        if position < len(entries) and entries[position][:2] == (micros, row_id):
+            return False
+        entries.insert(position, (micros, row_id, value))
+        overflow = len(entries) > self.size
+        self._load(entries[-self.size:])
+        return overflow
+
+    def _load(self, entries: list[tuple[int, int, float]]) -> None:
+        for index, (micros, row_id, value) in enumerate(entries):
+            self._micros[index] = micros
+            self._ids[index] = row_id
+            self._values[index] = value
+        self._start = 0
+        self._count = len(entries)
+
+    def oldest_first(self) -> list[tuple[int, int, float]]:
+        entries = []
+        for offset in range(self._count):
+            index = (self._start + offset) % self.size
+            entries.append((self._micros[index], self._ids[index], self._values[index]))
+        return entries
+
+    def newest(self, n: int) -> list[tuple[int, int, float]]:
+        """Up to n readings, newest first."""
+        entries = []
+        for offset in range(min(n, self._count)):
+            index = (self._start + self._count - 1 - offset) % self.size
+            entries.append((self._micros[index], self._ids[index], self._values[index]))
+        return entries
+
+
+class _DeviceLatest:
+    """Ring buffers of one device, one per reading type."""
+    __slots__ = ("buffers", "ready", "complete", "loaded_at")
+
+    def __init__(self):
+        self.buffers: dict[str, RingBuffer] = {}
+        # False while the initial load from the database is running
+        self.ready = False
+        # True while the buffers hold the device's entire history
+        self.complete = True
+        # time.monotonic() of the end of the load
+        self.loaded_at = 0.0
+
+
+class LatestValuesCache:
+    """
+    Latest readings of recently queried devices, kept in per-device, per-reading-type ring buffers.
+
+    Both ingestion paths feed it through the ingestion buffer after commit. A device is
+    loaded from the database the first time it is queried (cold start or after LRU
+    eviction) with its newest `buffer_size` readings. From then on the union of its
+    buffers always contains the device's newest `buffer_size` readings, so /data/last
+    with limit <= buffer_size is answered without a query.
+
+    Readings written without the ingestion buffer in this process (another server
+    process, the bulk_load CLI) are not seen by the buffers, so a device is reloaded
+    once it has been in memory for `ttl` seconds.
+    """
+
+    def __init__(self, buffer_size: int = LATEST_BUFFER_SIZE, max_devices: int = LATEST_CACHE_MAX_DEVICES,
+                 ttl: float = LATEST_CACHE_TTL_SECONDS):
+        self.buffer_size = buffer_size
+        self.max_devices = max_devices
+        self.ttl = ttl
+        self._devices: OrderedDict[int, _DeviceLatest] = OrderedDict()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def _add(self, device: _DeviceLatest, reading_type: str, micros: int, row_id: int, value: float) -> None:
+        buffer = device.buffers.get(reading_type)
+        if buffer is None:
+            buffer = device.buffers[reading_type] = RingBuffer(self.buffer_size)
+        if buffer.append(micros, row_id, value):
+            device.complete = False
+
+    def record_rows(self, rows: list[dict]) -> None:
+        """Ingestion listener: add committed readings of devices that are in memory."""
+        for row in rows:
+            device = self._devices.get(row["device_id"])
+            if device is not None and "id" in row:
+                self._add(device, row["reading_type"], to_micros(row["timestamp"]), row["id"], row["value"])
+
+    async def _load(self, db: AsyncSession, device_id: int) -> Optional[_DeviceLatest]:
+        if is_replica(db):
+            # Ingestion keeps loaded buffers current from the primary; a lagging replica
+            # could miss readings that were committed before the load
+            async with db_session_context() as primary:
+                return await self._load(primary, device_id)
+
+        device = _DeviceLatest()
+        self._devices[device_id] = device
+        while len(self._devices) > self.max_devices:
+            self._devices.popitem(last=False)
+
+        # Readings committed while this query runs may arrive through record_rows as well;
+        # the ring buffers ignore duplicates
+        try:
+            result = await db.execute(
+                select(DeviceData.id, DeviceData.reading_type_id, DeviceData.value, DeviceData.timestamp)
+                .where(DeviceData.device_id == device_id)
+                .order_by(DeviceData.timestamp.desc(), DeviceData.id.desc())
+                .limit(self.buffer_size)
+            )
+            rows = [(to_micros(timestamp), row_id, type_id, value) for row_id, type_id, value, timestamp in result.all()]
+            archived = await ArchiveService.page(db, device_id, self.buffer_size, newest_first=True)
+            if archived:
+                rows = sorted(rows + archived, reverse=True)[:self.buffer_size]
+            names = await reading_types.names_for(db, {type_id for _, _, type_id, _ in rows})
+        except BaseException:
+            self._devices.pop(device_id, None)
+            raise
+        if self._devices.get(device_id) is not device:
+            # Forgotten or evicted while loading
+            return None
+
+        for micros, row_id, type_id, value in rows:
+            self._add(device, names[type_id], micros, row_id, value)
+        device.complete = len(rows) < self.buffer_size and device.complete
+        device.ready = True
+        device.loaded_at = time.monotonic()
+        return device
+
+    async def latest(self, db: AsyncSession, device_id: int, limit: int) -> Optional[tuple[list[DeviceDataOut], Optional[tuple[datetime, int]]]]:
+        """
+        The device's newest `limit` readings, newest first, and the (timestamp, id) position to
+        continue from if older readings exist. None if the request cannot be answered from memory.
+        """
+        if limit > self.buffer_size:
+            return None
+        device = self._devices.get(device_id)
+        if device is not None and device.ready and self.ttl and time.monotonic() - device.loaded_at > self.ttl:
+            self.expired += 1
+            self._devices.pop(device_id)
+            device = None
+        if device is None:
+            self.misses += 1
+            device = await self._load(db, device_id)
+            if device is None:
+                return None
+        elif not device.ready:
+            # Another request is loading this device
+            self.misses += 1
+            return None
+        else:
+            self.hits += 1
+            self._devices.move_to_end(device_id)
+
+        entries = sorted(
+            ((micros, row_id, value, reading_type)
+             for reading_type, buffer in device.buffers.items()
+             for micros, row_id, value in buffer.newest(limit)),
+            reverse=True,
+        )
+        page = entries[:limit]
+        readings = [DeviceDataOut(reading_type=reading_type, value=value, timestamp=from_micros(micros))
+                    for micros, _, value, reading_type in page]
+
+        more = sum(len(buffer) for buffer in device.buffers.values()) > limit or not device.complete
+        after = (from_micros(page[-1][0]), page[-1][1]) if more and len(page) == limit else None
+        return readings, after
+
+    def forget(self, device_id: int) -> None:
+        self._devices.pop(device_id, None)
+
+    def clear(self) -> None:
+        self._devices.clear()
+
+    def stats(self) -> dict:
+        return {
+            "devices": len(self._devices),
+            "max_devices": self.max_devices,
+            "buffer_size": self.buffer_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+        }
+
+
+# Process-wide cache fed by the ingestion buffer
+latest_values = LatestValuesCache()
+ingest_buffer.add_listener(latest_values.record_rows)
+metrics.register("latest_values", latest_values.stats)
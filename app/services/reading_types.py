@@ -0,0 +1,100 @@
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.models.device_data import DeviceData, ReadingType
+
+
+def has_reading_type(name: str, model=DeviceData):
+    """
+    SQL condition selecting rows of `model` (DeviceData or DeviceDataArchive) of a reading type
+    name. Plain false (not NULL) for an unknown name, so it can also be negated safely.
+    """
+    return model.reading_type_id.in_(select(ReadingType.id).where(ReadingType.name == name))
+
+
+class ReadingTypeCache:
+    """
+    In-process, bidirectional name <-> ID mapping of the ReadingType lookup table.
+
+    Reading types are few and never change once created, so entries never expire
+    and the table is only queried for names or IDs this process has not seen yet.
+    Only committed rows are cached: IDs created inside a transaction are returned
+    to the caller and remembered once it has committed.
+    """
+
+    def __init__(self):
+        self._ids: dict[str, int] = {}
+        self._names: dict[int, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+
+    def remember(self, ids: dict[str, int]) -> None:
+        for name, type_id in ids.items():
+            self._ids[name] = type_id
+            self._names[type_id] = name
+
+    async def ids_for(self, db: AsyncSession, names: Iterable[str]) -> tuple[dict[str, int], dict[str, int]]:
+        """
+        IDs of the given names, creating missing ones in the caller's transaction.
+        Returns (all IDs, newly created IDs); pass the latter to remember() after commit.
+        """
+        names = set(names)
+        missing = [name for name in names if name not in self._ids]
+        self.hits += len(names) - len(missing)
+        if not missing:
+            return {name: self._ids[name] for name in names}, {}
+
+        self.misses += len(missing)
+        result = await db.execute(select(ReadingType.name, ReadingType.id).where(ReadingType.name.in_(missing)))
+        self.remember(dict(result.all()))
+
+        created: dict[str, int] = {}
+        new = [name for name in missing if name not in self._ids]
+        if new:
+            insert_for_dialect = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+            # A concurrent writer may create the same names; ON CONFLICT waits for it and keeps its IDs
+            result = await db.execute(insert_for_dialect(ReadingType.__table__)
+                                      .values([{"name": name} for name in new])
+                                      .on_conflict_do_nothing(index_elements=["name"])
+                                      .returning(ReadingType.name, ReadingType.id))
+            created = dict(result.all())
+            self.created += len(created)
+            taken = [name for name in new if name not in created]
+            if taken:
+                result = await db.execute(select(ReadingType.name, ReadingType.id).where(ReadingType.name.in_(taken)))
+                self.remember(dict(result.all()))
+        return {name: self._ids.get(name) or created[name] for name in names}, created
+
+    async def names_for(self, db: AsyncSession, ids: Iterable[int]) -> dict[int, str]:
+        """Names of the given reading type IDs."""
+        ids = set(ids)
+        missing = [type_id for type_id in ids if type_id not in self._names]
+        self.hits += len(ids) - len(missing)
+        if missing:
+            self.misses += len(missing)
+            result = await db.execute(select(ReadingType.name, ReadingType.id).where(ReadingType.id.in_(missing)))
+            self.remember(dict(result.all()))
+        return {type_id: self._names[type_id] for type_id in ids}
+
+    def clear(self) -> None:
+        self._ids.clear()
+        self._names.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "created": self.created,
+        }
+
+
+# Process-wide cache used on ingestion and reads
+reading_types = ReadingTypeCache()
+metrics.register("reading_types", reading_types.stats)
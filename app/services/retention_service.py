@@ -0,0 +1,274 @@
+import asyncio
+import json
+import os
+import time
+from datetime import timedelta
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, not_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.db.partitioning import partitioning_enabled, expired_partitions, drop_partition
+from app.db.session import db_session_context, engine
+from app.models.device_data import DeviceData, DeviceDataArchive, DeviceDataRollup
+from app.models.retention import RetentionPolicy, RetentionPolicyBase, RetentionPolicyRead
+from app.services.latest_values import latest_values
+from app.services.reading_types import has_reading_type
+from app.utils import now_utc
+
+load_dotenv()
+
+# Global policies as a JSON list, e.g. '[{"raw_days": 30, "rollup_1m_days": 365}, {"reading_type": "gps", "raw_days": 7}]'
+RETENTION_POLICIES = os.getenv("RETENTION_POLICIES", "[]")
+# How often the retention job runs; 0 disables it
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", 3600))
+# Rows deleted per statement and transaction, and the pause between batches
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 5000))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", 0.05))
+
+# Policy field holding the retention of each rollup resolution
+ROLLUP_RETENTION_FIELDS = {60: "rollup_1m_days", 3600: "rollup_1h_days", 86400: "rollup_1d_days"}
+
+GLOBAL_POLICIES = [RetentionPolicyRead.model_validate(policy) for policy in json.loads(RETENTION_POLICIES)]
+
+
+def _specificity(policy: RetentionPolicyRead) -> int:
+    """Device policies beat reading-type policies, which beat the global default."""
+    return (2 if policy.device_id is not None else 0) + (1 if policy.reading_type is not None else 0)
+
+
+def _overlaps(a: RetentionPolicyRead, b: RetentionPolicyRead) -> bool:
+    return (a.device_id is None or b.device_id is None or a.device_id == b.device_id) and \
+        (a.reading_type is None or b.reading_type is None or a.reading_type == b.reading_type)
+
+
+def _scope(model, policy: RetentionPolicyRead) -> list:
+    conditions = []
+    if policy.device_id is not None:
+        conditions.append(model.device_id == policy.device_id)
+    if policy.reading_type is not None:
+        conditions.append(model.reading_type == policy.reading_type if model is DeviceDataRollup
+                          else has_reading_type(policy.reading_type, model))
+    return conditions
+
+
+def _governed_rows(model, policy: RetentionPolicyRead, policies: list[RetentionPolicyRead]) -> list:
+    """Conditions selecting the rows this policy decides about: its scope minus more specific policies."""
+    conditions = _scope(model, policy)
+    for other in policies:
+        if _specificity(other) > _specificity(policy) and _overlaps(policy, other):
+            conditions.append(not_(and_(*_scope(model, other))))
+    return conditions
+
+
+class RetentionService:
+    """
+    Service class for retention policies and for purging expired telemetry.
+
+    Policies can be global (from RETENTION_POLICIES) or per device (set by the
+    owner). The most specific policy covering a row decides how long it is kept.
+    Expired rows are deleted in small batches, each in its own short transaction,
+    so the purge never holds long locks or starves ingestion.
+    """
+
+    @staticmethod
+    async def get_policies(db: AsyncSession) -> list[RetentionPolicyRead]:
+        """All global and per-device policies."""
+        result = await db.execute(select(RetentionPolicy))
+        return GLOBAL_POLICIES + [RetentionPolicyRead.model_validate(p, from_attributes=True)
+                                  for p in result.scalars().all()]
+
+    @staticmethod
+    async def get_device_policies(db: AsyncSession, device_id: int) -> list[RetentionPolicy]:
+        result = await db.execute(select(RetentionPolicy).where(RetentionPolicy.device_id == device_id))
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def set_device_policy(db: AsyncSession, device_id: int, policy: RetentionPolicyBase) -> RetentionPolicy:
+        """
+        Create or replace the device's policy for policy.reading_type, with one upsert,
+        so concurrent requests cannot create two policies for the same scope.
+        """
+        values = {"device_id": device_id, **policy.model_dump()}
+        insert_for_dialect = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        stmt = insert_for_dialect(RetentionPolicy).values(values)
+        if policy.reading_type is not None:
+            stmt = stmt.on_conflict_do_update(index_elements=["device_id", "reading_type"], set_=values)
+        else:
+            stmt = stmt.on_conflict_do_update(index_elements=["device_id"],
+                                              index_where=RetentionPolicy.reading_type.is_(None), set_=values)
+        await db.execute(stmt)
+        await db.commit()
+        result = await db.execute(select(RetentionPolicy).where(
+            RetentionPolicy.device_id == device_id,
+            RetentionPolicy.reading_type == policy.reading_type if policy.reading_type is not None
+            else RetentionPolicy.reading_type.is_(None),
+        ).execution_options(populate_existing=True))
+        return result.scalars().one()
+
+    @staticmethod
+    async def delete_device_policy(db: AsyncSession, device_id: int, reading_type: Optional[str] = None) -> None:
+        result = await db.execute(
+            delete(RetentionPolicy)
+            .where(
+                RetentionPolicy.device_id == device_id,
+                RetentionPolicy.reading_type == reading_type if reading_type is not None
+                else RetentionPolicy.reading_type.is_(None),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Retention policy not found")
+
+    @staticmethod
+    async def _delete_in_batches(model, key_columns: list, conditions: list) -> int:
+        """Delete matching rows RETENTION_BATCH_SIZE at a time, committing after every batch."""
+        deleted = 0
+        while True:
+            batch = select(*key_columns).where(*conditions).limit(RETENTION_BATCH_SIZE)
+            key = key_columns[0] if len(key_columns) == 1 else tuple_(*key_columns)
+            async with db_session_context() as db:
+                result = await db.execute(
+                    delete(model).where(key.in_(batch)).execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            deleted += result.rowcount
+            if result.rowcount < RETENTION_BATCH_SIZE:
+                return deleted
+            await asyncio.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+
+    @staticmethod
+    async def _drop_expired_partitions(policies: list[RetentionPolicyRead]) -> tuple[list[str], int]:
+        """
+        Drop whole devicedata partitions whose every row is expired under every policy.
+        Only possible when a global default exists and no policy keeps raw data forever.
+        """
+        has_default = any(_specificity(p) == 0 for p in policies)
+        if not partitioning_enabled(engine.dialect) or not has_default or any(p.raw_days is None for p in policies):
+            return [], 0
+        cutoff = now_utc() - timedelta(days=max(p.raw_days for p in policies))
+        async with engine.begin() as conn:
+            partitions = await conn.run_sync(expired_partitions, cutoff)
+        for name, _ in partitions:
+            # One short transaction per partition
+            async with engine.begin() as conn:
+                await conn.run_sync(drop_partition, name)
+        return [name for name, _ in partitions], sum(rows for _, rows in partitions)
+
+    @staticmethod
+    async def purge() -> dict:
+        """Delete all expired telemetry once and return a report of what was reclaimed."""
+        started = time.perf_counter()
+        now = now_utc()
+        async with db_session_context() as db:
+            policies = await RetentionService.get_policies(db)
+
+        partitions, partition_rows = await RetentionService._drop_expired_partitions(policies)
+
+        raw_deleted = 0
+        blocks_deleted = 0
+        rollups_deleted = 0
+        for policy in policies:
+            if policy.raw_days is not None:
+                raw_cutoff = now - timedelta(days=policy.raw_days)
+                raw_deleted += await RetentionService._delete_in_batches(
+                    DeviceData, [DeviceData.id],
+                    [DeviceData.timestamp < raw_cutoff, *_governed_rows(DeviceData, policy, policies)],
+                )
+                # Archive blocks are dropped once their newest reading has expired
+                blocks_deleted += await RetentionService._delete_in_batches(
+                    DeviceDataArchive, [DeviceDataArchive.id],
+                    [DeviceDataArchive.end < raw_cutoff, *_governed_rows(DeviceDataArchive, policy, policies)],
+                )
+            for resolution, field in ROLLUP_RETENTION_FIELDS.items():
+                days = getattr(policy, field)
+                if days is None:
+                    continue
+                rollups_deleted += await RetentionService._delete_in_batches(
+                    DeviceDataRollup,
+                    [DeviceDataRollup.device_id, DeviceDataRollup.reading_type,
+                     DeviceDataRollup.resolution, DeviceDataRollup.bucket_start],
+                    [DeviceDataRollup.resolution == resolution,
+                     DeviceDataRollup.bucket_start < now - timedelta(days=days),
+                     *_governed_rows(DeviceDataRollup, policy, policies)],
+                )
+
+        if raw_deleted or blocks_deleted or partitions:
+            # Cached latest readings of long-idle devices may have been purged
+            latest_values.clear()
+
+        return {
+            "raw_rows_deleted": raw_deleted,
+            "archive_blocks_deleted": blocks_deleted,
+            "rollup_rows_deleted": rollups_deleted,
+            "partitions_dropped": partitions,
+            "partition_rows_dropped": partition_rows,
+            "duration_seconds": round(time.perf_counter() - started, 3),
+            "finished_at": now_utc().isoformat(),
+        }
+
+
+class RetentionJob:
+    """Runs RetentionService.purge every `interval` seconds and keeps the last report."""
+
+    def __init__(self, interval: float = RETENTION_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+        # Metrics
+        self.runs = 0
+        self.raw_rows_deleted = 0
+        self.rollup_rows_deleted = 0
+        self.last_report: dict | None = None
+
+    async def run_once(self) -> dict:
+        report = await RetentionService.purge()
+        self.runs += 1
+        self.raw_rows_deleted += report["raw_rows_deleted"] + report["partition_rows_dropped"]
+        self.rollup_rows_deleted += report["rollup_rows_deleted"]
+        self.last_report = report
+        print(f"ℹ️ Retention reclaimed {report['raw_rows_deleted']} raw rows, "
+              f"{report['archive_blocks_deleted']} archive blocks, "
+              f"{report['rollup_rows_deleted']} rollup rows and {len(report['partitions_dropped'])} partitions "
+              f"(~{report['partition_rows_dropped']} rows) "
+              f"in {report['duration_seconds']}s")
+        return report
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[ERROR] Retention job failed: {e}")
+
+    async def start(self) -> None:
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "raw_rows_deleted": self.raw_rows_deleted,
+            "rollup_rows_deleted": self.rollup_rows_deleted,
+            "last_run": self.last_report,
+        }
+
+
+retention_job = RetentionJob()
+metrics.register("retention", retention_job.stats)
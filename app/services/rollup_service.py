@@ -0,0 +1,317 @@
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import case, delete, distinct, func, insert, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.buckets import bucket_epoch, epoch_to_timestamp, floor_time, ceil_time
+from app.models.device_data import DeviceData, DeviceDataArchive, DeviceDataRollup, DeviceDataOut, ReadingType
+from app.services.archive_service import ArchiveService, group_stats
+from app.services.reading_types import reading_types, has_reading_type
+from app.utils import as_utc, from_micros
+
+load_dotenv()
+
+# Maintain rollups on ingestion and use them for aggregation and max_points range queries
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "1") == "1"
+
+# Rollup bucket widths in seconds, finest first
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+RESOLUTION_LABELS = {60: "1m", 3600: "1h", 86400: "1d"}
+
+# Rollup rows per upsert statement (PostgreSQL allows at most 32767 bind parameters)
+UPSERT_CHUNK_SIZE = 1000
+
+
+class RollupService:
+    """
+    Maintains and queries the DeviceDataRollup table.
+
+    Every batch of readings written through DeviceDataService.insert_rows is folded
+    into its 1m/1h/1d buckets by an upsert that merges count, sum, min, max and the
+    latest value. The merge gives the same result in any arrival order, so a late
+    reading only updates the buckets it falls into.
+    """
+
+    @staticmethod
+    def summarize(rows: list[dict]) -> list[dict]:
+        """Pre-aggregate raw reading rows into one rollup row per device, type, resolution and bucket."""
+        groups: dict[tuple, dict] = {}
+        for row in rows:
+            timestamp = as_utc(row["timestamp"])
+            epoch = timestamp.timestamp()
+            value = row["value"]
+            for resolution in ROLLUP_RESOLUTIONS:
+                bucket_start = datetime.fromtimestamp(epoch // resolution * resolution, timezone.utc)
+                key = (row["device_id"], row["reading_type"], resolution, bucket_start)
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = {
+                        "device_id": row["device_id"],
+                        "reading_type": row["reading_type"],
+                        "resolution": resolution,
+                        "bucket_start": bucket_start,
+                        "count": 1,
+                        "sum": value,
+                        "min": value,
+                        "max": value,
+                        "last_value": value,
+                        "last_timestamp": timestamp,
+                    }
+                    continue
+                group["count"] += 1
+                group["sum"] += value
+                group["min"] = min(group["min"], value)
+                group["max"] = max(group["max"], value)
+                if timestamp >= group["last_timestamp"]:
+                    group["last_value"] = value
+                    group["last_timestamp"] = timestamp
+        return list(groups.values())
+
+    @staticmethod
+    async def apply(db: AsyncSession, rows: list[dict]) -> None:
+        """Merge a batch of raw readings into the rollups. Runs in the caller's transaction."""
+        await RollupService._upsert(db, RollupService.summarize(rows))
+
+    @staticmethod
+    async def _upsert(db: AsyncSession, summary: list[dict]) -> None:
+        """Merge pre-aggregated rollup rows into the rollup table."""
+        if not summary:
+            return
+        # Lock rollup rows in key order, so concurrent writers wait for each other instead of deadlocking
+        summary.sort(key=lambda row: (row["device_id"], row["reading_type"], row["resolution"], row["bucket_start"]))
+        insert_for_dialect = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        table = DeviceDataRollup.__table__
+        for i in range(0, len(summary), UPSERT_CHUNK_SIZE):
+            stmt = insert_for_dialect(table).values(summary[i:i + UPSERT_CHUNK_SIZE])
+            new = stmt.excluded
+            newer = new.last_timestamp >= table.c.last_timestamp
+            await db.execute(stmt.on_conflict_do_update(
+                index_elements=["device_id", "reading_type", "resolution", "bucket_start"],
+                set_={
+                    "count": table.c.count + new.count,
+                    "sum": table.c.sum + new.sum,
+                    "min": case((new.min < table.c.min, new.min), else_=table.c.min),
+                    "max": case((new.max > table.c.max, new.max), else_=table.c.max),
+                    "last_value": case((newer, new.last_value), else_=table.c.last_value),
+                    "last_timestamp": case((newer, new.last_timestamp), else_=table.c.last_timestamp),
+                },
+            ))
+
+    @staticmethod
+    async def rebuild(db: AsyncSession, start: datetime, end: datetime, device_id: Optional[int] = None) -> None:
+        """
+        Recompute the rollups of all whole days overlapping [start, end) from raw data.
+        Use after raw readings were written or deleted outside DeviceDataService.insert_rows
+        (see app.db.rebuild_rollups). Archived readings are decoded and merged in.
+
+        Rollups keep the reading type name: they are orders of magnitude fewer
+        rows than raw readings, so the lookup table join is only paid here.
+        """
+        dialect_name = db.get_bind().dialect.name
+        start = floor_time(start, ROLLUP_RESOLUTIONS[-1])
+        end = ceil_time(end, ROLLUP_RESOLUTIONS[-1])
+
+        raw_filter = [DeviceData.timestamp >= start, DeviceData.timestamp < end]
+        rollup_filter = [DeviceDataRollup.bucket_start >= start, DeviceDataRollup.bucket_start < end]
+        if device_id is not None:
+            raw_filter.append(DeviceData.device_id == device_id)
+            rollup_filter.append(DeviceDataRollup.device_id == device_id)
+
+        await db.execute(delete(DeviceDataRollup).where(*rollup_filter))
+        for resolution in ROLLUP_RESOLUTIONS:
+            bucket = bucket_epoch(dialect_name, DeviceData.timestamp, resolution)
+            ranked = (
+                select(
+                    DeviceData.device_id,
+                    ReadingType.name.label("reading_type"),
+                    bucket.label("bucket"),
+                    DeviceData.value,
+                    DeviceData.timestamp,
+                    func.row_number().over(
+                        partition_by=(DeviceData.device_id, DeviceData.reading_type_id, bucket),
+                        order_by=DeviceData.timestamp.desc(),
+                    ).label("rank"),
+                )
+                .join(ReadingType, ReadingType.id == DeviceData.reading_type_id)
+                .where(*raw_filter)
+                .subquery()
+            )
+            await db.execute(insert(DeviceDataRollup).from_select(
+                ["device_id", "reading_type", "resolution", "bucket_start",
+                 "count", "sum", "min", "max", "last_value", "last_timestamp"],
+                select(
+                    ranked.c.device_id,
+                    ranked.c.reading_type,
+                    literal(resolution),
+                    epoch_to_timestamp(dialect_name, ranked.c.bucket),
+                    func.count(),
+                    func.sum(ranked.c.value),
+                    func.min(ranked.c.value),
+                    func.max(ranked.c.value),
+                    func.max(case((ranked.c.rank == 1, ranked.c.value))),
+                    func.max(ranked.c.timestamp),
+                ).group_by(ranked.c.device_id, ranked.c.reading_type, ranked.c.bucket),
+            ))
+
+        # Archived readings are no longer in devicedata: fold their blocks into the rebuilt buckets
+        if device_id is not None:
+            archived_devices = [device_id]
+        else:
+            result = await db.execute(select(distinct(DeviceDataArchive.device_id))
+                                      .where(DeviceDataArchive.end >= start, DeviceDataArchive.start < end))
+            archived_devices = result.scalars().all()
+        archived = await ArchiveService.columns(db, archived_devices, start, end, include_end=False)
+        for archived_device_id, (micros, ids, type_ids, values) in archived.items():
+            names = await reading_types.names_for(db, type_ids.tolist())
+            summary = []
+            for resolution in ROLLUP_RESOLUTIONS:
+                epochs = micros // (resolution * 1_000_000) * resolution
+                stats = group_stats([type_ids, epochs], micros, ids, values)
+                for type_id, epoch, count, low, high, total, last, last_micros in stats:
+                    summary.append({
+                        "device_id": archived_device_id,
+                        "reading_type": names[type_id],
+                        "resolution": resolution,
+                        "bucket_start": from_micros(epoch * 1_000_000),
+                        "count": count,
+                        "sum": total,
+                        "min": low,
+                        "max": high,
+                        "last_value": last,
+                        "last_timestamp": from_micros(last_micros),
+                    })
+            await RollupService._upsert(db, summary)
+        await db.commit()
+
+    @staticmethod
+    async def covers(db: AsyncSession, device_id: int, start: datetime, end: datetime, resolution: int,
+                     reading_type: Optional[str] = None) -> bool:
+        """
+        Whether the rollups of `resolution` account for every raw and archived reading in [start, end).
+
+        They do not for readings stored before rollups were enabled (until rebuilt) or when
+        retention keeps raw data longer than rollups. Costs an index-only count of the raw
+        range instead of aggregating it.
+        """
+        rollup_filter = [
+            DeviceDataRollup.device_id == device_id,
+            DeviceDataRollup.resolution == resolution,
+            DeviceDataRollup.bucket_start >= start,
+            DeviceDataRollup.bucket_start < end,
+        ]
+        raw_filter = [DeviceData.device_id == device_id, DeviceData.timestamp >= start, DeviceData.timestamp < end]
+        if reading_type is not None:
+            rollup_filter.append(DeviceDataRollup.reading_type == reading_type)
+            raw_filter.append(has_reading_type(reading_type))
+        rolled_up = (await db.execute(select(func.sum(DeviceDataRollup.count)).where(*rollup_filter))).scalar() or 0
+        raw = (await db.execute(select(func.count()).select_from(DeviceData).where(*raw_filter))).scalar_one()
+        return rolled_up >= raw + await ArchiveService.count(db, device_id, start, end, reading_type)
+
+    @staticmethod
+    def resolution_for_bucket(bucket_seconds: int) -> Optional[int]:
+        """Coarsest rollup resolution that evenly divides a bucket width, or None if none does."""
+        if not ROLLUPS_ENABLED:
+            return None
+        fitting = [resolution for resolution in ROLLUP_RESOLUTIONS if bucket_seconds % resolution == 0]
+        return fitting[-1] if fitting else None
+
+    @staticmethod
+    def aggregate_query(dialect_name: str, device_id: int, start: datetime, end: datetime,
+                        bucket_seconds: int, resolution: int, reading_type: Optional[str] = None):
+        """
+        Query merging rollup buckets into wider buckets of bucket_seconds over [start, end).
+        Returns the same columns as the raw aggregation in DeviceDataService.aggregate.
+        """
+        rollup = DeviceDataRollup
+        bucket = bucket_epoch(dialect_name, rollup.bucket_start, bucket_seconds)
+        conditions = [
+            rollup.device_id == device_id,
+            rollup.resolution == resolution,
+            rollup.bucket_start >= start,
+            rollup.bucket_start < end,
+        ]
+        if reading_type is not None:
+            conditions.append(rollup.reading_type == reading_type)
+
+        ranked = (
+            select(
+                rollup.reading_type,
+                bucket.label("bucket"),
+                rollup.count,
+                rollup.sum,
+                rollup.min,
+                rollup.max,
+                rollup.last_value,
+                func.row_number().over(
+                    partition_by=(rollup.reading_type, bucket),
+                    order_by=rollup.last_timestamp.desc(),
+                ).label("rank"),
+            )
+            .where(*conditions)
+            .subquery()
+        )
+        return (
+            select(
+                ranked.c.reading_type,
+                ranked.c.bucket,
+                func.sum(ranked.c.count),
+                func.min(ranked.c.min),
+                func.max(ranked.c.max),
+                func.sum(ranked.c.sum) / func.sum(ranked.c.count),
+                func.max(case((ranked.c.rank == 1, ranked.c.last_value))),
+            )
+            .group_by(ranked.c.reading_type, ranked.c.bucket)
+            .order_by(ranked.c.reading_type, ranked.c.bucket)
+        )
+
+    @staticmethod
+    async def choose_resolution(db: AsyncSession, device_id: int, start: datetime, end: datetime,
+                                max_points: int) -> Optional[int]:
+        """
+        Finest resolution whose number of points in [start, end] fits in max_points.
+        Returns None for raw readings, otherwise a rollup resolution (the coarsest if none fits).
+        Point counts are estimated from the rollups themselves.
+        """
+        result = await db.execute(
+            select(DeviceDataRollup.resolution, func.count(), func.sum(DeviceDataRollup.count))
+            .where(
+                DeviceDataRollup.device_id == device_id,
+                DeviceDataRollup.bucket_start >= floor_time(start, ROLLUP_RESOLUTIONS[0]),
+                DeviceDataRollup.bucket_start <= end,
+            )
+            .group_by(DeviceDataRollup.resolution)
+        )
+        counts = {resolution: (buckets, int(readings)) for resolution, buckets, readings in result.all()}
+
+        # Readings with no rollups (e.g. from before rollups were enabled) are served raw
+        if counts.get(ROLLUP_RESOLUTIONS[0], (0, 0))[1] <= max_points:
+            return None
+        for resolution in ROLLUP_RESOLUTIONS:
+            if counts.get(resolution, (0, 0))[0] <= max_points:
+                return resolution
+        return ROLLUP_RESOLUTIONS[-1]
+
+    @staticmethod
+    async def points(db: AsyncSession, device_id: int, start: datetime, end: datetime,
+                     resolution: int) -> list[DeviceDataOut]:
+        """Rollup buckets overlapping [start, end] as chart points: the bucket mean at the bucket start."""
+        result = await db.execute(
+            select(DeviceDataRollup)
+            .where(
+                DeviceDataRollup.device_id == device_id,
+                DeviceDataRollup.resolution == resolution,
+                DeviceDataRollup.bucket_start >= floor_time(start, resolution),
+                DeviceDataRollup.bucket_start <= end,
+            )
+            .order_by(DeviceDataRollup.bucket_start, DeviceDataRollup.reading_type)
+        )
+        return [
+            DeviceDataOut(reading_type=rollup.reading_type, value=rollup.sum / rollup.count,
+                          timestamp=as_utc(rollup.bucket_start))
+            for rollup in result.scalars().all()
+        ]
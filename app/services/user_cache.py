@@ -0,0 +1,99 @@
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.models.user import User, UserInDB
+
+load_dotenv()
+
+# Cache settings loaded from environment
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", 10000))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 30))
+
+
+class UserCache:
+    """
+    TTL- and size-bounded in-process cache of authenticated users, by username.
+
+    Lets get_current_user resolve the subject of a token without a database
+    round trip. UserService invalidates a user when it is updated, deleted or
+    changes its password; the short TTL bounds staleness for changes made by
+    other processes.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_MAX_SIZE, ttl_seconds: float = USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, UserInDB]] = OrderedDict()
+        # User ID -> cached username, so invalidation by ID also covers a renamed user
+        self._usernames: dict[int, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _pop(self, username: str) -> None:
+        entry = self._entries.pop(username, None)
+        if entry is not None:
+            self._usernames.pop(entry[1].id, None)
+
+    async def get(self, db: AsyncSession, username: str) -> UserInDB | None:
+        """Return the user with this username, loading it from the database on a miss."""
+        entry = self._entries.get(username)
+        if entry is not None:
+            expires_at, user = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return user
+            self._pop(username)
+
+        self.misses += 1
+        result = await db.execute(select(User).where(User.username == username))
+        row = result.scalar_one_or_none()
+        if row is None:
+            return None
+        user = UserInDB.model_validate(row, from_attributes=True)
+        self.put(user)
+        return user
+
+    def put(self, user: UserInDB) -> None:
+        self._pop(user.username)
+        previous = self._usernames.get(user.id)
+        if previous is not None:
+            self._pop(previous)
+        self._entries[user.username] = (time.monotonic() + self.ttl, user)
+        self._usernames[user.id] = user.username
+        while len(self._entries) > self.max_size:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._usernames.pop(evicted.id, None)
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget a user so the next request reloads it."""
+        username = self._usernames.get(user_id)
+        if username is not None:
+            self._pop(username)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._usernames.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+# Process-wide cache used by get_current_user
+user_cache = UserCache()
+metrics.register("user_cache", user_cache.stats)
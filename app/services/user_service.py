@@ -1,13 +1,12 @@
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from passlib.context import CryptContext
 from fastapi import HTTPException
 from typing import Optional
 
+from app.auth.hashing import hash_secret, verify_secret
 from app.models.user import User, UserCreate, UserUpdate, UserRead
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.services.user_cache import user_cache
 
 
 class UserService:
@@ -58,12 +57,13 @@ class UserService:
         if await UserService.get_user(db, user_data.email, by='email'):
             raise HTTPException(status_code=400, detail="Email already registered")
 
+        hashed_password = await hash_secret(user_data.password)
         try:
 
             new_user = User(
                 email=user_data.email,
                 username=user_data.username,
-                hashed_password=pwd_context.hash(user_data.password)
+                hashed_password=hashed_password
             )
             db.add(new_user)
             await db.commit()
@@ -106,6 +106,7 @@ class UserService:
 
         try:
             await db.commit()
+            user_cache.invalidate(user.id)
             await db.refresh(user)
             return UserRead.model_validate(user)
         except SQLAlchemyError:
@@ -120,11 +121,14 @@ class UserService:
             new_password: str,
     ) -> None:
         user = await UserService.get_user(db, user_id, by="id")
-        if not UserService.verify_password(old_password, user_id, user.hashed_password):
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        if not await verify_secret(old_password, user.hashed_password):
             raise HTTPException(status_code=400, detail="Current password is incorrect")
 
-        user.hashed_password = pwd_context.hash(new_password)
+        user.hashed_password = await hash_secret(new_password)
         await db.commit()
+        user_cache.invalidate(user_id)
 
     @staticmethod
     async def delete_user(db: AsyncSession, user_id: int) -> None:
@@ -140,6 +144,7 @@ class UserService:
         try:
             await db.delete(user)
             await db.commit()
+            user_cache.invalidate(user_id)
         except SQLAlchemyError:
             await db.rollback()
             raise HTTPException(status_code=500, detail="Failed to delete user")
@@ -150,4 +155,6 @@ class UserService:
         query = select(User.hashed_password).where(User.id == user_id)
         result = await db.execute(query)
         hashed_password = result.scalar_one_or_none()
-        return pwd_context.verify(plain_password, hashed_password)
+        if hashed_password is None:
+            return False
+        return await verify_secret(plain_password, hashed_password)
@@ -1,4 +1,32 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
 
 def now_utc():
-    return datetime.now(timezone.utc)
\ No newline at end of file
+    return datetime.now(timezone.utc)
+
+def as_utc(dt: datetime) -> datetime:
+    """Return an aware UTC datetime. Naive values (e.g. read back from SQLite) are assumed to be UTC."""
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+def to_micros(timestamp: datetime) -> int:
+    """Exact integer microseconds since the epoch (floats would round some timestamps)."""
+    return (as_utc(timestamp) - EPOCH) // MICROSECOND
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + int(micros) * MICROSECOND
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_duration(value: str) -> int:
+    """Parse a duration such as "30s", "5m", "1h" or "7d" into seconds. Raises ValueError if invalid."""
+    value = value.strip().lower()
+    if len(value) < 2 or value[-1] not in _DURATION_UNITS or not value[:-1].isdigit():
+        raise ValueError(f"Invalid duration: {value!r}")
+    seconds = int(value[:-1]) * _DURATION_UNITS[value[-1]]
+    if seconds <= 0:
+        raise ValueError(f"Duration must be positive: {value!r}")
+    return seconds
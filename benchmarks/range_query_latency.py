@@ -0,0 +1,143 @@
+"""
+Range-query latency benchmark for the devicedata table.
+
+Grows devicedata in steps and, after each step, times the query behind
+GET /devices/{device_id}/data/range for random devices and fixed-length windows.
+Every device reports once per second, so each query returns about the same
+number of rows at every table size. With the (device_id, timestamp) index the
+latency should stay flat as the table grows, because each query only touches
+the matching rows of one device.
+
+WARNING: inserts synthetic users, devices and telemetry into the database in
+DATABASE_URL. Point it at a scratch database.
+
+Usage:
+    DATABASE_URL=postgresql+asyncpg://user:pw@localhost/bench \\
+        python -m benchmarks.range_query_latency --sizes 1000000,10000000,100000000 --devices 1000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, select, text
+
+from app.db.session import create_db_and_tables, db_session_context, engine
+from app.models.device import Device
+from app.models.device_data import DeviceData
+from app.models.user import User
+from app.services.reading_types import reading_types
+
+# Synthetic data: every device reports once per second starting here
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+SQLITE_CHUNK_SIZE = 50000
+
+
+async def create_devices(count: int) -> list[int]:
+    async with db_session_context() as db:
+        user = User(username=f"bench-{time.time_ns()}", email="bench@example.com", hashed_password="-")
+        db.add(user)
+        await db.commit()
+        result = await db.execute(
+            insert(Device).returning(Device.id),
+            [{"name": f"bench-{i}", "device_type": "bench", "hashed_device_key": "-", "user_id": user.id,
+              "is_active": True, "mqtt_enabled": False, "created_at": START, "last_seen": START}
+             for i in range(count)],
+        )
+        device_ids = list(result.scalars().all())
+        await db.commit()
+        return device_ids
+
+
+async def reading_type_id(name: str) -> int:
+    async with db_session_context() as db:
+        type_ids, _ = await reading_types.ids_for(db, [name])
+        await db.commit()
+    return type_ids[name]
+
+
+async def grow_table(device_ids: list[int], first: int, last: int) -> None:
+    """Insert synthetic readings number first..last-1 (round-robin over devices, 1 s apart per device)."""
+    n = len(device_ids)
+    type_id = await reading_type_id("temperature")
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Generate rows server-side, which is orders of magnitude faster than sending them
+            await conn.execute(text(
+                "INSERT INTO devicedata (device_id, reading_type_id, value, timestamp) "
+                "SELECT (CAST(:ids AS integer[]))[(g % :n) + 1], :type_id, random() * 30, "
+                "       CAST(:start AS timestamptz) + (g / :n) * interval '1 second' "
+                "FROM generate_series(CAST(:first AS bigint), CAST(:last AS bigint) - 1) AS g"
+            ), {"ids": device_ids, "n": n, "type_id": type_id, "start": START, "first": first, "last": last})
+            await conn.execute(text("ANALYZE devicedata"))
+            return
+
+        for chunk_start in range(first, last, SQLITE_CHUNK_SIZE):
+            rows = [{"device_id": device_ids[g % n], "reading_type_id": type_id,
+                     "value": random.random() * 30, "timestamp": START + timedelta(seconds=g // n)}
+                    for g in range(chunk_start, min(chunk_start + SQLITE_CHUNK_SIZE, last))]
+            await conn.execute(insert(DeviceData), rows)
+
+
+async def time_range_queries(device_ids: list[int], total_rows: int, queries: int,
+                             window_seconds: int) -> tuple[list[float], int]:
+    """Run the range query for random devices and windows; return latencies in ms and rows fetched."""
+    span_seconds = max(total_rows // len(device_ids) - window_seconds, 1)
+    latencies = []
+    fetched = 0
+    async with db_session_context() as db:
+        for _ in range(queries):
+            start = START + timedelta(seconds=random.randrange(span_seconds))
+            query = (
+                select(DeviceData)
+                .where(
+                    DeviceData.device_id == random.choice(device_ids),
+                    DeviceData.timestamp >= start,
+                    DeviceData.timestamp < start + timedelta(seconds=window_seconds),
+                )
+                .order_by(DeviceData.timestamp.asc())
+            )
+            began = time.perf_counter()
+            fetched += len((await db.execute(query)).scalars().all())
+            latencies.append((time.perf_counter() - began) * 1000)
+    return latencies, fetched
+
+
+async def main(sizes: list[int], devices: int, queries: int, window_seconds: int) -> None:
+    await create_db_and_tables()
+    device_ids = await create_devices(devices)
+    async with db_session_context() as db:
+        current = (await db.execute(select(func.count()).select_from(DeviceData))).scalar()
+    print(f"{engine.dialect.name}: {devices} devices, {queries} queries per step, {current} existing rows")
+    print(f"{'rows':>14} {'load s':>8} {'rows/query':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+
+    generated = 0
+    for size in sizes:
+        began = time.perf_counter()
+        if size > generated:
+            await grow_table(device_ids, generated, size)
+            generated = size
+        load_seconds = time.perf_counter() - began
+
+        latencies, fetched = await time_range_queries(device_ids, generated, queries, window_seconds)
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"{current + generated:>14,} {load_seconds:>8.1f} {fetched / queries:>10.0f} "
+              f"{statistics.median(latencies):>8.2f} {p95:>8.2f} {p99:>8.2f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000000,10000000,100000000",
+                        help="Comma-separated synthetic row counts to grow the table to")
+    parser.add_argument("--devices", type=int, default=1000, help="Number of synthetic devices")
+    parser.add_argument("--queries", type=int, default=200, help="Range queries timed per step")
+    parser.add_argument("--window-seconds", type=int, default=300,
+                        help="Length of each queried window (rows returned per query at 1 reading/s)")
+    args = parser.parse_args()
+    asyncio.run(main([int(s) for s in args.sizes.split(",")], args.devices, args.queries, args.window_seconds))
@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from app.routes import device
-from app.routes import user, device_data
+from app.routes import user, device_data, metrics, stream
 from app.lifespan import lifespan
 
 # Create the FastAPI app instance
@@ -24,3 +24,9 @@ app.include_router(device.router)
 
 # Include device data-related routes
 app.include_router(device_data.router)
+
+# Include live telemetry streaming routes
+app.include_router(stream.router)
+
+# Include runtime metrics routes
+app.include_router(metrics.router)
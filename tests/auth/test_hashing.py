@@ -0,0 +1,33 @@
+def test_cancelled_hash_stays_pending_until_its_thread_finishes():
+    """
+    - A hash call whose caller is cancelled keeps counting as pending while bcrypt still runs in the pool.
+    - The count drops once the thread is done.
+    """
+    import asyncio
+    import threading
+    from app.auth import hashing
+
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_hash(secret):
+        started.set()
+        release.wait(5)
+        return secret
+
+    async def scenario():
+        pending = hashing.stats()["pending"]
+        task = asyncio.create_task(hashing._run_in_pool(slow_hash, "pw"))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert hashing.stats()["pending"] == pending + 1
+
+        release.set()
+        for _ in range(100):
+            if hashing.stats()["pending"] == pending:
+                break
+            await asyncio.sleep(0.01)
+        assert hashing.stats()["pending"] == pending
+
+    asyncio.run(scenario())
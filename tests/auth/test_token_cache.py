@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+
+def test_device_token_cache_hits_and_checks_subject(app_instance):
+    """
+    - The first verification decodes the token, the second is served from the cache.
+    - A valid token used for another device ID is rejected.
+    - Expired tokens are not accepted.
+    """
+    from app.auth.auth_device_handler import (create_device_token, device_token_cache,
+                                              verify_device_token_for_device)
+
+    token = create_device_token({"sub": "42"})
+    hits, misses = device_token_cache.hits, device_token_cache.misses
+
+    assert verify_device_token_for_device(token, 42)["sub"] == "42"
+    assert verify_device_token_for_device(token, 42)["sub"] == "42"
+    assert device_token_cache.misses == misses + 1
+    assert device_token_cache.hits == hits + 1
+
+    assert verify_device_token_for_device(token, 43) is None
+    assert verify_device_token_for_device(None, 42) is None
+
+    expired = create_device_token({"sub": "42"}, expires_delta=timedelta(seconds=-1))
+    assert verify_device_token_for_device(expired, 42) is None
+
+
+def test_token_cache_evicts_least_recently_used(app_instance):
+    import time
+    from app.auth.token_cache import TokenCache
+
+    cache = TokenCache(max_size=2)
+    exp = time.time() + 60
+    cache.put("a", {"sub": "1", "exp": exp})
+    cache.put("b", {"sub": "2", "exp": exp})
+    assert cache.get("a") is not None  # "a" becomes most recently used
+    cache.put("c", {"sub": "3", "exp": exp})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
@@ -0,0 +1,25 @@
+def test_current_user_is_cached_and_invalidated(client, create_user, auth_header):
+    """
+    - Repeated requests with the same token are served from the user cache.
+    - Renaming the user invalidates the entry: tokens for the old username stop working.
+    - Deleting the user invalidates the entry: its token is rejected at once.
+    """
+    from app.auth.auth_handler import user_token_cache
+    from app.services.user_cache import user_cache
+
+    create_user(client, "u1", "u1@e.com", "pw")
+    h = auth_header(client, "u1", "pw")
+
+    assert client.get("/user", headers=h).status_code == 200
+    hits, misses, token_hits = user_cache.hits, user_cache.misses, user_token_cache.hits
+    assert client.get("/user", headers=h).json()["username"] == "u1"
+    assert (user_cache.hits, user_cache.misses) == (hits + 1, misses)
+    assert user_token_cache.hits == token_hits + 1
+
+    assert client.put("/user", json={"username": "u1b"}, headers=h).status_code == 200
+    assert client.get("/user", headers=h).status_code == 401
+
+    h = auth_header(client, "u1b", "pw")
+    assert client.get("/user", headers=h).json()["username"] == "u1b"
+    assert client.delete("/user", headers=h).status_code == 204
+    assert client.get("/user", headers=h).status_code == 401
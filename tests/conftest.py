@@ -40,6 +40,8 @@ def set_test_env(test_db_url):
     # Minimal secrets for JWT
     os.environ["API_SECRET_KEY"] = "test-secret-key"
     os.environ["API_ALGORITHM"] = "HS256"
+    os.environ["DEVICE_KEY_PEPPER"] = "test-device-key-pepper"
+    os.environ["METRICS_TOKEN"] = "test-metrics-token"
     # Point the app's DB to our sqlite test database
     os.environ["DATABASE_URL"] = test_db_url
     # Keep MQTT off localhost connection attempts where possible
@@ -175,6 +177,20 @@ def auth_header(get_user_token):
     return _hdr
 
 
+# ---------------------------
+# HELPERS: METRICS
+# ---------------------------
+# GET /metrics with the operator token set in set_test_env.
+@pytest.fixture()
+def get_metrics():
+    def _get(client):
+        resp = client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"})
+        assert resp.status_code == 200, resp.text
+        return resp.json()
+
+    return _get
+
+
 # ---------------------------
 # HELPERS: REGISTER DEVICE VIA API
 # ---------------------------
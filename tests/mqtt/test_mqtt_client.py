@@ -0,0 +1,86 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+
+def _msg(topic, payload):
+    return SimpleNamespace(topic=topic, payload=payload)
+
+
+def test_on_message_queues_and_pauses_when_full(app_instance):
+    """
+    - Invalid payloads are counted and not queued.
+    - Valid payloads are parsed once and queued.
+    - Reading from the socket pauses when the queue is full and resumes after draining.
+    """
+    from app.mqtt.mqtt_client import MQTTClient
+
+    loop = asyncio.new_event_loop()
+    try:
+        client = MQTTClient(client_id="test", loop=loop, queue_size=2, workers=1)
+        valid = json.dumps({"token": "t", "data": {"reading_type": "temp", "value": 1.0}}).encode()
+
+        client.on_message(None, None, _msg("devices/1", b"not json"))
+        client.on_message(None, None, _msg("devices/1", b'{"data": {}}'))
+        assert client.invalid == 2
+        assert client.queue.qsize() == 0
+
+        client.on_message(None, None, _msg("devices/1", valid))
+        assert client._paused is False
+        client.on_message(None, None, _msg("devices/1", valid))
+        assert client.queue.qsize() == 2
+        assert client._paused is True
+        assert client.pauses == 1
+
+        processed = []
+
+        async def _store(topic, payload):
+            processed.append((topic, payload["data"]["value"]))
+
+        client._store_device_data = _store
+
+        async def _drain():
+            worker = asyncio.create_task(client._worker())
+            await client.queue.join()
+            worker.cancel()
+
+        loop.run_until_complete(_drain())
+        assert processed == [("devices/1", 1.0), ("devices/1", 1.0)]
+        assert client._paused is False
+        assert client.stats()["processed"] == 2
+    finally:
+        loop.close()
+
+
+def test_wildcard_filter_drops_unknown_devices(app_instance):
+    """With an allow-list set, messages from devices outside it are filtered before queueing."""
+    from app.mqtt.mqtt_client import MQTTClient
+
+    loop = asyncio.new_event_loop()
+    try:
+        client = MQTTClient(client_id="test", loop=loop)
+        client.allowed_device_ids = {1}
+        valid = json.dumps({"token": "t", "data": {"reading_type": "temp", "value": 1.0}}).encode()
+
+        client.on_message(None, None, _msg("devices/1", valid))
+        client.on_message(None, None, _msg("devices/2", valid))
+        client.on_message(None, None, _msg("devices/abc", valid))
+
+        assert client.queue.qsize() == 1
+        assert client.filtered == 1
+        assert client.invalid == 1
+    finally:
+        loop.close()
+
+
+def test_disabling_mqtt_removes_device_from_enabled_set(client, create_user, auth_header):
+    from app.mqtt import mqtt_service
+
+    create_user(client, "m1", "m1@e.com", "pw")
+    h = auth_header(client, "m1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    mqtt_service.enabled_device_ids.add(dev["id"])
+
+    resp = client.put(f"/devices/{dev['id']}/mqtt", params={"mqtt_enabled": False}, headers=h)
+    assert resp.status_code == 200
+    assert dev["id"] not in mqtt_service.enabled_device_ids
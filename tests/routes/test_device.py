@@ -1,3 +1,6 @@
+import pytest
+
+
 def test_device_crud_flow(client, create_user, auth_header):
     """
     - Create a user.
@@ -42,3 +45,137 @@ def test_device_token_wrong_key(client, create_user, auth_header):
     dev = client.post("/device", json={"name":"s","device_type":"t"}, headers=h).json()
     r = client.post("/device/token", data={"device_id": dev["id"], "device_key": "WRONG"})
     assert r.status_code == 401
+
+
+def test_bcrypt_device_key_is_rehashed_on_login(client, create_user, auth_header, monkeypatch):
+    """
+    - Register a device while the legacy bcrypt scheme is configured.
+    - Switch to the HMAC scheme: the bcrypt hash still verifies and is replaced on login.
+    - The device can keep logging in with the new hash.
+    """
+    import app.auth.auth_device_handler as device_auth
+    from app.db.session import db_session_context
+    from app.services.device_service import DeviceService
+
+    async def _stored_hash(device_id):
+        async with db_session_context() as db:
+            return (await DeviceService.get_device(db, device_id)).hashed_device_key
+
+    create_user(client, "k1", "k1@e.com", "pw")
+    h = auth_header(client, "k1", "pw")
+
+    monkeypatch.setattr(device_auth, "DEVICE_KEY_SCHEME", "bcrypt")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    assert client.portal.call(_stored_hash, dev["id"]).startswith("$2")
+
+    monkeypatch.setattr(device_auth, "DEVICE_KEY_SCHEME", "hmac-sha256")
+    creds = {"device_id": dev["id"], "device_key": dev["device_key"]}
+    assert client.post("/device/token", data=creds).status_code == 200
+    assert client.portal.call(_stored_hash, dev["id"]).startswith("hmac-sha256$")
+    assert client.post("/device/token", data=creds).status_code == 200
+    assert client.post("/device/token", data={**creds, "device_key": "WRONG"}).status_code == 401
+
+
+def test_hmac_scheme_requires_a_dedicated_pepper(app_instance, monkeypatch):
+    """
+    - Startup fails with the HMAC scheme and no DEVICE_KEY_PEPPER; API_SECRET_KEY is not used instead.
+    - The bcrypt scheme does not need one.
+    """
+    import app.auth.auth_device_handler as device_auth
+
+    monkeypatch.setattr(device_auth, "DEVICE_KEY_PEPPER", None)
+    with pytest.raises(RuntimeError, match="DEVICE_KEY_PEPPER"):
+        device_auth.check_device_key_pepper()
+    monkeypatch.setattr(device_auth, "DEVICE_KEY_SCHEME", "bcrypt")
+    device_auth.check_device_key_pepper()
+
+
+def test_presence_and_bulk_last_seen_flush(client, create_user, auth_header):
+    """
+    - Ingesting a reading marks the device as seen in memory.
+    - The presence endpoint reports it online.
+    - A heartbeat flush writes last_seen to the device row.
+    """
+    from datetime import datetime
+    from app.services.heartbeat import heartbeat_tracker
+
+    create_user(client, "p1", "p1@e.com", "pw")
+    h = auth_header(client, "p1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+
+    r = client.post("/devices/data", json={"reading_type": "temp", "value": 1.0}, headers={"Authorization": f"Bearer {tok}"})
+    assert r.status_code == 200
+
+    presence = client.get(f"/devices/{dev['id']}/presence", headers=h).json()
+    assert presence["online"] is True
+    seen = datetime.fromisoformat(presence["last_seen"])
+    assert seen > datetime.fromisoformat(dev["last_seen"]).replace(tzinfo=seen.tzinfo)
+
+    client.portal.call(heartbeat_tracker.flush)
+    stored = next(d for d in client.get("/device", headers=h).json() if d["id"] == dev["id"])
+    assert datetime.fromisoformat(stored["last_seen"]).replace(tzinfo=seen.tzinfo) == seen
+
+
+def test_retention_policies_purge_expired_data_in_batches(client, create_user, auth_header, get_metrics, monkeypatch):
+    """
+    - A device keeps raw data and 1-minute rollups for 1 day, but "hum" readings forever.
+    - The purge deletes the old "temp" readings and rollups in small batches and reports the counts.
+    - Newer readings, "hum" readings, hourly rollups and other devices' data are kept.
+    """
+    from datetime import datetime, timedelta, timezone
+    import app.services.retention_service as retention
+    import asyncio
+    from app.db.session import db_session_context
+    from app.models.retention import RetentionPolicyBase
+    from app.services.retention_service import RetentionService, retention_job
+
+    monkeypatch.setattr(retention, "RETENTION_BATCH_SIZE", 2)
+    monkeypatch.setattr(retention, "RETENTION_BATCH_PAUSE_SECONDS", 0)
+
+    create_user(client, "r1", "r1@e.com", "pw")
+    h = auth_header(client, "r1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    other = client.post("/device", json={"name": "s2", "device_type": "t"}, headers=h).json()
+
+    r = client.put(f"/devices/{dev['id']}/retention", json={"raw_days": 1, "rollup_1m_days": 1}, headers=h)
+    assert r.status_code == 200, r.text
+    assert client.put(f"/devices/{dev['id']}/retention", json={"reading_type": "hum"}, headers=h).status_code == 200
+    assert client.put(f"/devices/{dev['id']}/retention", json={"raw_days": 0}, headers=h).status_code == 422
+    assert len(client.get(f"/devices/{dev['id']}/retention", headers=h).json()) == 2
+
+    # Repeated and concurrent updates of the device-wide policy replace it instead of adding one
+    async def set_concurrently():
+        async def put(days):
+            async with db_session_context() as db:
+                await RetentionService.set_device_policy(db, dev["id"], RetentionPolicyBase(raw_days=days))
+        await asyncio.gather(*(put(days) for days in (5, 6, 7)))
+
+    client.portal.call(set_concurrently)
+    r = client.put(f"/devices/{dev['id']}/retention", json={"raw_days": 1, "rollup_1m_days": 1}, headers=h)
+    assert r.json()["raw_days"] == 1
+    policies = client.get(f"/devices/{dev['id']}/retention", headers=h).json()
+    assert sorted(str(p["reading_type"]) for p in policies) == ["None", "hum"]
+
+    old = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(days=3)
+    readings = [{"reading_type": "temp", "value": float(i), "timestamp": (old + timedelta(minutes=i)).isoformat()} for i in range(5)]
+    readings += [{"reading_type": "hum", "value": 50.0, "timestamp": old.isoformat()},
+                 {"reading_type": "temp", "value": 9.0}]
+    for d in (dev, other):
+        tok = client.post("/device/token", data={"device_id": d["id"], "device_key": d["device_key"]}).json()["access_token"]
+        r = client.post("/devices/data/batch", json=readings, headers={"Authorization": f"Bearer {tok}"})
+        assert r.json()["accepted"] == 7
+
+    report = client.portal.call(retention_job.run_once)
+    assert (report["raw_rows_deleted"], report["rollup_rows_deleted"]) == (5, 5)
+    assert get_metrics(client)["retention"]["last_run"] == report
+
+    kept = client.get(f"/devices/{dev['id']}/data/last", params={"limit": 100}, headers=h).json()
+    assert sorted(p["reading_type"] for p in kept) == ["hum", "temp"]
+    assert len(client.get(f"/devices/{other['id']}/data/last", params={"limit": 100}, headers=h).json()) == 7
+    hourly = client.get(f"/devices/{dev['id']}/data/aggregate", headers=h, params={
+        "start": old.isoformat(), "end": (old + timedelta(hours=1)).isoformat(), "bucket": "1h", "reading_type": "temp"}).json()
+    assert hourly[0]["count"] == 5
+
+    assert client.delete(f"/devices/{dev['id']}/retention", params={"reading_type": "hum"}, headers=h).status_code == 204
+    assert client.delete(f"/devices/{dev['id']}/retention", params={"reading_type": "hum"}, headers=h).status_code == 404
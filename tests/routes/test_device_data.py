@@ -80,4 +80,428 @@ def test_range_start_after_end(client, create_user, auth_header):
     r = client.get(f"/devices/{dev['id']}/data/range",
                    params={"start":"2025-01-02T00:00:00Z","end":"2025-01-01T00:00:00Z"},
                    headers=h)
-    assert r.status_code == 400
\ No newline at end of file
+    assert r.status_code == 400
+
+def test_ingest_batch_reports_invalid_items(client, create_user, auth_header):
+    """
+    - Upload a batch with two valid readings and one invalid reading.
+    - Only the valid readings are stored; the invalid one is reported by index.
+    """
+    create_user(client, "a4", "a4@e.com", "pw")
+    h = auth_header(client, "a4", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+
+    now = datetime.now(timezone.utc)
+    batch = [
+        {"reading_type": "temp", "value": 20.0, "timestamp": (now - timedelta(seconds=2)).isoformat()},
+        {"reading_type": "temp"},
+        {"reading_type": "temp", "value": 21.0, "timestamp": (now - timedelta(seconds=1)).isoformat()},
+    ]
+    r = client.post("/devices/data/batch", json=batch, headers={"Authorization": f"Bearer {tok}"})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["accepted"] == 2
+    assert [e["index"] for e in body["rejected"]] == [1]
+
+    r = client.get(f"/devices/{dev['id']}/data/last", params={"limit": 10}, headers=h)
+    assert [p["value"] for p in r.json()] == [21.0, 20.0]
+
+
+def test_ingest_goes_through_group_commit_buffer(client, create_user, auth_header, get_metrics):
+    """Readings are committed by the ingestion buffer and show up in its metrics."""
+    create_user(client, "a5", "a5@e.com", "pw")
+    h = auth_header(client, "a5", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+
+    before = get_metrics(client)["ingest_buffer"]["rows_flushed"]
+    r = client.post("/devices/data", json={"reading_type": "temp", "value": 1.0},
+                    headers={"Authorization": f"Bearer {tok}"})
+    assert r.status_code == 200, r.text
+
+    stats = get_metrics(client)["ingest_buffer"]
+    assert stats["running"] is True
+    assert stats["depth"] == 0
+    assert stats["rows_flushed"] == before + 1
+
+
+def test_metrics_require_the_operator_token(client, create_user, auth_header, monkeypatch):
+    """
+    - /metrics rejects anonymous requests and user logins: only METRICS_TOKEN is accepted.
+    - Without METRICS_TOKEN configured the endpoint does not exist.
+    """
+    import app.routes.metrics as metrics_routes
+
+    create_user(client, "m2", "m2@e.com", "pw")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers=auth_header(client, "m2", "pw")).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"}).status_code == 200
+
+    monkeypatch.setattr(metrics_routes, "METRICS_TOKEN", None)
+    assert client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"}).status_code == 404
+
+
+def test_device_data_is_owner_scoped_and_deactivation_is_immediate(client, create_user, auth_header):
+    """
+    - Another user cannot read a device's data.
+    - Deactivating a device invalidates the cached registry entry, so its token stops working at once.
+    """
+    create_user(client, "a6", "a6@e.com", "pw")
+    create_user(client, "a7", "a7@e.com", "pw")
+    owner = auth_header(client, "a6", "pw")
+    other = auth_header(client, "a7", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=owner).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+    device_headers = {"Authorization": f"Bearer {tok}"}
+
+    assert client.post("/devices/data", json={"reading_type": "temp", "value": 1.0}, headers=device_headers).status_code == 200
+    assert client.get(f"/devices/{dev['id']}/data/last", headers=owner).status_code == 200
+    assert client.get(f"/devices/{dev['id']}/data/last", headers=other).status_code == 404
+
+    assert client.put(f"/devices/{dev['id']}", json={"is_active": False}, headers=owner).status_code == 200
+    assert client.post("/devices/data", json={"reading_type": "temp", "value": 2.0}, headers=device_headers).status_code == 401
+
+
+def test_aggregate_buckets(client, create_user, auth_header):
+    """
+    - Ingest readings spread over two one-minute buckets and two reading types.
+    - The aggregate endpoint returns min/max/mean/count/last per bucket and type.
+    """
+    create_user(client, "g1", "g1@e.com", "pw")
+    h = auth_header(client, "g1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+
+    base = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+    batch = [
+        {"reading_type": "temp", "value": 10.0, "timestamp": (base + timedelta(seconds=5)).isoformat()},
+        {"reading_type": "temp", "value": 30.0, "timestamp": (base + timedelta(seconds=50)).isoformat()},
+        {"reading_type": "temp", "value": 20.0, "timestamp": (base + timedelta(seconds=30)).isoformat()},
+        {"reading_type": "temp", "value": 5.0, "timestamp": (base + timedelta(seconds=70)).isoformat()},
+        {"reading_type": "hum", "value": 40.0, "timestamp": (base + timedelta(seconds=10)).isoformat()},
+    ]
+    r = client.post("/devices/data/batch", json=batch, headers={"Authorization": f"Bearer {tok}"})
+    assert r.json()["accepted"] == 5
+
+    params = {"start": base.isoformat(), "end": (base + timedelta(minutes=5)).isoformat(), "bucket": "1m"}
+    r = client.get(f"/devices/{dev['id']}/data/aggregate", params=params, headers=h)
+    assert r.status_code == 200, r.text
+    buckets = [(b["reading_type"], b["bucket_start"][:19], b["count"], b["min"], b["max"], b["mean"], b["last"])
+               for b in r.json()]
+    assert buckets == [
+        ("hum", "2025-03-01T12:00:00", 1, 40.0, 40.0, 40.0, 40.0),
+        ("temp", "2025-03-01T12:00:00", 3, 10.0, 30.0, 20.0, 30.0),
+        ("temp", "2025-03-01T12:01:00", 1, 5.0, 5.0, 5.0, 5.0),
+    ]
+
+    r = client.get(f"/devices/{dev['id']}/data/aggregate", params={**params, "reading_type": "hum"}, headers=h)
+    assert [b["reading_type"] for b in r.json()] == ["hum"]
+
+    # Invalid bucket width and too many buckets are rejected
+    r = client.get(f"/devices/{dev['id']}/data/aggregate", params={**params, "bucket": "1w"}, headers=h)
+    assert r.status_code == 400
+    r = client.get(f"/devices/{dev['id']}/data/aggregate", params={**params, "bucket": "1s",
+                   "end": (base + timedelta(days=1)).isoformat()}, headers=h)
+    assert r.status_code == 400
+
+
+def test_rollups_match_raw_aggregation_and_serve_max_points(client, create_user, auth_header, monkeypatch):
+    """
+    - Ingest readings over three hours, then a late reading into the first hour.
+    - Aggregates merged from rollups equal aggregates computed from raw data.
+    - A range query with a small max_points budget is served from hourly rollups.
+    - Rebuilding the rollups from raw data gives the same result.
+    """
+    from app.db.session import db_session_context
+    import app.services.rollup_service as rollup_service
+
+    create_user(client, "g2", "g2@e.com", "pw")
+    h = auth_header(client, "g2", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+    device_headers = {"Authorization": f"Bearer {tok}"}
+
+    base = datetime(2025, 4, 1, 0, 0, tzinfo=timezone.utc)
+    batch = [{"reading_type": "temp", "value": float(i), "timestamp": (base + timedelta(minutes=10 * i)).isoformat()}
+             for i in range(18)]
+    assert client.post("/devices/data/batch", json=batch, headers=device_headers).json()["accepted"] == 18
+    late = {"reading_type": "temp", "value": -5.0, "timestamp": (base + timedelta(minutes=55)).isoformat()}
+    assert client.post("/devices/data", json=late, headers=device_headers).status_code == 200
+
+    params = {"start": base.isoformat(), "end": (base + timedelta(hours=3)).isoformat(), "bucket": "1h"}
+    from_rollups = client.get(f"/devices/{dev['id']}/data/aggregate", params=params, headers=h).json()
+    monkeypatch.setattr(rollup_service, "ROLLUPS_ENABLED", False)
+    from_raw = client.get(f"/devices/{dev['id']}/data/aggregate", params=params, headers=h).json()
+    monkeypatch.setattr(rollup_service, "ROLLUPS_ENABLED", True)
+    assert from_rollups == from_raw
+    assert [(b["count"], b["min"], b["last"]) for b in from_rollups] == [(7, -5.0, -5.0), (6, 6.0, 11.0), (6, 12.0, 17.0)]
+
+    range_params = {"start": params["start"], "end": params["end"]}
+    r = client.get(f"/devices/{dev['id']}/data/range", params={**range_params, "max_points": 5}, headers=h)
+    assert r.headers["X-Resolution"] == "1h"
+    assert [round(p["value"], 3) for p in r.json()] == [round(10 / 7, 3), 8.5, 14.5]
+    r = client.get(f"/devices/{dev['id']}/data/range", params={**range_params, "max_points": 100}, headers=h)
+    assert r.headers["X-Resolution"] == "raw"
+    assert len(r.json()) == 19
+
+    async def rebuild():
+        async with db_session_context() as db:
+            await rollup_service.RollupService.rebuild(db, base, base + timedelta(hours=3), dev["id"])
+
+    client.portal.call(rebuild)
+    assert client.get(f"/devices/{dev['id']}/data/aggregate", params=params, headers=h).json() == from_rollups
+    # Upserts after a rebuild still land in the rebuilt buckets
+    assert client.post("/devices/data", json={**late, "value": 100.0}, headers=device_headers).status_code == 200
+    first = client.get(f"/devices/{dev['id']}/data/aggregate", params=params, headers=h).json()[0]
+    assert (first["count"], first["max"]) == (8, 100.0)
+
+
+def test_aggregate_falls_back_to_raw_data_until_rollups_are_rebuilt(client, create_user, auth_header):
+    """
+    - Readings written without insert_rows (e.g. before rollups existed) have no rollups.
+    - /data/aggregate with rollup-sized buckets still counts them, from raw data.
+    - After a rebuild the rollups cover the range and give the same buckets.
+    """
+    from sqlalchemy import insert
+    from app.db.session import db_session_context
+    from app.models.device_data import DeviceData
+    from app.services.reading_types import reading_types
+    import app.services.rollup_service as rollup_service
+
+    create_user(client, "g3", "g3@e.com", "pw")
+    h = auth_header(client, "g3", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    base = datetime(2025, 4, 2, tzinfo=timezone.utc)
+    start, end = base, base + timedelta(hours=1)
+
+    async def insert_raw():
+        async with db_session_context() as db:
+            type_ids, _ = await reading_types.ids_for(db, {"temp"})
+            await db.execute(insert(DeviceData), [
+                {"device_id": dev["id"], "reading_type_id": type_ids["temp"], "value": float(i),
+                 "timestamp": base + timedelta(seconds=20 * i)} for i in range(30)])
+            await db.commit()
+
+    async def covers():
+        async with db_session_context() as db:
+            return await rollup_service.RollupService.covers(db, dev["id"], start, end, 60)
+
+    async def rebuild():
+        async with db_session_context() as db:
+            await rollup_service.RollupService.rebuild(db, start, end)
+
+    client.portal.call(insert_raw)
+    url = f"/devices/{dev['id']}/data/aggregate"
+    params = {"start": start.isoformat(), "end": end.isoformat()}
+    by_minute = client.get(url, params={**params, "bucket": "1m"}, headers=h).json()
+    assert [b["count"] for b in by_minute] == [3] * 10
+    assert [b["count"] for b in client.get(url, params={**params, "bucket": "1h"}, headers=h).json()] == [30]
+    assert client.portal.call(covers) is False
+
+    client.portal.call(rebuild)
+    assert client.portal.call(covers) is True
+    assert client.get(url, params={**params, "bucket": "1m"}, headers=h).json() == by_minute
+
+
+def test_range_streams_ndjson_and_csv(client, create_user, auth_header, monkeypatch):
+    """
+    - Ingest five readings.
+    - format=ndjson and format=csv stream them in order, read in chunks of two rows.
+    """
+    import csv
+    import json
+    import app.services.device_data_service as device_data_service
+
+    monkeypatch.setattr(device_data_service, "STREAM_CHUNK_SIZE", 2)
+    create_user(client, "s1", "s1@e.com", "pw")
+    h = auth_header(client, "s1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+
+    base = datetime(2025, 5, 1, tzinfo=timezone.utc)
+    batch = [{"reading_type": "temp", "value": float(i), "timestamp": (base + timedelta(seconds=i)).isoformat()}
+             for i in range(5)]
+    assert client.post("/devices/data/batch", json=batch, headers={"Authorization": f"Bearer {tok}"}).json()["accepted"] == 5
+
+    params = {"start": base.isoformat(), "end": (base + timedelta(minutes=1)).isoformat()}
+    r = client.get(f"/devices/{dev['id']}/data/range", params={**params, "format": "ndjson"}, headers=h)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [p["value"] for p in lines] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert lines[0]["timestamp"] == "2025-05-01T00:00:00+00:00"
+
+    r = client.get(f"/devices/{dev['id']}/data/range", params={**params, "format": "csv"}, headers=h)
+    assert r.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(r.text.splitlines()))
+    assert rows[0] == ["timestamp", "reading_type", "value"]
+    assert [row[2] for row in rows[1:]] == ["0.0", "1.0", "2.0", "3.0", "4.0"]
+
+    r = client.get(f"/devices/{dev['id']}/data/range", params={**params, "format": "csv", "max_points": 10}, headers=h)
+    assert r.status_code == 400
+
+
+def test_keyset_pagination(client, create_user, auth_header):
+    """
+    - Ingest five readings, two of them with the same timestamp.
+    - /data/range and /data/last page through all of them without gaps or repeats.
+    - Page sizes above the server maximum and malformed cursors are rejected.
+    """
+    from app.routes.device_data import DATA_MAX_PAGE_SIZE
+
+    create_user(client, "c1", "c1@e.com", "pw")
+    h = auth_header(client, "c1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+
+    base = datetime(2025, 6, 1, tzinfo=timezone.utc)
+    offsets = [0, 1, 1, 2, 3]
+    batch = [{"reading_type": "temp", "value": float(i), "timestamp": (base + timedelta(seconds=s)).isoformat()}
+             for i, s in enumerate(offsets)]
+    assert client.post("/devices/data/batch", json=batch, headers={"Authorization": f"Bearer {tok}"}).json()["accepted"] == 5
+
+    def collect(url, params):
+        pages, cursor = [], None
+        while True:
+            r = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})}, headers=h)
+            assert r.status_code == 200, r.text
+            pages.append([p["value"] for p in r.json()])
+            cursor = r.headers.get("X-Next-Cursor")
+            if cursor is None:
+                return pages
+
+    range_params = {"start": base.isoformat(), "end": (base + timedelta(minutes=1)).isoformat(), "limit": 2}
+    pages = collect(f"/devices/{dev['id']}/data/range", range_params)
+    assert [len(p) for p in pages] == [2, 2, 1]
+    assert sorted(sum(pages, [])) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert [v for p in pages for v in p][0] == 0.0 and [v for p in pages for v in p][-1] == 4.0
+
+    pages = collect(f"/devices/{dev['id']}/data/last", {"limit": 2})
+    assert [len(p) for p in pages] == [2, 2, 1]
+    assert sum(pages, [])[0] == 4.0 and sorted(sum(pages, [])) == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+    r = client.get(f"/devices/{dev['id']}/data/last", params={"limit": DATA_MAX_PAGE_SIZE + 1}, headers=h)
+    assert r.status_code == 422
+    r = client.get(f"/devices/{dev['id']}/data/last", params={"cursor": "not-a-cursor"}, headers=h)
+    assert r.status_code == 400
+
+
+def test_range_lttb_downsampling_keeps_shape(client, create_user, auth_header, monkeypatch):
+    """
+    - downsample=lttb returns max_points readings, keeping the first, last and spike readings.
+    - Ranges larger than LTTB_MAX_SOURCE_POINTS are downsampled from rollups, or rejected without rollups.
+    - downsample=lttb without max_points is rejected.
+    """
+    import app.services.downsampling as downsampling
+
+    create_user(client, "d1", "d1@e.com", "pw")
+    h = auth_header(client, "d1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+
+    base = datetime(2025, 8, 1, tzinfo=timezone.utc)
+    batch = [{"reading_type": "temp", "value": 500.0 if i == 123 else float(i % 7),
+              "timestamp": (base + timedelta(seconds=10 * i)).isoformat()} for i in range(300)]
+    assert client.post("/devices/data/batch", json=batch,
+                       headers={"Authorization": f"Bearer {tok}"}).json()["accepted"] == 300
+
+    params = {"start": base.isoformat(), "end": (base + timedelta(hours=1)).isoformat(), "downsample": "lttb"}
+    r = client.get(f"/devices/{dev['id']}/data/range", params={**params, "max_points": 20}, headers=h)
+    assert r.status_code == 200
+    assert r.headers["X-Resolution"] == "raw"
+    points = r.json()
+    assert len(points) == 20
+    assert datetime.fromisoformat(points[0]["timestamp"]) == base
+    assert datetime.fromisoformat(points[-1]["timestamp"]) == base + timedelta(seconds=2990)
+    assert max(p["value"] for p in points) == 500.0
+
+    monkeypatch.setattr(downsampling, "LTTB_MAX_SOURCE_POINTS", 100)
+    r = client.get(f"/devices/{dev['id']}/data/range", params={**params, "max_points": 20}, headers=h)
+    assert r.headers["X-Resolution"] == "1m"
+    assert len(r.json()) == 20
+
+    # Without rollups, raw ranges over the cap are rejected instead of being loaded whole
+    monkeypatch.setattr(downsampling, "ROLLUPS_ENABLED", False)
+    r = client.get(f"/devices/{dev['id']}/data/range", params={**params, "max_points": 20}, headers=h)
+    assert r.status_code == 400 and "100 readings" in r.json()["detail"]
+    monkeypatch.setattr(downsampling, "LTTB_MAX_SOURCE_POINTS", 300)
+    r = client.get(f"/devices/{dev['id']}/data/range", params={**params, "max_points": 20}, headers=h)
+    assert r.headers["X-Resolution"] == "raw" and len(r.json()) == 20
+
+    assert client.get(f"/devices/{dev['id']}/data/range", params=params, headers=h).status_code == 400
+
+
+def test_multi_device_last_and_summary(client, create_user, auth_header):
+    """
+    - /devices/data/last returns the newest readings of every requested device, in request order.
+    - /devices/data/summary aggregates per device and reading type.
+    - A device of another user in the list makes the whole request 404.
+    """
+    create_user(client, "f1", "f1@e.com", "pw")
+    h = auth_header(client, "f1", "pw")
+    base = datetime(2025, 9, 1, tzinfo=timezone.utc)
+    devices = []
+    for n in range(3):
+        dev = client.post("/device", json={"name": f"s{n}", "device_type": "t"}, headers=h).json()
+        tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+        batch = [{"reading_type": "temp", "value": float(10 * n + i), "timestamp": (base + timedelta(minutes=i)).isoformat()}
+                 for i in range(n + 2)]
+        assert client.post("/devices/data/batch", json=batch, headers={"Authorization": f"Bearer {tok}"}).status_code == 200
+        devices.append(dev["id"])
+
+    ids = [devices[2], devices[0], devices[1]]
+    r = client.get("/devices/data/last", params={"device_ids": ids, "limit": 2}, headers=h)
+    assert r.status_code == 200
+    assert [(d["device_id"], [p["value"] for p in d["readings"]]) for d in r.json()] == \
+        [(devices[2], [23.0, 22.0]), (devices[0], [1.0, 0.0]), (devices[1], [12.0, 11.0])]
+
+    params = {"device_ids": devices, "start": base.isoformat(), "end": (base + timedelta(hours=1)).isoformat()}
+    r = client.get("/devices/data/summary", params=params, headers=h)
+    assert [(s["device_id"], s["count"], s["min"], s["last"]) for s in r.json()] == \
+        [(devices[0], 2, 0.0, 1.0), (devices[1], 3, 10.0, 12.0), (devices[2], 4, 20.0, 23.0)]
+
+    create_user(client, "f2", "f2@e.com", "pw")
+    other = client.post("/device", json={"name": "x", "device_type": "t"}, headers=auth_header(client, "f2", "pw")).json()
+    r = client.get("/devices/data/last", params={"device_ids": devices + [other["id"]]}, headers=h)
+    assert r.status_code == 404
+
+
+def test_bulk_import_csv_and_ndjson(client, create_user, auth_header, monkeypatch):
+    """
+    - Import CSV and NDJSON bodies in chunks of two readings.
+    - Invalid lines and readings of another user's device are rejected by line number.
+    - Imported readings show up in range queries and in the rollups.
+    """
+    import json
+    import app.services.bulk_import as bulk_import
+
+    monkeypatch.setattr(bulk_import, "BULK_IMPORT_CHUNK_SIZE", 2)
+    create_user(client, "b1", "b1@e.com", "pw")
+    create_user(client, "b2", "b2@e.com", "pw")
+    h = auth_header(client, "b1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    foreign = client.post("/device", json={"name": "s", "device_type": "t"}, headers=auth_header(client, "b2", "pw")).json()
+
+    base = datetime(2025, 8, 1, tzinfo=timezone.utc)
+    body = "device_id,reading_type,value,timestamp\n" + "".join(
+        f"{dev['id']},temp,{i},{(base + timedelta(seconds=10 * i)).isoformat()}\n" for i in range(5)
+    ) + f"{foreign['id']},temp,1,{base.isoformat()}\n{dev['id']},temp,warm,{base.isoformat()}\n"
+    r = client.post("/devices/data/import", params={"format": "csv"}, content=body.encode(), headers=h)
+    assert r.status_code == 200, r.text
+    report = r.json()
+    assert (report["accepted"], report["rejected"]) == (5, 2)
+    assert [error["index"] for error in report["errors"]] == [7, 8]
+    assert report["errors"][0]["errors"][0]["msg"] == "Device not found"
+
+    lines = [json.dumps({"device_id": dev["id"], "reading_type": "rh", "value": 50.0,
+                         "timestamp": (base + timedelta(minutes=1)).isoformat()}), "", "{not json"]
+    r = client.post("/devices/data/import", content="\n".join(lines).encode(), headers=h)
+    assert (r.json()["accepted"], r.json()["rejected"]) == (1, 1)
+    assert r.json()["errors"][0]["index"] == 3
+
+    params = {"start": base.isoformat(), "end": (base + timedelta(minutes=5)).isoformat()}
+    r = client.get(f"/devices/{dev['id']}/data/range", params=params, headers=h)
+    assert [(p["reading_type"], p["value"]) for p in r.json()] == [("temp", float(i)) for i in range(5)] + [("rh", 50.0)]
+    r = client.get(f"/devices/{dev['id']}/data/aggregate", params={**params, "bucket": "1h"}, headers=h)
+    assert {(b["reading_type"], b["count"]) for b in r.json()} == {("temp", 5), ("rh", 1)}
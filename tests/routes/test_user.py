@@ -46,3 +46,20 @@ def test_update_and_delete_user(client, create_user, auth_header, get_user_token
     assert resp.status_code == 204
 
 
+
+
+# Test 3: change the password; the old one must be checked and stop working afterwards
+def test_change_password(client, create_user, auth_header, get_user_token):
+    create_user(client, username="erin", email="erin@example.com", password="secret123")
+    headers = auth_header(client, "erin", "secret123")
+
+    resp = client.post("/user/password", json={"old_password": "wrong", "new_password": "n3w",
+                                               "new_password_confirm": "n3w"}, headers=headers)
+    assert resp.status_code == 400
+
+    resp = client.post("/user/password", json={"old_password": "secret123", "new_password": "n3w",
+                                               "new_password_confirm": "n3w"}, headers=headers)
+    assert resp.status_code == 204
+
+    assert client.post("/token", data={"username": "erin", "password": "secret123"}).status_code == 400
+    assert get_user_token(client, "erin", "n3w")
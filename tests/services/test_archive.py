@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+
+
+def test_columnar_block_round_trip():
+    """
+    - Blocks decode to exactly the encoded IDs, timestamps and values, including NaN and negative zero.
+    - Regularly sampled readings compress far below the 16 bytes per reading of the raw columns.
+    """
+    import numpy as np
+    from app.db.columnar import encode_block, decode_block
+
+    n = 10000
+    rng = np.random.default_rng(1)
+    ids = np.arange(1, n + 1) * 3
+    micros = 1_700_000_000_000_000 + np.arange(n) * 1_000_000 + rng.integers(0, 3, n)
+    values = np.round(20 + np.cumsum(rng.normal(0, 0.05, n)), 2)
+    values[[5, 6]] = [np.nan, -0.0]
+
+    block = encode_block(ids, micros, values)
+    decoded_ids, decoded_micros, decoded_values = decode_block(block)
+    assert decoded_ids.tolist() == ids.tolist()
+    assert decoded_micros.tolist() == micros.tolist()
+    assert decoded_values.view(np.uint64).tolist() == values.view(np.uint64).tolist()
+    assert len(block) / n < 8
+
+
+def test_archived_readings_are_served_like_raw_ones(client, create_user, auth_header):
+    """
+    - Archive the closed days of a device: raw rows move into one block per reading type and day.
+    - Range pages, CSV exports, raw aggregates, /data/last and the fleet-wide /devices/data/last
+      and /devices/data/summary are unchanged by archiving,
+      also with a late reading that arrived for an already archived day.
+    """
+    from sqlalchemy import func, select
+    from app.db.session import db_session_context
+    from app.models.device_data import DeviceData, DeviceDataArchive
+    from app.services.archive_service import ArchiveService
+    from app.services.latest_values import latest_values
+
+    create_user(client, "v1", "v1@e.com", "pw")
+    h = auth_header(client, "v1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+    device_headers = {"Authorization": f"Bearer {tok}"}
+
+    base = datetime(2025, 3, 1, 23, 59, tzinfo=timezone.utc)
+    batch = [{"reading_type": "temp" if i % 3 else "rh", "value": float(i) / 4,
+              "timestamp": (base + timedelta(seconds=5 * (i // 2))).isoformat()} for i in range(60)]
+    assert client.post("/devices/data/batch", json=batch, headers=device_headers).json()["accepted"] == 60
+
+    url = f"/devices/{dev['id']}/data"
+    params = {"start": (base + timedelta(seconds=30)).isoformat(), "end": (base + timedelta(minutes=3)).isoformat()}
+
+    def snapshot():
+        latest_values.clear()
+        pages, cursor = [], None
+        while True:
+            r = client.get(f"{url}/range", params={**params, "limit": 7, **({"cursor": cursor} if cursor else {})}, headers=h)
+            pages.append(r.json())
+            cursor = r.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+        newest = client.get(f"{url}/last", params={"limit": 9}, headers=h)
+        older = client.get(f"{url}/last", params={"limit": 9, "cursor": newest.headers["X-Next-Cursor"]}, headers=h)
+        return {
+            "pages": pages,
+            "csv": client.get(f"{url}/range", params={**params, "format": "csv"}, headers=h).text,
+            "aggregate": client.get(f"{url}/aggregate", params={**params, "bucket": "7s"}, headers=h).json(),
+            "last": [newest.json(), older.json()],
+            "fleet_last": client.get("/devices/data/last", params={"device_ids": [dev["id"]], "limit": 40}, headers=h).json(),
+            "summary": client.get("/devices/data/summary", params={"device_ids": [dev["id"]], **params}, headers=h).json(),
+        }
+
+    def counts():
+        async def count():
+            async with db_session_context() as db:
+                raw = (await db.execute(select(func.count()).where(DeviceData.device_id == dev["id"]))).scalar_one()
+                blocks = (await db.execute(select(func.count()).where(DeviceDataArchive.device_id == dev["id"]))).scalar_one()
+                return raw, blocks
+        return client.portal.call(count)
+
+    before = snapshot()
+    assert len(before["pages"]) > 2 and before["aggregate"]
+    assert len(before["fleet_last"][0]["readings"]) == 40 and len(before["summary"]) == 2
+
+    # Archive only the first day (23:59 to midnight); the next day stays raw
+    report = client.portal.call(ArchiveService.archive, base + timedelta(days=1))
+    assert report["readings_archived"] >= 24
+    assert counts() == (36, 2)
+    assert snapshot() == before
+
+    # A late reading for the archived day is stored raw and merged with the blocks
+    late = {"reading_type": "temp", "value": 99.0, "timestamp": (base + timedelta(seconds=42)).isoformat()}
+    assert client.post("/devices/data/batch", json=[late], headers=device_headers).json()["accepted"] == 1
+    after_late = snapshot()
+    assert after_late != before
+    client.portal.call(ArchiveService.archive, base + timedelta(days=1))
+    assert counts() == (36, 3)
+    assert snapshot() == after_late
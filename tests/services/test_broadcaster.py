@@ -0,0 +1,63 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+
+def test_slow_subscriber_drops_oldest_messages(app_instance):
+    """
+    - Only subscribers of a reading's device receive it.
+    - A full queue drops its oldest messages and counts them.
+    """
+    from app.services.broadcaster import TelemetryBroadcaster
+
+    broadcaster = TelemetryBroadcaster(queue_size=2)
+    slow = broadcaster.subscribe([1])
+    other = broadcaster.subscribe([2])
+    timestamp = datetime(2025, 7, 1, tzinfo=timezone.utc)
+    broadcaster.publish([{"device_id": 1, "reading_type": "temp", "value": float(i), "timestamp": timestamp}
+                         for i in range(5)])
+
+    assert slow.dropped == 3
+    assert [json.loads(m)["value"] for m in slow._messages] == [3.0, 4.0]
+    assert not other._messages
+    assert broadcaster.stats()["dropped"] == 3
+
+    broadcaster.unsubscribe(slow)
+    broadcaster.unsubscribe(other)
+    assert broadcaster.stats()["subscribers"] == 0
+
+
+def test_websocket_receives_ingested_readings(client, create_user, auth_header):
+    """
+    - A WebSocket subscriber receives readings of its device as they are ingested.
+    - Browsers can pass the token as the subprotocols `bearer, <token>`; the `bearer` subprotocol is accepted.
+    - Subscribing to a device of another user is refused, and tokens in the query string are not accepted.
+    """
+    create_user(client, "w1", "w1@e.com", "pw")
+    h = auth_header(client, "w1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+    reading = {"reading_type": "temp", "value": 21.5, "timestamp": "2025-07-01T00:00:00+00:00"}
+
+    with client.websocket_connect(f"/devices/data/ws?device_ids={dev['id']}", headers=h) as ws:
+        assert client.post("/devices/data", json=reading, headers={"Authorization": f"Bearer {tok}"}).status_code == 200
+        message = ws.receive_json()
+    assert message["device_id"] == dev["id"]
+    assert message["value"] == 21.5
+
+    own = h["Authorization"].split()[1]
+    with client.websocket_connect(f"/devices/data/ws?device_ids={dev['id']}", subprotocols=["bearer", own]) as ws:
+        assert ws.accepted_subprotocol == "bearer"
+        assert client.post("/devices/data", json=reading, headers={"Authorization": f"Bearer {tok}"}).status_code == 200
+        assert ws.receive_json()["device_id"] == dev["id"]
+
+    create_user(client, "w2", "w2@e.com", "pw")
+    other = auth_header(client, "w2", "pw")["Authorization"].split()[1]
+    for kwargs in ({"subprotocols": ["bearer", other]}, {}):
+        with pytest.raises(WebSocketDisconnect) as e:
+            url = f"/devices/data/ws?device_ids={dev['id']}" + ("" if kwargs else f"&token={own}")
+            with client.websocket_connect(url, **kwargs) as ws:
+                ws.receive_text()
+        assert e.value.code == 1008
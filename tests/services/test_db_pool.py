@@ -0,0 +1,29 @@
+def test_request_sessions_release_connections_between_queries(client, create_user, auth_header, get_metrics):
+    """
+    - A request session returns its connection to the pool after a SELECT.
+    - Pending writes keep the transaction (and connection) until commit.
+    - /metrics reports pool checkouts and checkout waits.
+    """
+    from sqlalchemy import select
+    from app.db.session import engine, request_session
+    from app.models.user import User
+
+    async def scenario():
+        async with request_session() as db:
+            await db.execute(select(User.id).limit(1))
+            released = not db.in_transaction() and engine.pool.checkedout() == 0
+
+            user = User(username="q1", email="q1@e.com", hashed_password="-")
+            db.add(user)
+            await db.execute(select(User.id).where(User.username == "q1"))
+            pending = db.in_transaction() and engine.pool.checkedout() == 1
+            await db.rollback()
+            return released, pending
+
+    assert client.portal.call(scenario) == (True, True)
+
+    create_user(client, "q2", "q2@e.com", "pw")
+    assert client.get("/user", headers=auth_header(client, "q2", "pw")).status_code == 200
+    pool = get_metrics(client)["db_pool"]
+    assert pool["checkouts"] > 0 and pool["wait_ms"]["count"] == pool["checkouts"] + pool["timeouts"]
+    assert pool["checked_out"] == 0
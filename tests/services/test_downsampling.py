@@ -0,0 +1,23 @@
+import numpy as np
+
+
+def test_lttb_keeps_endpoints_and_extremes(app_instance):
+    """
+    - The first and last points are always selected, in ascending order.
+    - Isolated peaks survive downsampling.
+    - Series shorter than the threshold are returned whole.
+    """
+    from app.services.downsampling import lttb
+
+    x = np.arange(10000, dtype=np.float64)
+    y = np.sin(x / 500)
+    y[4321] = 10.0
+    y[7777] = -10.0
+
+    selected = lttb(x, y, 100)
+    assert len(selected) == 100
+    assert selected[0] == 0 and selected[-1] == 9999
+    assert np.all(np.diff(selected) > 0)
+    assert {4321, 7777} <= set(selected.tolist())
+
+    assert lttb(x[:50], y[:50], 100).tolist() == list(range(50))
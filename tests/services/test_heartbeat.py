@@ -0,0 +1,25 @@
+import asyncio
+
+
+def test_flush_keeps_running_and_retries_after_any_error(app_instance, monkeypatch):
+    """
+    - A flush error that is not an SQLAlchemyError (e.g. the database is unreachable) is logged.
+    - The pending devices are kept for the next flush and the periodic task keeps running.
+    """
+    import app.services.heartbeat as heartbeat
+
+    def unreachable():
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(heartbeat, "db_session_context", unreachable)
+
+    async def scenario():
+        tracker = heartbeat.HeartbeatTracker(flush_interval=0.01)
+        tracker.touch(1)
+        await tracker.start()
+        await asyncio.sleep(0.1)
+        running = not tracker._task.done()
+        await tracker.stop()
+        return running, tracker.flush_failures >= 2, tracker.stats()["pending_updates"]
+
+    assert asyncio.run(scenario()) == (True, True, 1)
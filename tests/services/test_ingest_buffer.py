@@ -0,0 +1,57 @@
+import asyncio
+
+
+def test_flush_fails_waiting_submitters_when_the_write_errors(app_instance):
+    """
+    - A write error that is not an SQLAlchemyError (e.g. the database is unreachable)
+      is raised to every waiting submitter instead of leaving them hanging.
+    - The rows are counted as failed.
+    """
+    from app.services.ingest_buffer import IngestBuffer
+
+    async def scenario():
+        buffer = IngestBuffer(max_rows=2, max_age_ms=10)
+
+        async def unreachable(rows):
+            raise OSError("connection refused")
+
+        buffer._write = unreachable
+        await buffer.start()
+        results = await asyncio.wait_for(asyncio.gather(
+            buffer.submit([{"value": 1.0}]), buffer.submit([{"value": 2.0}]), return_exceptions=True,
+        ), timeout=5)
+        await buffer.stop()
+        return [type(result) for result in results], buffer.rows_failed, buffer.depth
+
+    assert asyncio.run(scenario()) == ([OSError, OSError], 2, 0)
+
+
+def test_flush_retries_entries_only_for_errors_caused_by_rows(app_instance):
+    """
+    - A bad row (IntegrityError) fails only its own entry: the others are written one by one.
+    - A lost connection (OperationalError) fails the whole group at once, without per-entry retries.
+    """
+    from sqlalchemy.exc import IntegrityError, OperationalError
+    from app.services.ingest_buffer import IngestBuffer
+
+    async def scenario(error):
+        buffer = IngestBuffer(max_rows=3, max_age_ms=10)
+        writes = []
+
+        async def write(rows):
+            writes.append(len(rows))
+            if len(rows) > 1 or rows[0]["value"] == 2.0:
+                raise error
+
+        buffer._write = write
+        await buffer.start()
+        results = await asyncio.wait_for(asyncio.gather(
+            *(buffer.submit([{"value": float(i)}]) for i in range(3)), return_exceptions=True,
+        ), timeout=5)
+        await buffer.stop()
+        return [type(result).__name__ for result in results], writes, buffer.rows_failed
+
+    bad_row = IntegrityError("INSERT", {}, Exception("duplicate"))
+    assert asyncio.run(scenario(bad_row)) == (["NoneType", "NoneType", "IntegrityError"], [3, 1, 1, 1], 1)
+    gone = OperationalError("INSERT", {}, Exception("connection lost"))
+    assert asyncio.run(scenario(gone)) == (["OperationalError"] * 3, [3], 3)
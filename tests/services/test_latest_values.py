@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+
+def test_ring_buffer_overwrites_oldest_and_orders_late_readings(app_instance):
+    """
+    - Appends past the buffer size evict the oldest readings.
+    - A late reading is inserted at its sorted position, or dropped if older than every kept one.
+    - Duplicates are ignored.
+    """
+    from app.services.latest_values import RingBuffer
+
+    buffer = RingBuffer(3)
+    for i in range(5):
+        assert buffer.append(i * 10, i, float(i)) is (i >= 3)
+    assert [row_id for _, row_id, _ in buffer.newest(10)] == [4, 3, 2]
+
+    assert buffer.append(35, 9, 9.0) is True
+    assert [row_id for _, row_id, _ in buffer.newest(10)] == [4, 9, 3]
+    assert buffer.append(5, 10, 0.0) is True
+    assert [row_id for _, row_id, _ in buffer.newest(10)] == [4, 9, 3]
+
+    assert buffer.append(40, 4, 4.0) is False
+    assert buffer.append(35, 9, 9.0) is False
+    assert len(buffer) == 3
+
+
+def test_last_is_served_from_memory_after_first_load(client, create_user, auth_header):
+    """
+    - The first /data/last call loads the device from the database, later calls are cache hits.
+    - Newly ingested readings of several types show up without another load.
+    - The cursor of a cached page continues correctly into database pages.
+    """
+    from app.services.latest_values import latest_values
+
+    create_user(client, "l1", "l1@e.com", "pw")
+    h = auth_header(client, "l1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+    device_headers = {"Authorization": f"Bearer {tok}"}
+
+    base = datetime(2025, 7, 1, tzinfo=timezone.utc)
+    batch = [{"reading_type": "temp", "value": float(i), "timestamp": (base + timedelta(seconds=i)).isoformat()}
+             for i in range(4)]
+    assert client.post("/devices/data/batch", json=batch, headers=device_headers).json()["accepted"] == 4
+
+    misses = latest_values.misses
+    r = client.get(f"/devices/{dev['id']}/data/last", params={"limit": 2}, headers=h)
+    assert [p["value"] for p in r.json()] == [3.0, 2.0]
+    assert latest_values.misses == misses + 1
+
+    hits = latest_values.hits
+    reading = {"reading_type": "hum", "value": 50.0, "timestamp": (base + timedelta(seconds=10)).isoformat()}
+    assert client.post("/devices/data", json=reading, headers=device_headers).status_code == 200
+    r = client.get(f"/devices/{dev['id']}/data/last", params={"limit": 2}, headers=h)
+    assert [(p["reading_type"], p["value"]) for p in r.json()] == [("hum", 50.0), ("temp", 3.0)]
+    assert latest_values.hits == hits + 1
+    assert latest_values.misses == misses + 1
+
+    r = client.get(f"/devices/{dev['id']}/data/last", params={"limit": 2, "cursor": r.headers["X-Next-Cursor"]}, headers=h)
+    assert [p["value"] for p in r.json()] == [2.0, 1.0]
+
+
+def test_cached_devices_are_reloaded_after_the_ttl(client, create_user, auth_header, monkeypatch):
+    """
+    - Readings written without the ingestion buffer (e.g. by the bulk_load CLI) are not in the cache.
+    - Once the TTL has passed the device is reloaded and they show up.
+    """
+    import time
+    from app.db.session import db_session_context
+    from app.services.device_data_service import DeviceDataService
+    from app.services.latest_values import latest_values
+
+    create_user(client, "l2", "l2@e.com", "pw")
+    h = auth_header(client, "l2", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    url = f"/devices/{dev['id']}/data/last"
+    base = datetime(2025, 7, 2, tzinfo=timezone.utc)
+
+    async def backfill():
+        async with db_session_context() as db:
+            await DeviceDataService.insert_rows(db, [{"device_id": dev["id"], "reading_type": "temp",
+                                                      "value": 1.0, "timestamp": base}])
+
+    monkeypatch.setattr(latest_values, "ttl", 0.2)
+    assert client.get(url, headers=h).json() == []
+    client.portal.call(backfill)
+    assert client.get(url, headers=h).json() == []
+
+    expired = latest_values.expired
+    time.sleep(0.3)
+    assert [p["value"] for p in client.get(url, headers=h).json()] == [1.0]
+    assert latest_values.expired == expired + 1
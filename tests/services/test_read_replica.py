@@ -0,0 +1,37 @@
+def test_reads_use_replica_within_lag_tolerance(client, create_user, auth_header, monkeypatch):
+    """
+    - With a usable replica, device data GET routes read from it and do not fill the device registry.
+    - A replica lagging more than the tolerance, or failing, is bypassed in favour of the primary.
+    """
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    import app.db.session as session
+    from app.db.replica import ReplicaMonitor
+    from app.services.device_registry import device_registry
+
+    # The test database doubles as its own replica
+    monitor = ReplicaMonitor(session.engine, max_lag_seconds=5, interval=0)
+    monkeypatch.setattr(session, "replica_monitor", monitor)
+    monkeypatch.setattr(session, "read_session", async_sessionmaker(
+        bind=session.engine, expire_on_commit=False, class_=session.QueryScopedSession, info={"replica": True}))
+
+    create_user(client, "rr1", "rr1@e.com", "pw")
+    h = auth_header(client, "rr1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    params = {"start": "2025-01-01T00:00:00Z", "end": "2025-01-02T00:00:00Z"}
+
+    assert client.portal.call(monitor.check) is True and monitor.lag_seconds == 0
+    device_registry.invalidate(dev["id"])
+    assert client.get(f"/devices/{dev['id']}/data/range", params=params, headers=h).status_code == 200
+    assert client.get("/device", headers=h).json()[0]["id"] == dev["id"]
+    assert (monitor.replica_reads, monitor.primary_fallbacks) == (2, 0)
+    assert device_registry.get_cached(dev["id"]) is None
+
+    monitor.max_lag = -1
+    assert client.portal.call(monitor.check) is False
+    assert client.get(f"/devices/{dev['id']}/data/range", params=params, headers=h).status_code == 200
+    assert (monitor.replica_reads, monitor.primary_fallbacks) == (2, 1)
+
+    monitor.max_lag = 5
+    assert client.portal.call(monitor.check) is True
+    monitor.mark_failed(ConnectionError("replica down"))
+    assert not monitor.usable and monitor.failures == 1
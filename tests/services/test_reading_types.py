@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+
+
+def test_reading_types_are_interned(client, create_user, auth_header):
+    """
+    - Ingested reading type names are stored once in the lookup table and referenced by ID.
+    - Reads resolve IDs back to names, also with a cold cache.
+    """
+    from sqlalchemy import func, select
+    from app.db.session import db_session_context
+    from app.models.device_data import DeviceData, ReadingType
+    from app.services.reading_types import reading_types
+
+    create_user(client, "t1", "t1@e.com", "pw")
+    h = auth_header(client, "t1", "pw")
+    dev = client.post("/device", json={"name": "s", "device_type": "t"}, headers=h).json()
+    tok = client.post("/device/token", data={"device_id": dev["id"], "device_key": dev["device_key"]}).json()["access_token"]
+
+    base = datetime(2025, 10, 1, tzinfo=timezone.utc)
+    batch = [{"reading_type": "co2" if i % 2 else "pm25", "value": float(i), "timestamp": (base + timedelta(seconds=i)).isoformat()}
+             for i in range(6)]
+    assert client.post("/devices/data/batch", json=batch, headers={"Authorization": f"Bearer {tok}"}).json()["accepted"] == 6
+
+    async def stored():
+        async with db_session_context() as db:
+            names = (await db.execute(select(ReadingType.name).where(ReadingType.name.in_(["co2", "pm25"])))).scalars().all()
+            type_ids = (await db.execute(
+                select(DeviceData.reading_type_id, func.count()).where(DeviceData.device_id == dev["id"])
+                .group_by(DeviceData.reading_type_id)
+            )).all()
+            return sorted(names), sorted(count for _, count in type_ids)
+
+    assert client.portal.call(stored) == (["co2", "pm25"], [3, 3])
+
+    reading_types.clear()
+    params = {"start": base.isoformat(), "end": (base + timedelta(minutes=1)).isoformat()}
+    r = client.get(f"/devices/{dev['id']}/data/range", params=params, headers=h)
+    assert [p["reading_type"] for p in r.json()] == ["pm25", "co2"] * 3